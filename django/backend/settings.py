@@ -40,9 +40,11 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django_q',
     'elo',
     'unfindables',
     'supa',
+    'webhooks',
 ]
 
 MIDDLEWARE = [
@@ -163,6 +165,15 @@ LOGGING = {
 # Redis settings
 REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
 
+# Shared by all processes (web, Django Q workers, the listener), so that e.g. retargeted webhooks are seen everywhere at once
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'machina',
+    }
+}
+
 # Django Q2 settings
 Q_CLUSTER = {
     'name': 'machina',
@@ -179,3 +190,6 @@ Q_CLUSTER = {
         'db': 0,
     }
 }
+
+# Where handlers of received webhook events run (see `supa.events.get_event_executor`): 'sharded', 'threads' or 'django_q'
+SUPA_EVENT_EXECUTOR = os.environ.get('SUPA_EVENT_EXECUTOR', 'sharded')
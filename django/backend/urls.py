@@ -15,10 +15,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
+from elo.views import predict
 from unfindables.views import supabase_webhook, test_webhook
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/webhooks/supabase', supabase_webhook, name='supabase_webhook'),
     path('api/webhooks/test', test_webhook, name='test_webhook'),
+    path('api/elo/predict', predict, name='elo_predict'),
 ]
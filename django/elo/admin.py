@@ -1,3 +1,20 @@
+from typing import cast
+
 from django.contrib import admin
+from django.http import HttpRequest
+
+from elo.models import GameQuerySet, TestGame
+
+
+class GameAdmin(admin.ModelAdmin): # pyright: ignore[reportMissingTypeArgument]
+    """
+    Admin for game models, loading each page's players along with the games.
+    """
+    list_display = [ '__str__', 'winner', 'finished', 'processed', 'quarantined', 'created' ]
+    list_filter = [ 'finished', 'processed', 'quarantined' ]
+    list_select_related = [ 'winner' ]
+
+    def get_queryset(self, request: HttpRequest):
+        return cast(GameQuerySet, super().get_queryset(request)).with_players()
 
-# Register your models here.
+admin.site.register(TestGame, GameAdmin)
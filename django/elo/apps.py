@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class EloConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'elo'
+
+    def ready(self):
+        from . import leaderboard, matchmaking, queue # pyright: ignore[reportUnusedImport] (connects signal receivers)
@@ -0,0 +1,202 @@
+import random
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import accumulate
+from time import perf_counter
+from typing import Any, Callable, Iterable, Literal, Sequence, TypeVar
+
+from elo.methods import calculate_deltas, calculate_deltas_vectorized, update_elos_after_game
+from elo.models import TestGame, TestPlayer
+
+from django.db import close_old_connections, connection, transaction
+
+T = TypeVar('T')
+
+BenchmarkPath = Literal['memory', 'numpy', 'batch', 'single']
+BULK_BATCH_SIZE = 10_000
+
+
+@dataclass
+class SyntheticGame:
+    player_indices: list[int]
+    winner: int | None
+
+@dataclass
+class BenchmarkResult:
+    path: BenchmarkPath
+    games: int
+    players: int
+    players_per_game: int
+    activity_skew: float
+    seconds: float
+    games_per_second: float
+    queries_per_game: float | None
+    peak_memory_bytes: int | None
+
+
+def generate_games(
+    player_count: int,
+    game_count: int,
+    rng: random.Random,
+    players_per_game = 2,
+    activity_skew = 0.0,
+    draw_rate = 0.0,
+):
+    """
+    Generates a stream of games between `player_count` players. With a positive `activity_skew`,
+    player `i` is picked with a weight of `1 / (i + 1) ** activity_skew`, so a few players play most games.
+    """
+    cumulative_weights = list(accumulate(1 / (i + 1) ** activity_skew for i in range(player_count)))
+    population = range(player_count)
+    games: list[SyntheticGame] = []
+    for _ in range(game_count):
+        line_up: set[int] = set()
+        while len(line_up) < players_per_game:
+            line_up.update(rng.choices(population, cum_weights=cumulative_weights, k=players_per_game - len(line_up)))
+        player_indices = sorted(line_up)
+        games.append(SyntheticGame(
+            player_indices,
+            None if rng.random() < draw_rate else rng.choice(player_indices),
+        ))
+    return games
+
+def create_games_from_stream(player_count: int, stream: Iterable[SyntheticGame]):
+    """
+    Saves `player_count` players and the given games (finished, unprocessed) to the database.
+    Returns the players and the games in creation order.
+    """
+    players = TestPlayer.objects.bulk_create(
+        (TestPlayer(name=f'Synthetic player {i}') for i in range(player_count)), batch_size=BULK_BATCH_SIZE
+    )
+    stream = list(stream)
+    games = TestGame.objects.bulk_create(
+        (
+            TestGame(winner=None if game.winner is None else players[game.winner], finished=True)
+            for game in stream
+        ),
+        batch_size=BULK_BATCH_SIZE
+    )
+    TestGame.between.through.objects.bulk_create(
+        (
+            TestGame.between.through(testgame_id=game.pk, testplayer_id=players[player_index].pk)
+            for game, synthetic_game in zip(games, stream)
+            for player_index in synthetic_game.player_indices
+        ),
+        batch_size=BULK_BATCH_SIZE
+    )
+    return players, games
+
+def create_synthetic_games(player_count: int, game_count: int, rng: random.Random):
+    """
+    Creates `player_count` players and `game_count` unprocessed two-player games between random pairs
+    of them, each with a random winner. Returns the players and the games in creation order.
+    """
+    return create_games_from_stream(player_count, generate_games(player_count, game_count, rng))
+
+def replay_in_memory(
+    player_count: int,
+    stream: Iterable[SyntheticGame],
+    calculate: Callable[[list[TestPlayer], TestPlayer | None], Iterable[tuple[TestPlayer, float]]] = calculate_deltas,
+):
+    players = [ TestPlayer(pk=i + 1, elo=TestPlayer.DEFAULT_ELO) for i in range(player_count) ]
+    for game in stream:
+        line_up = [ players[i] for i in game.player_indices ]
+        winner = None if game.winner is None else players[game.winner]
+        for player, delta in calculate(line_up, winner):
+            player.elo += delta
+    return players
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute: Callable[..., Any], sql: str, params: Any, many: bool, context: Any):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+def run_benchmark(
+    path: BenchmarkPath,
+    player_count: int,
+    stream: list[SyntheticGame],
+    activity_skew: float,
+    trace_memory = False,
+):
+    """
+    Runs one benchmark. Database paths create their data inside a transaction that is rolled back afterwards;
+    only the rating computation itself is timed. Tracing memory slows everything down, so games/sec
+    measured with `trace_memory` are not comparable with those measured without.
+    """
+    counter: QueryCounter | None = None
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        if path in ('memory', 'numpy'):
+            start = perf_counter()
+            replay_in_memory(
+                player_count, stream, calculate_deltas if path == 'memory' else calculate_deltas_vectorized
+            )
+            seconds = perf_counter() - start
+        else:
+            with transaction.atomic():
+                _, games = create_games_from_stream(player_count, stream)
+                counter = QueryCounter()
+                if trace_memory:
+                    tracemalloc.reset_peak()
+                start = perf_counter()
+                with connection.execute_wrapper(counter):
+                    if path == 'batch':
+                        TestGame.process_pending_games(TestGame.objects.filter(pk__gte=games[0].pk))
+                    else:
+                        for game in games:
+                            update_elos_after_game(game)
+                seconds = perf_counter() - start
+                transaction.set_rollback(True)
+        peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return BenchmarkResult(
+        path=path,
+        games=len(stream),
+        players=player_count,
+        players_per_game=max(len(game.player_indices) for game in stream),
+        activity_skew=activity_skew,
+        seconds=seconds,
+        games_per_second=len(stream) / seconds,
+        queries_per_game=counter.count / len(stream) if counter else None,
+        peak_memory_bytes=peak_memory,
+    )
+
+def run_in_threads(items: Sequence[T], workers: int, process: Callable[[T], object]):
+    """
+    Splits `items` round-robin between `workers` threads, each with its own database connection,
+    and processes them. Re-raises the first exception raised by any worker.
+    """
+    def work(shard: int):
+        try:
+            for item in items[shard::workers]:
+                process(item)
+        finally:
+            close_old_connections()
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [ executor.submit(work, shard) for shard in range(workers) ]:
+            future.result()
+
+def find_lost_updates(players: Sequence[TestPlayer]):
+    """
+    Returns the ids of players whose recorded rating history is not a continuous chain, i.e. where some
+    update started from a rating other than the one the previous update left behind.
+    """
+    broken: list[int] = []
+    for player in players:
+        changes = list(TestGame.RatingChangeModel.objects.filter(player=player).order_by('pk'))
+        if any(
+            previous.elo_after != change.elo_before
+            for previous, change in zip(changes, changes[1:])
+        ):
+            broken.append(player.pk)
+    return broken
@@ -0,0 +1,140 @@
+from dataclasses import dataclass, field
+from typing import Any, Generic, Iterable, cast
+
+import redis
+
+from elo.models import PlayerBase, TPlayer
+from elo.signals import ratings_updated
+from utils.collections import empty_list
+from utils.redis import get_client
+
+from django.dispatch import receiver
+
+
+@dataclass
+class LeaderboardEntry:
+    rank: int
+    player_id: int
+    elo: float
+
+@dataclass
+class LeaderboardDiscrepancies:
+    missing: list[int] = field(default_factory=lambda: empty_list(int))
+    stale: list[int] = field(default_factory=lambda: empty_list(int))
+    extra: list[int] = field(default_factory=lambda: empty_list(int))
+
+    def __bool__(self):
+        return bool(self.missing or self.stale or self.extra)
+
+
+class Leaderboard(Generic[TPlayer]):
+    """
+    Redis sorted set mirroring `elo` for all players of a `PlayerBase` subclass, kept in sync from the rating
+    update path for models with `LEADERBOARD = True`. Ranks are 1-based, highest rating first.
+    """
+
+    REBUILD_CHUNK_SIZE = 10_000
+
+    def __init__(self, PlayerModel: type[TPlayer], client: 'redis.Redis | None' = None):
+        self.PlayerModel = PlayerModel
+        self.client = client or get_client()
+        self.key = f'leaderboard:{PlayerModel._meta.label_lower}'
+
+    def sync(self, players: Iterable[TPlayer]):
+        mapping = { str(player.pk): player.elo for player in players }
+        if mapping:
+            self.client.zadd(self.key, mapping)
+
+    def remove(self, player_ids: Iterable[int]):
+        player_ids = list(player_ids)
+        if player_ids:
+            self.client.zrem(self.key, *player_ids)
+
+    def size(self):
+        return self.client.zcard(self.key)
+
+    def top(self, count: int):
+        return self.entries(0, count - 1)
+
+    def rank(self, player_id: int):
+        rank = cast(int | None, self.client.zrevrank(self.key, player_id))
+        return None if rank is None else rank + 1
+
+    def percentile(self, player_id: int):
+        """
+        Share of players rated strictly below the given one, in percent.
+        """
+        rank = self.rank(player_id)
+        if rank is None:
+            return None
+        return 100.0 * (self.size() - rank) / self.size()
+
+    def around(self, player_id: int, radius: int):
+        rank = self.rank(player_id)
+        if rank is None:
+            return []
+        start = max(rank - 1 - radius, 0)
+        return self.entries(start, rank - 1 + radius)
+
+    def entries(self, start: int, end: int):
+        return [
+            LeaderboardEntry(rank=start + offset + 1, player_id=int(member), elo=score)
+            for offset, (member, score) in enumerate(cast(
+                list[tuple[bytes, float]],
+                self.client.zrevrange(self.key, start, end, withscores=True)
+            ))
+        ]
+
+    def rebuild(self):
+        """
+        Rebuilds the sorted set from the database under a temporary key and atomically swaps it in.
+        Returns the number of players mirrored.
+        """
+        temporary_key = f'{self.key}:rebuild'
+        self.client.delete(temporary_key)
+        count = 0
+        mapping: dict[str, float] = {}
+        for player_id, elo in self.PlayerModel._default_manager.values_list('pk', 'elo').iterator(
+            chunk_size=self.REBUILD_CHUNK_SIZE
+        ):
+            mapping[str(player_id)] = elo
+            if len(mapping) == self.REBUILD_CHUNK_SIZE:
+                self.client.zadd(temporary_key, mapping)
+                count += len(mapping)
+                mapping = {}
+        if mapping:
+            self.client.zadd(temporary_key, mapping)
+            count += len(mapping)
+        if count:
+            self.client.rename(temporary_key, self.key)
+        else:
+            self.client.delete(self.key)
+        return count
+
+    def check(self):
+        """
+        Compares the sorted set with the database, returning the ids of players missing from the set,
+        mirrored with an outdated rating, or mirrored but no longer in the database.
+        """
+        mirrored = {
+            int(member): score
+            for member, score in cast(
+                list[tuple[bytes, float]],
+                self.client.zrange(self.key, 0, -1, withscores=True)
+            )
+        }
+        discrepancies = LeaderboardDiscrepancies()
+        for player_id, elo in self.PlayerModel._default_manager.values_list('pk', 'elo').iterator(
+            chunk_size=self.REBUILD_CHUNK_SIZE
+        ):
+            if player_id not in mirrored:
+                discrepancies.missing.append(player_id)
+            elif mirrored.pop(player_id) != elo:
+                discrepancies.stale.append(player_id)
+        discrepancies.extra = sorted(mirrored)
+        return discrepancies
+
+@receiver(ratings_updated)
+def sync_leaderboard(sender: type[PlayerBase], players: list[PlayerBase], **kwargs: Any):
+    if sender.LEADERBOARD:
+        Leaderboard(sender).sync(players)
@@ -0,0 +1,41 @@
+import random
+from time import perf_counter
+from typing import Any
+
+from elo.benchmarks import create_synthetic_games, find_lost_updates, run_in_threads
+from elo.methods import update_elos_after_game
+from elo.models import TestGame, TestPlayer
+
+from django.core.management.base import BaseCommand, CommandParser
+
+
+class Command(BaseCommand):
+    help = (
+        'Processes synthetic games sharing a small pool of players with several concurrent workers '
+        'and reports throughput and lost updates'
+    )
+
+    def add_arguments(self, parser: CommandParser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 8])
+        parser.add_argument('--players', type=int, default=50)
+        parser.add_argument('--games', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args: Any, **options: Any):
+        for workers in options['workers']:
+            players, games = create_synthetic_games(
+                options['players'], options['games'], random.Random(options['seed'])
+            )
+            try:
+                start = perf_counter()
+                run_in_threads(games, workers, update_elos_after_game)
+                elapsed = perf_counter() - start
+                lost = find_lost_updates(players)
+                self.stdout.write(
+                    f'{workers} worker(s): {len(games)} games in {elapsed:.2f}s '
+                    f'({len(games) / elapsed:,.0f} games/s), '
+                    f'{len(lost)} player(s) with lost updates'
+                )
+            finally:
+                TestGame.objects.filter(pk__in=[game.pk for game in games]).delete()
+                TestPlayer.objects.filter(pk__in=[player.pk for player in players]).delete()
@@ -0,0 +1,52 @@
+import random
+from time import perf_counter
+from typing import Any
+
+from elo.matchmaking import MatchmakingIndex
+from elo.models import TestPlayer
+
+from django.core.management.base import BaseCommand, CommandParser
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the in-memory matchmaking index with a synthetic queue of players'
+
+    def add_arguments(self, parser: CommandParser):
+        parser.add_argument('--players', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=10_000)
+        parser.add_argument('--opponents', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args: Any, **options: Any):
+        rng = random.Random(options['seed'])
+        player_count: int = options['players']
+        query_count: int = options['queries']
+        index = MatchmakingIndex(TestPlayer)
+        ratings = [ rng.gauss(TestPlayer.DEFAULT_ELO, 300) for _ in range(player_count) ]
+
+        def measure(label: str, count: int, operation: Any):
+            start = perf_counter()
+            operation()
+            elapsed = perf_counter() - start
+            self.stdout.write(f'{label}: {count} in {elapsed:.3f}s ({count / elapsed:,.0f}/s)')
+
+        def queue_all():
+            for player_id, elo in enumerate(ratings):
+                index.add(player_id, elo)
+
+        def find_opponents():
+            for player_id in rng.sample(range(player_count), query_count):
+                index.best_opponents(player_id, options['opponents'])
+
+        def update_ratings():
+            for player_id in rng.sample(range(player_count), query_count):
+                index.update(player_id, ratings[player_id] + rng.uniform(-32, 32))
+
+        def dequeue():
+            for player_id in rng.sample(range(player_count), query_count):
+                index.remove(player_id)
+
+        measure('queue', player_count, queue_all)
+        measure('best opponents', query_count, find_opponents)
+        measure('rating updates', query_count, update_ratings)
+        measure('dequeue', query_count, dequeue)
@@ -0,0 +1,64 @@
+import json
+import platform
+import random
+from dataclasses import asdict
+from itertools import product
+from typing import Any
+
+from elo.benchmarks import BenchmarkResult, generate_games, run_benchmark
+from utils.collections import empty_list
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks rating computation on synthetic game streams, in memory and through the database, '
+        'and optionally writes the results as JSON for comparison between runs'
+    )
+
+    def add_arguments(self, parser: CommandParser):
+        parser.add_argument('--games', type=int, nargs='+', default=[1_000, 10_000])
+        parser.add_argument('--players', type=int, default=1_000)
+        parser.add_argument('--players-per-game', type=int, nargs='+', default=[2, 4])
+        parser.add_argument('--activity-skew', type=float, nargs='+', default=[0.0, 1.1])
+        parser.add_argument('--draw-rate', type=float, default=0.1)
+        parser.add_argument('--paths', nargs='+', default=['memory', 'numpy', 'batch', 'single'],
+            choices=['memory', 'numpy', 'batch', 'single'])
+        parser.add_argument('--trace-memory', action='store_true',
+            help='Measure peak Python memory (slows down all paths)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Path of the JSON file to write the results to')
+
+    def handle(self, *args: Any, **options: Any):
+        results = empty_list(BenchmarkResult)
+        for game_count, players_per_game, activity_skew in product(
+            options['games'], options['players_per_game'], options['activity_skew']
+        ):
+            stream = generate_games(
+                options['players'], game_count, random.Random(options['seed']),
+                players_per_game=players_per_game,
+                activity_skew=activity_skew,
+                draw_rate=options['draw_rate'],
+            )
+            for path in options['paths']:
+                result = run_benchmark(path, options['players'], stream, activity_skew, options['trace_memory'])
+                results.append(result)
+                self.stdout.write(
+                    f'{path:>6} | {game_count:>9} games | {players_per_game} players/game | skew {activity_skew:<4} | '
+                    f'{result.games_per_second:>12,.0f} games/s | '
+                    f'{"-" if result.queries_per_game is None else f"{result.queries_per_game:.2f}":>6} queries/game | '
+                    f'{"-" if result.peak_memory_bytes is None else f"{result.peak_memory_bytes / 2**20:.1f} MiB":>10} peak'
+                )
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({
+                    'created': timezone.now().isoformat(),
+                    'python': platform.python_version(),
+                    'options': { key: options[key] for key in (
+                        'games', 'players', 'players_per_game', 'activity_skew', 'draw_rate', 'paths', 'trace_memory', 'seed'
+                    ) },
+                    'results': [ asdict(result) for result in results ],
+                }, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} result(s) to {options["output"]}'))
@@ -0,0 +1,31 @@
+from typing import Any
+
+from elo.leaderboard import Leaderboard
+from elo.models import PlayerBase
+from utils.django import get_submodel
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+
+class Command(BaseCommand):
+    help = 'Compares the Redis leaderboard of a player model with the database'
+
+    def add_arguments(self, parser: CommandParser):
+        parser.add_argument('player_model', help='Player model label, e.g. elo.TestPlayer')
+        parser.add_argument('--fix', action='store_true', help='Rebuild the leaderboard if it is inconsistent')
+
+    def handle(self, *args: Any, **options: Any):
+        PlayerModel = get_submodel(options['player_model'], PlayerBase)
+        leaderboard = Leaderboard(PlayerModel)
+        discrepancies = leaderboard.check()
+        if not discrepancies:
+            self.stdout.write(self.style.SUCCESS(f'{leaderboard.key} is consistent'))
+            return
+        for kind in ('missing', 'stale', 'extra'):
+            player_ids: list[int] = getattr(discrepancies, kind)
+            if player_ids:
+                self.stdout.write(f'{kind}: {len(player_ids)} player(s), e.g. {player_ids[:10]}')
+        if not options['fix']:
+            raise CommandError(f'{leaderboard.key} is inconsistent')
+        leaderboard.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {leaderboard.key}'))
@@ -0,0 +1,36 @@
+from typing import Any
+
+from django_q.brokers import get_broker # pyright: ignore[reportMissingTypeStubs]
+
+from elo.models import GameBase
+from elo.queue import drain_scheduled_key
+from utils.redis import get_client
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Shows pending games, processing lag and the Django Q backlog'
+
+    def handle(self, *args: Any, **options: Any):
+        now = timezone.now()
+        for Game in apps.get_models():
+            if not issubclass(Game, GameBase):
+                continue
+            game_model = Game._meta.label
+            backlog = Game._default_manager.filter(finished=True, processed=False).aggregate(
+                pending=Count('pk', filter=Q(quarantined=False)),
+                oldest=Min('created', filter=Q(quarantined=False)),
+                quarantined=Count('pk', filter=Q(quarantined=True)),
+            )
+            lag = now - backlog['oldest'] if backlog['oldest'] else None
+            self.stdout.write(
+                f'{game_model}: {backlog["pending"]} pending game(s), '
+                f'{backlog["quarantined"]} quarantined, '
+                f'lag {lag or "-"}, '
+                f'drain {"scheduled" if get_client().exists(drain_scheduled_key(game_model)) else "not scheduled"}'
+            )
+        self.stdout.write(f'Django Q: {get_broker().queue_size()} queued task(s)')
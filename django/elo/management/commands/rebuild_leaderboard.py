@@ -0,0 +1,19 @@
+from typing import Any
+
+from elo.leaderboard import Leaderboard
+from elo.models import PlayerBase
+from utils.django import get_submodel
+
+from django.core.management.base import BaseCommand, CommandParser
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the Redis leaderboard of a player model from the database'
+
+    def add_arguments(self, parser: CommandParser):
+        parser.add_argument('player_model', help='Player model label, e.g. elo.TestPlayer')
+
+    def handle(self, *args: Any, **options: Any):
+        PlayerModel = get_submodel(options['player_model'], PlayerBase)
+        count = Leaderboard(PlayerModel).rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Mirrored {count} {PlayerModel.__name__} rating(s)'))
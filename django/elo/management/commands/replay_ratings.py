@@ -0,0 +1,27 @@
+from time import perf_counter
+from typing import Any
+
+from elo.models import GameBase
+from elo.replay import replay_ratings
+from utils.django import get_submodel
+
+from django.core.management.base import BaseCommand, CommandParser
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes all ratings of a game model from scratch, replaying independent groups of players '
+        'in parallel worker processes'
+    )
+
+    def add_arguments(self, parser: CommandParser):
+        parser.add_argument('game_model', help='Game model label, e.g. elo.TestGame')
+        parser.add_argument('--workers', type=int, help='Number of worker processes (defaults to the CPU count)')
+
+    def handle(self, *args: Any, **options: Any):
+        Game = get_submodel(options['game_model'], GameBase)
+        start = perf_counter()
+        games, components = replay_ratings(Game, options['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Replayed {games} game(s) in {components} independent component(s) in {perf_counter() - start:.2f}s'
+        ))
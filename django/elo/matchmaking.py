@@ -0,0 +1,157 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from threading import Lock
+from time import monotonic
+from typing import Any, ClassVar, Generic
+
+from elo.models import PlayerBase, TPlayer
+from elo.signals import ratings_updated
+
+from django.dispatch import receiver
+
+
+@dataclass
+class Opponent:
+    player_id: int
+    elo: float
+    distance: float
+
+
+class MatchmakingIndex(Generic[TPlayer]):
+    """
+    In-memory index of queued players kept sorted by rating (then player id) in two parallel compact arrays,
+    so that lookups are O(log n) bisections and inserts/removals are a bisection plus a memmove.
+
+    Ratings of queued players follow rating updates committed in this process (see `update_queued_ratings`).
+    Those committed elsewhere (e.g. by Django Q workers processing games) are picked up by `refresh`, which
+    `best_opponents` runs first if the ratings were last read more than `max_staleness` seconds ago.
+    """
+
+    DEFAULT_WINDOW = 50.0
+    DEFAULT_MAX_WINDOW = 800.0
+    MAX_STALENESS = 1.0
+
+    indexes: ClassVar[dict[type[PlayerBase], 'MatchmakingIndex[Any]']] = {}
+
+    def __init__(self, PlayerModel: type[TPlayer], max_staleness: float | None = None):
+        self.PlayerModel = PlayerModel
+        self.max_staleness = max_staleness
+        self.refreshed = monotonic()
+        self.ratings = array('d')
+        self.player_ids = array('q')
+        self.queued: dict[int, float] = {}
+        self.lock = Lock()
+
+    @classmethod
+    def for_model(cls, PlayerModel: type[TPlayer]) -> 'MatchmakingIndex[TPlayer]':
+        """
+        The process-wide index for `PlayerModel`, refreshed from the database at most `MAX_STALENESS` seconds apart.
+        """
+        if PlayerModel not in cls.indexes:
+            cls.indexes[PlayerModel] = cls(PlayerModel, max_staleness=cls.MAX_STALENESS)
+        return cls.indexes[PlayerModel]
+
+    def __len__(self):
+        return len(self.player_ids)
+
+    def __contains__(self, player_id: int):
+        return player_id in self.queued
+
+    def queue(self, player: TPlayer):
+        self.add(player.pk, player.elo)
+
+    def add(self, player_id: int, elo: float):
+        with self.lock:
+            if player_id in self.queued:
+                self._remove(player_id)
+            self._insert(player_id, elo)
+
+    def remove(self, player_id: int):
+        with self.lock:
+            if player_id in self.queued:
+                self._remove(player_id)
+
+    def update(self, player_id: int, elo: float):
+        with self.lock:
+            if player_id in self.queued:
+                self._remove(player_id)
+                self._insert(player_id, elo)
+
+    def refresh(self):
+        """
+        Re-reads the stored ratings of all queued players, with one query.
+        """
+        with self.lock:
+            player_ids = list(self.queued)
+        self.refreshed = monotonic()
+        ratings = self.PlayerModel.objects.filter(pk__in=player_ids).values_list('pk', 'elo')
+        with self.lock:
+            for player_id, elo in ratings:
+                if self.queued.get(player_id, elo) != elo:
+                    self._remove(player_id)
+                    self._insert(player_id, elo)
+
+    def _bisect(self, player_id: int, elo: float):
+        """
+        Position of `(elo, player_id)`: a bisection for the run of equal ratings, then one by player id within it.
+        """
+        start = bisect_left(self.ratings, elo)
+        return bisect_left(self.player_ids, player_id, start, bisect_right(self.ratings, elo, start))
+
+    def _insert(self, player_id: int, elo: float):
+        position = self._bisect(player_id, elo)
+        self.ratings.insert(position, elo)
+        self.player_ids.insert(position, player_id)
+        self.queued[player_id] = elo
+
+    def _remove(self, player_id: int):
+        position = self._position(player_id)
+        del self.ratings[position]
+        del self.player_ids[position]
+        del self.queued[player_id]
+
+    def _position(self, player_id: int):
+        return self._bisect(player_id, self.queued[player_id])
+
+    def best_opponents(self, player_id: int, count: int,
+        window = DEFAULT_WINDOW,
+        max_window = DEFAULT_MAX_WINDOW,
+    ):
+        """
+        Returns up to `count` queued opponents closest in rating to the given queued player.
+        The rating window starts at `window` and doubles until enough opponents are found or
+        it reaches `max_window`; only opponents within the final window are returned, closest first.
+        """
+        if self.max_staleness is not None and monotonic() - self.refreshed > self.max_staleness:
+            self.refresh()
+        with self.lock:
+            elo = self.queued[player_id]
+            position = self._position(player_id)
+            below, above = position - 1, position + 1
+            opponents: list[Opponent] = []
+            while len(opponents) < count:
+                below_distance = elo - self.ratings[below] if below >= 0 else None
+                above_distance = self.ratings[above] - elo if above < len(self.ratings) else None
+                if below_distance is None and above_distance is None:
+                    break
+                if above_distance is None or (below_distance is not None and below_distance <= above_distance):
+                    index, distance = below, below_distance
+                    below -= 1
+                else:
+                    index, distance = above, above_distance
+                    above += 1
+                assert distance is not None
+                while distance > window and window < max_window:
+                    window = min(window * 2, max_window)
+                if distance > window:
+                    break
+                opponents.append(Opponent(int(self.player_ids[index]), self.ratings[index], distance))
+            return opponents
+
+@receiver(ratings_updated)
+def update_queued_ratings(sender: type[PlayerBase], players: list[PlayerBase], **kwargs: Any):
+    index = MatchmakingIndex.indexes.get(sender)
+    if index:
+        for player in players:
+            index.update(player.pk, player.elo)
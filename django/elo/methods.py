@@ -1,6 +1,17 @@
+from collections import defaultdict
+from typing import Any, cast
+
+import numpy as np
+import numpy.typing as npt
+
 from elo.models import GameBase, TPlayer
+from elo.signals import ratings_updated
+from utils.logging import warning
 
-from django.db import transaction
+from django.db import models, transaction
+
+FloatArray = npt.NDArray[np.float64]
+IntArray = npt.NDArray[np.int64]
 
 
 def get_win_probability(player: TPlayer, *all_players: TPlayer):
@@ -8,21 +19,196 @@ def get_win_probability(player: TPlayer, *all_players: TPlayer):
     # We don't actually expect there to be more than 2 players in a game, but it doesn't hurt to support more
     return 1.0 / ( 1.0 + 10 ** ((average_elo - player.elo) / type(player).DIVISOR) )
 
-def update_elos_after_game(game: GameBase[TPlayer]):
+def validate_game(game: GameBase[TPlayer], players: list[TPlayer], winner: TPlayer | None):
     if game.processed:
         raise ValueError(f'{game} is already processed')
-    winner = game.winner
-    players = list(game.between.all())
-    if winner and winner not in players:
-        raise ValueError(f'{winner=} for {game} is not among {players}')
-    if len(players) < 2:
-        raise ValueError(f'{game} has less than 2 players: {players}')
+    if not game.finished:
+        raise ValueError(f'{game} is not finished')
+    validate_line_up(game, [ player.pk for player in players ], None if winner is None else winner.pk)
+
+def validate_line_up(game: object, player_ids: list[int], winner_id: int | None):
+    """
+    Checks that `game` has at least 2 players and, unless it is a draw, is won by one of them.
+    """
+    if winner_id is not None and winner_id not in player_ids:
+        raise ValueError(f'winner {winner_id} of {game} is not among its players {player_ids}')
+    if len(player_ids) < 2:
+        raise ValueError(f'{game} has less than 2 players: {player_ids}')
+
+def find_winner(game: GameBase[TPlayer], players: list[TPlayer]) -> TPlayer | None:
+    for player in players:
+        if player.pk == game.winner_id:
+            return player
+    # Either a draw or a winner who didn't play, which `validate_game` rejects
+    return game.winner if game.winner_id is not None else None
+
+def rate_games(Game: type[GameBase[TPlayer]], games: list[tuple[GameBase[TPlayer], list[TPlayer], TPlayer | None]]):
+    """
+    Rates the games, in order, with the player model's rating system, updating the players in memory
+    (including decay accumulated since they last played).
+    Returns the (unsaved) rating changes to record.
+    """
+    updates = get_player_model(Game).rating_system().rate(
+        [ (players, winner) for _, players, winner in games ],
+        [ game.created for game, _, _ in games ],
+    )
+    return [
+        Game.RatingChangeModel(
+            game=games[index][0], player=player, elo_before=elo_before, elo_after=elo_after, created=games[index][0].created
+        )
+        for index, player, elo_before, elo_after in updates
+    ]
+
+def update_elos_after_game(game: GameBase[TPlayer]):
+    """
+    Processes a single game. The game row and then its players (in id order) are locked for the duration
+    of the transaction, and only the rating fields and `processed` are written, so games sharing players
+    can be processed concurrently by several workers without losing updates.
+    """
+    Game = type(game)
+    PlayerModel = get_player_model(Game)
+    reject_periodic(Game)
     with transaction.atomic():
-        for player, delta in calculate_deltas(players, winner):
-            player.elo += delta
-            player.save()
+        game.processed, game.finished = (
+            Game._default_manager.select_for_update().values_list('processed', 'finished').get(pk=game.pk)
+        )
+        players = list(game.between.select_for_update(of=('self',)).order_by('pk'))
+        winner = find_winner(game, players)
+        validate_game(game, players, winner)
+        changes = rate_games(Game, [ (game, players, winner) ])
+        PlayerModel._default_manager.bulk_update(players, PlayerModel.RATING_SYSTEM.fields)
         game.processed = True
-        game.save()
+        game.save(update_fields=['processed'])
+        Game.RatingChangeModel._default_manager.bulk_create(changes)
+        notify_ratings_updated(players)
+
+def process_pending_games(queryset: 'models.QuerySet[Any]', chunk_size: int | None = GameBase.PROCESSING_CHUNK_SIZE):
+    """
+    Processes all finished, unprocessed games in `queryset` in chronological order, one transaction per `chunk_size` games
+    (or a single one if `chunk_size` is None). Each chunk locks its games and players (in id order), loads them
+    in a few queries, rates them in memory and writes players and games back with `bulk_update`.
+    Games processed by someone else in the meantime are skipped, and invalid games (see `validate_game`) are
+    quarantined with a warning rather than rated later, out of order.
+
+    Returns the number of games processed.
+    """
+    if chunk_size is not None:
+        reject_periodic(queryset.model)
+    processed, _ = process_pending_chunks(queryset, chunk_size)
+    return processed
+
+def process_pending_chunks(queryset: 'models.QuerySet[Any]', chunk_size: int | None):
+    """
+    `process_pending_games`, also returning the ids of the players rated.
+    """
+    Game: type[GameBase[Any]] = queryset.model
+    pending = queryset.filter(finished=True, processed=False, quarantined=False)
+    if not pending.ordered:
+        pending = pending.order_by('created', 'pk')
+    game_ids = list(pending.values_list('pk', flat=True))
+    chunk_size = chunk_size or max(len(game_ids), 1)
+    processed = 0
+    rated_player_ids: set[int] = set()
+    for start in range(0, len(game_ids), chunk_size):
+        with transaction.atomic():
+            chunk_processed, chunk_player_ids = process_games_chunk(Game, game_ids[start:start + chunk_size])
+        processed += chunk_processed
+        rated_player_ids.update(chunk_player_ids)
+    return processed, rated_player_ids
+
+def process_rating_period(queryset: 'models.QuerySet[Any]'):
+    """
+    Processes all finished, unprocessed games in `queryset` in one transaction, which rating systems built around
+    rating periods (such as Glicko-2) rate as a single period. This is the only way to process their games.
+    Players who played none of the games are updated in bulk, see `RatingSystem.idle_updates`.
+    """
+    PlayerModel = get_player_model(queryset.model)
+    with transaction.atomic():
+        processed, rated_player_ids = process_pending_chunks(queryset, chunk_size=None)
+        if idle_updates := PlayerModel.rating_system().idle_updates():
+            PlayerModel._default_manager.exclude(pk__in=rated_player_ids).update(**idle_updates)
+    return processed
+
+def reject_periodic(Game: type[GameBase[Any]]):
+    RatingSystem = get_player_model(Game).RATING_SYSTEM
+    if RatingSystem.periodic:
+        raise ValueError(f'{Game.__name__} games are rated in periods ({RatingSystem.__name__}), use process_rating_period')
+
+def process_games_chunk(Game: type[GameBase[TPlayer]], game_ids: list[int]):
+    PlayerModel = get_player_model(Game)
+    games = {
+        game.pk: game
+        for game in (
+            Game._default_manager.select_for_update()
+            .filter(pk__in=game_ids, finished=True, processed=False, quarantined=False)
+            .order_by('pk')
+        )
+    }
+    participant_ids = load_participant_ids(Game, list(games))
+    player_ids = {
+        player_id
+        for game in games.values()
+        for player_id in [ *participant_ids[game.pk], game.winner_id ]
+        if player_id is not None
+    }
+    players = {
+        player.pk: player
+        for player in PlayerModel._default_manager.select_for_update().filter(pk__in=player_ids).order_by('pk')
+    }
+    touched_players: dict[int, TPlayer] = {}
+    rated_games: list[tuple[GameBase[TPlayer], list[TPlayer], TPlayer | None]] = []
+    quarantined_games: list[GameBase[TPlayer]] = []
+    for game_id in game_ids:
+        if game_id not in games:
+            continue
+        game = games[game_id]
+        game_players = [ players[player_id] for player_id in participant_ids[game_id] ]
+        winner = players[game.winner_id] if game.winner_id is not None else None
+        try:
+            validate_game(game, game_players, winner)
+        except ValueError as e:
+            warning(f'Quarantining invalid game: {e}')
+            game.quarantined = True
+            quarantined_games.append(game)
+            continue
+        rated_games.append((game, game_players, winner))
+        touched_players.update((player.pk, player) for player in game_players)
+        game.processed = True
+    changes = rate_games(Game, rated_games)
+    PlayerModel._default_manager.bulk_update(touched_players.values(), PlayerModel.RATING_SYSTEM.fields)
+    Game._default_manager.bulk_update([ game for game, _, _ in rated_games ], ['processed'])
+    Game._default_manager.bulk_update(quarantined_games, ['quarantined'])
+    Game.RatingChangeModel._default_manager.bulk_create(changes)
+    notify_ratings_updated(list(touched_players.values()))
+    return len(rated_games), touched_players.keys()
+
+def notify_ratings_updated(players: list[TPlayer]):
+    if players:
+        transaction.on_commit(
+            lambda: ratings_updated.send(sender=type(players[0]), players=players),
+            robust=True,
+        )
+
+def get_between_field(Game: type[GameBase[Any]]):
+    return cast('models.ManyToManyField[Any, Any]', Game._meta.get_field('between'))
+
+def get_player_model(Game: type[GameBase[TPlayer]]):
+    return cast(type[TPlayer], get_between_field(Game).related_model)
+
+def load_participant_ids(Game: type[GameBase[Any]], game_ids: list[int]):
+    between = get_between_field(Game)
+    relation = cast(models.ManyToManyRel, between.remote_field)
+    Through = cast(type[models.Model], relation.through)
+    game_column, player_column = between.m2m_column_name(), between.m2m_reverse_name()
+    participant_ids: defaultdict[int, list[int]] = defaultdict(list)
+    for game_id, player_id in (
+        Through._default_manager
+        .filter(**{f'{game_column}__in': game_ids})
+        .order_by(player_column)
+        .values_list(game_column, player_column)
+    ):
+        participant_ids[game_id].append(player_id)
+    return participant_ids
 
 def calculate_deltas(players: list[TPlayer], winner: TPlayer | None):
     k = type(players[0]).K_FACTOR
@@ -34,3 +220,50 @@ def calculate_deltas(players: list[TPlayer], winner: TPlayer | None):
             )
         for player in players
     }.items()
+
+
+def expected_scores(ratings: FloatArray, divisor: float) -> FloatArray:
+    average_opponent_ratings = (ratings.sum() - ratings) / (len(ratings) - 1)
+    return 1.0 / ( 1.0 + 10 ** ((average_opponent_ratings - ratings) / divisor) )
+
+def rating_deltas(ratings: FloatArray, winner_index: int | None, k: float, divisor: float) -> FloatArray:
+    scores = np.full(len(ratings), 0.5)
+    if winner_index is not None:
+        scores[:] = 0.0
+        scores[winner_index] = 1.0
+    return k * (scores - expected_scores(ratings, divisor))
+
+def calculate_deltas_vectorized(players: list[TPlayer], winner: TPlayer | None):
+    """
+    NumPy counterpart of `calculate_deltas`: one sum per game instead of one per player.
+    """
+    PlayerModel = type(players[0])
+    deltas = rating_deltas(
+        np.fromiter((player.elo for player in players), dtype=np.float64, count=len(players)),
+        players.index(winner) if winner else None,
+        PlayerModel.K_FACTOR,
+        PlayerModel.DIVISOR,
+    )
+    return dict(zip(players, deltas.tolist())).items()
+
+def calculate_batched_deltas(ratings: FloatArray, winner_indices: IntArray, k: float, divisor: float) -> FloatArray:
+    """
+    Calculates deltas for many independent games at once.
+
+    `ratings` has one row per game, padded with NaN for games with fewer players than the widest one;
+    `winner_indices` holds the winner's column for each game, or -1 for a draw.
+    Returns deltas in the same shape, with NaN in the padding.
+    """
+    present = ~np.isnan(ratings)
+    player_counts = present.sum(axis=1, keepdims=True)
+    totals = np.nansum(ratings, axis=1, keepdims=True)
+    average_opponent_ratings = (totals - ratings) / (player_counts - 1)
+    expected = 1.0 / ( 1.0 + 10 ** ((average_opponent_ratings - ratings) / divisor) )
+    columns = np.arange(ratings.shape[1])
+    winner_indices = winner_indices[:, np.newaxis]
+    scores = np.where(
+        winner_indices < 0,
+        0.5,
+        (columns == winner_indices).astype(np.float64),
+    )
+    return np.where(present, k * (scores - expected), np.nan)
@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-18 20:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestPlayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('elo', models.FloatField(default=1200.0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TestGame',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('processed', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('title', models.CharField(blank=True, max_length=255, null=True)),
+                ('between', models.ManyToManyField(related_name='games', to='elo.testplayer')),
+                ('winner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='games_won', to='elo.testplayer')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 20:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestGameRatingChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('elo_before', models.FloatField()),
+                ('elo_after', models.FloatField()),
+                ('created', models.DateTimeField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_changes', to='elo.testgame')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='elo.testplayer')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['player', 'created'], name='elo_testgam_player__0d788a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2 on 2026-10-18 20:13
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0002_testgameratingchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestGlicko2Player',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('elo', models.FloatField(default=1500.0)),
+                ('deviation', models.FloatField(default=350.0)),
+                ('volatility', models.FloatField(default=0.06)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TestGlicko2Game',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('processed', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('between', models.ManyToManyField(related_name='games', to='elo.testglicko2player')),
+                ('winner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='games_won', to='elo.testglicko2player')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TestGlicko2GameRatingChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('elo_before', models.FloatField()),
+                ('elo_after', models.FloatField()),
+                ('created', models.DateTimeField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_changes', to='elo.testglicko2game')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='elo.testglicko2player')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['player', 'created'], name='elo_testgli_player__bdd15e_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0003_testglicko2player_testglicko2game_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testglicko2player',
+            name='last_played',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='testplayer',
+            name='last_played',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 21:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0004_testglicko2player_last_played_testplayer_last_played'),
+    ]
+
+    # Games saved before the flag existed were saved with their result, so they count as finished
+    operations = [
+        migrations.AddField(
+            model_name='testgame',
+            name='finished',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterField(
+            model_name='testgame',
+            name='finished',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='testglicko2game',
+            name='finished',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterField(
+            model_name='testglicko2game',
+            name='finished',
+            field=models.BooleanField(default=False),
+        ),
+    ]
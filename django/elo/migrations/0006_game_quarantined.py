@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 21:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0005_game_finished'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testgame',
+            name='quarantined',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='testglicko2game',
+            name='quarantined',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,9 +1,16 @@
-from typing import Any, Generic, TypeVar, cast
+from datetime import UTC, datetime, timedelta
+from typing import Any, ClassVar, Generic, Iterable, Sequence, TypeVar, cast
 
-from utils.django import DynamicField
+from elo.rating_systems import EloRatingSystem, Glicko2RatingSystem, RatingSystem, decay_rating
+from utils.django import DynamicField, Epoch, JSONArrayAgg
 from utils.powerups.inheritance_protection import Uninheritable
 
+from django.conf import settings
 from django.db import models
+from django.db.models.functions import Coalesce, Greatest, JSONObject, Power
+from django.db.models.signals import class_prepared
+from django.dispatch import receiver
+from django.utils import timezone
 
 
 class PlayerBase(models.Model):
@@ -14,22 +21,81 @@ class PlayerBase(models.Model):
     DEFAULT_ELO = 1000.0
     K_FACTOR = 32.0
     DIVISOR = 400.0
+    LEADERBOARD = False
+    RATING_SYSTEM: ClassVar[type[RatingSystem[Any]]] = EloRatingSystem
+    DECAY_HALF_LIFE: ClassVar[timedelta | None] = None
+    DECAY_GRACE_PERIOD = timedelta(days=30)
 
     elo: 'models.FloatField[float]' = DynamicField(
         models.FloatField, lambda: PlayerBase,
         lambda Field, Model: Field(default=Model.DEFAULT_ELO)
     )
+    last_played = models.DateTimeField(null=True, blank=True)
+
+    def effective_elo(self, at: datetime | None = None):
+        """
+        The rating at `at` (default: now) after decay towards `DEFAULT_ELO` for inactivity, if `DECAY_HALF_LIFE` is set.
+        Decay is never swept into `elo`; it is written back when the player next plays.
+        """
+        return self.decayed_elo(self.elo, self.last_played, at or timezone.now())
+
+    @classmethod
+    def decayed_elo(cls, elo: float, last_played: datetime | None, at: datetime):
+        if cls.DECAY_HALF_LIFE is None or last_played is None:
+            return elo
+        return decay_rating(
+            elo, cls.DEFAULT_ELO, (at - last_played).total_seconds(),
+            cls.DECAY_HALF_LIFE.total_seconds(), cls.DECAY_GRACE_PERIOD.total_seconds(),
+        )
+
+    @classmethod
+    def effective_elo_expression(cls, at: datetime | None = None):
+        """
+        SQL counterpart of `effective_elo`, e.g. `.annotate(current_elo=TestPlayer.effective_elo_expression())`.
+        """
+        if cls.DECAY_HALF_LIFE is None:
+            return models.F('elo')
+        idle_seconds = models.Value((at or timezone.now()).timestamp()) - Epoch('last_played')
+        decay = Power(
+            models.Value(0.5),
+            Greatest(idle_seconds - models.Value(cls.DECAY_GRACE_PERIOD.total_seconds()), models.Value(0.0))
+            / models.Value(cls.DECAY_HALF_LIFE.total_seconds()),
+        )
+        return Coalesce(
+            models.Value(cls.DEFAULT_ELO) + (models.F('elo') - models.Value(cls.DEFAULT_ELO)) * decay,
+            models.F('elo'),
+            output_field=models.FloatField(),
+        )
+
+    @classmethod
+    def rating_system(cls):
+        return cls.RATING_SYSTEM(cls)
+
+    @classmethod
+    def expected_scores(cls, groups: Sequence[Sequence[int]]):
+        from .predictions import predict_expected_scores
+        return predict_expected_scores(cls, groups)
 
     @classmethod
     def base_game_model(cls):
 
+        class TypedRatingChange(RatingChangeBase):
+
+            class Meta(RatingChangeBase.Meta):
+                abstract = True
+
+            player = models.ForeignKey(cls, on_delete=models.CASCADE)
+
         class TypedGame(GameBase[cls]):
 
             class Meta(GameBase.Meta):
                 abstract = True
 
             override_inheritance_protection = True
+            objects = GameManager()
             PlayerModel = cls
+            RatingChangeBaseModel = TypedRatingChange
+            PROCESS_ASYNC = not cls.RATING_SYSTEM.periodic # queue drains would cut rating periods at random
             between = models.ManyToManyField(cls, related_name='games')
             winner = models.ForeignKey(cls, 
                 related_name='games_won', on_delete=models.CASCADE, null=True, blank=True
@@ -37,6 +103,30 @@ class PlayerBase(models.Model):
 
         return cast(type[GameBase[cls]], TypedGame)
 
+class Glicko2PlayerBase(PlayerBase):
+    """
+    Player rated with Glicko-2, `elo` holding the rating on the familiar Elo-like scale.
+    Games are rated in periods, see `elo.methods.process_rating_period`.
+    """
+
+    class Meta(PlayerBase.Meta):
+        abstract = True
+
+    DEFAULT_ELO = 1500.0
+    DEFAULT_DEVIATION = 350.0
+    DEFAULT_VOLATILITY = 0.06
+    TAU = 0.5
+    RATING_SYSTEM = Glicko2RatingSystem
+
+    deviation: 'models.FloatField[float]' = DynamicField(
+        models.FloatField, lambda: Glicko2PlayerBase,
+        lambda Field, Model: Field(default=Model.DEFAULT_DEVIATION)
+    )
+    volatility: 'models.FloatField[float]' = DynamicField(
+        models.FloatField, lambda: Glicko2PlayerBase,
+        lambda Field, Model: Field(default=Model.DEFAULT_VOLATILITY)
+    )
+
 TPlayer = TypeVar('TPlayer', bound = PlayerBase)
 
 class GameBase(models.Model, Generic[TPlayer], Uninheritable):
@@ -46,17 +136,173 @@ class GameBase(models.Model, Generic[TPlayer], Uninheritable):
 
     intended_use = PlayerBase.base_game_model.__qualname__
 
+    PROCESSING_CHUNK_SIZE = 1000
+    PROCESS_ASYNC = True
+
+    objects: ClassVar['GameManager'] # pyright: ignore[reportIncompatibleVariableOverride]
     PlayerModel: type[TPlayer]
+    RatingChangeBaseModel: type['RatingChangeBase']
+    RatingChangeModel: type['RatingChangeBase']
     between: 'models.ManyToManyField[TPlayer, Any]'
     winner: 'models.ForeignKey[TPlayer | None]'
+    winner_id: int | None
+    finished = models.BooleanField(default=False)
+    """Set once the game's result is known (see `finish`), only finished games are rated"""
+    quarantined = models.BooleanField(default=False)
+    """
+    Set on finished games found invalid when processed (see `elo.methods.validate_game`), which are never rated
+    afterwards, so that ratings stay in chronological order. Once fixed, they can only be rated by a replay (see `elo.replay`).
+    """
     processed = models.BooleanField(default=False)
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    @property
+    def participants(self) -> list[TPlayer]:
+        """
+        The game's players in id order, taken from `GameQuerySet.with_players` if the game was loaded with it.
+        """
+        if not hasattr(self, '_participants'):
+            rows = getattr(self, GameQuerySet.PARTICIPANTS, None)
+            self._participants = (
+                list(self.between.order_by('pk')) if rows is None
+                else players_from_rows(self.PlayerModel, rows, self._state.db)
+            )
+        return self._participants
+
+    def finish(self, winner: TPlayer | None = None):
+        """
+        Records the result (`winner`, or a draw if None) once all players are added, which queues the game
+        for rating if it is processed asynchronously (see `elo.queue`).
+        """
+        self.winner = winner
+        self.finished = True
+        self.save(update_fields=['winner', 'finished'])
 
     def update_elos(self):
         from .methods import update_elos_after_game
         update_elos_after_game(self)
 
+    @classmethod
+    def process_rating_period(cls, queryset: 'models.QuerySet[Any] | None' = None):
+        from .methods import process_rating_period
+        return process_rating_period(cls._default_manager.all() if queryset is None else queryset)
+
+    @classmethod
+    def process_pending_games(cls,
+        queryset: 'models.QuerySet[Any] | None' = None,
+        chunk_size = PROCESSING_CHUNK_SIZE,
+    ):
+        from .methods import process_pending_games
+        return process_pending_games(
+            cls._default_manager.all() if queryset is None else queryset,
+            chunk_size
+        )
+
+    @classmethod
+    def ratings_as_of(cls, player_ids: Iterable[int], at: datetime):
+        return cls.RatingChangeModel.ratings_as_of(player_ids, at)
+
+class GameQuerySet(models.QuerySet[Any]):
+
+    PARTICIPANTS = 'participant_rows'
+
+    def with_players(self, *fields: str):
+        """
+        Loads the games' players (all their concrete fields, or just `fields` plus the id) in the same query,
+        aggregated into a JSON array per game and exposed as `GameBase.participants`.
+        """
+        PlayerModel = cast(type[PlayerBase], self.model.PlayerModel)
+        meta = PlayerModel._meta
+        attnames = [
+            field.attname for field in meta.concrete_fields
+            if not fields or field.primary_key or field.name in fields or field.attname in fields
+        ]
+        return self.annotate(**{
+            self.PARTICIPANTS: JSONArrayAgg(JSONObject(**{ attname: f'between__{attname}' for attname in attnames }))
+        })
+
+class GameManager(models.Manager[Any]):
+
+    def get_queryset(self):
+        return GameQuerySet(self.model, using=self._db)
+
+    def with_players(self, *fields: str):
+        return self.get_queryset().with_players(*fields)
+
+def from_json(field: 'models.Field[Any, Any]', value: Any):
+    value = field.to_python(value)
+    if isinstance(value, datetime) and settings.USE_TZ and timezone.is_naive(value):
+        # SQLite has no time zones and stores datetimes in UTC
+        value = timezone.make_aware(value, UTC)
+    return value
+
+def players_from_rows(PlayerModel: type[TPlayer], rows: list[dict[str, Any]], db: str | None) -> list[TPlayer]:
+    fields = [ field for field in PlayerModel._meta.concrete_fields if field.attname in rows[0] ] if rows else []
+    pk = cast('models.Field[Any, Any]', PlayerModel._meta.pk)
+    return sorted(
+        (
+            PlayerModel.from_db(db, [ field.attname for field in fields ], [ from_json(field, row[field.attname]) for field in fields ])
+            for row in rows
+            if row[pk.attname] is not None # games without players still produce a row
+        ),
+        key=lambda player: player.pk,
+    )
+
+class RatingChangeBase(models.Model):
+    """
+    Append-only record of a player's rating before and after a game, timestamped with the game.
+    A concrete model is created for every concrete game model, see `create_rating_change_model`.
+    """
+
+    class Meta:
+        abstract = True
+
+    game: 'models.ForeignKey[GameBase[Any]]'
+    player: 'models.ForeignKey[PlayerBase]'
+    elo_before = models.FloatField()
+    elo_after = models.FloatField()
+    created = models.DateTimeField()
+
+    @classmethod
+    def ratings_as_of(cls, player_ids: Iterable[int], at: datetime) -> dict[int, float]:
+        PlayerModel = cast(type[PlayerBase], cls._meta.get_field('player').related_model)
+        latest_changes = (
+            cls._default_manager
+            .filter(player=models.OuterRef('pk'), created__lte=at)
+            .order_by('-created', '-pk')
+        )
+        return {
+            player_id: PlayerModel.decayed_elo(elo, played, at)
+            for player_id, elo, played in
+            PlayerModel._default_manager
+            .filter(pk__in=player_ids)
+            .annotate(
+                elo_as_of=Coalesce(
+                    models.Subquery(latest_changes.values('elo_after')[:1]),
+                    models.Value(PlayerModel.DEFAULT_ELO),
+                ),
+                played_as_of=models.Subquery(latest_changes.values('created')[:1]),
+            )
+            .values_list('pk', 'elo_as_of', 'played_as_of')
+        }
+
+@receiver(class_prepared)
+def create_rating_change_model(sender: type[models.Model], **kwargs: Any):
+    if not issubclass(sender, GameBase) or sender._meta.abstract:
+        return
+    Game = cast(type[GameBase[Any]], sender)
+    Game.RatingChangeModel = type(f'{Game.__name__}RatingChange', (Game.RatingChangeBaseModel,), {
+        '__module__': Game.__module__,
+        'Meta': type('Meta', (), {
+            'app_label': Game._meta.app_label,
+            'indexes': [ models.Index(fields=['player', 'created']) ],
+        }),
+        'game': models.ForeignKey(Game, on_delete=models.CASCADE, related_name='rating_changes'),
+    })
+
 class TestPlayer(PlayerBase):
     DEFAULT_ELO = 1200.0
+    DECAY_HALF_LIFE = timedelta(days=180)
 
     name = models.CharField(max_length=255)
 
@@ -68,4 +314,11 @@ class TestGame(TestPlayer.base_game_model()):
     title = models.CharField(max_length=255, null=True, blank=True)
 
     def __str__(self):
-        return self.title or ' vs '.join(player.name for player in self.between.all())
\ No newline at end of file
+        return self.title or ' vs '.join(player.name for player in self.participants)
+
+class TestGlicko2Player(Glicko2PlayerBase):
+
+    name = models.CharField(max_length=255)
+
+class TestGlicko2Game(TestGlicko2Player.base_game_model()):
+    pass
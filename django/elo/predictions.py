@@ -0,0 +1,63 @@
+from typing import Any, ClassVar, Generic, Sequence
+
+import numpy as np
+
+from elo.methods import FloatArray
+from elo.models import PlayerBase, TPlayer
+
+
+class ExpectationTable(Generic[TPlayer]):
+    """
+    Precomputed `1 / (1 + 10 ** (d / DIVISOR))` curve of a player model, sampled every `RESOLUTION` rating points
+    over `SPAN` divisors either way and linearly interpolated in between (and clamped beyond, where it is flat anyway).
+    """
+
+    RESOLUTION = 1.0
+    SPAN = 8.0
+
+    tables: ClassVar[dict[type[PlayerBase], 'ExpectationTable[Any]']] = {}
+
+    def __init__(self, PlayerModel: type[TPlayer]):
+        self.PlayerModel = PlayerModel
+        limit = self.SPAN * PlayerModel.DIVISOR
+        self.differences = np.arange(-limit, limit + self.RESOLUTION, self.RESOLUTION)
+        self.expectations = 1.0 / ( 1.0 + 10 ** (self.differences / PlayerModel.DIVISOR) )
+
+    @classmethod
+    def for_model(cls, PlayerModel: type[TPlayer]) -> 'ExpectationTable[TPlayer]':
+        if PlayerModel not in cls.tables:
+            cls.tables[PlayerModel] = cls(PlayerModel)
+        return cls.tables[PlayerModel]
+
+    def __call__(self, differences: FloatArray) -> FloatArray:
+        """
+        Expected scores for (average opponent) rating minus own rating `differences`, of any shape.
+        """
+        return np.interp(differences, self.differences, self.expectations)
+
+def predict_expected_scores(PlayerModel: type[TPlayer], groups: Sequence[Sequence[int]]) -> list[list[float]]:
+    """
+    Expected score of every player in each group of player ids (a pair or more, as in `get_win_probability`),
+    loading all (effective) ratings in one query and scoring all groups in one vectorized pass.
+    """
+    if any(len(group) < 2 for group in groups):
+        raise ValueError('Every group needs at least 2 players')
+    if not groups:
+        return []
+    player_ids = { player_id for group in groups for player_id in group }
+    ratings_by_id = dict(
+        PlayerModel._default_manager.filter(pk__in=player_ids).values_list('pk', PlayerModel.effective_elo_expression())
+    )
+    if missing := player_ids - ratings_by_id.keys():
+        raise ValueError(f'Unknown {PlayerModel.__name__} ids: {sorted(missing)}')
+
+    width = max(len(group) for group in groups)
+    ratings = np.full((len(groups), width), np.nan)
+    for row, group in enumerate(groups):
+        ratings[row, :len(group)] = [ ratings_by_id[player_id] for player_id in group ]
+    present = ~np.isnan(ratings)
+    player_counts = present.sum(axis=1, keepdims=True)
+    totals = np.nansum(ratings, axis=1, keepdims=True)
+    average_opponent_ratings = (totals - ratings) / (player_counts - 1)
+    expectations = ExpectationTable.for_model(PlayerModel)(average_opponent_ratings - ratings)
+    return [ expectations[row, :len(group)].tolist() for row, group in enumerate(groups) ]
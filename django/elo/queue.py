@@ -0,0 +1,50 @@
+from typing import Any, cast
+
+from django_q.tasks import async_task # pyright: ignore[reportMissingTypeStubs]
+
+from elo.models import GameBase
+from utils.django import get_submodel
+from utils.logging import info
+from utils.postgres import advisory_lock
+from utils.redis import get_client
+
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+
+DRAIN_SCHEDULE_TIMEOUT = 300
+
+def drain_scheduled_key(game_model: str):
+    return f'elo:drain-scheduled:{game_model}'
+
+def schedule_drain(Game: type[GameBase[Any]]):
+    """
+    Enqueues a Django Q task draining the pending games of `Game`, unless one is already enqueued and not yet started.
+    """
+    game_model = Game._meta.label
+    if get_client().set(drain_scheduled_key(game_model), 1, nx=True, ex=DRAIN_SCHEDULE_TIMEOUT):
+        async_task(drain_pending_games, game_model, group=drain_scheduled_key(game_model))
+
+def drain_pending_games(game_model: str):
+    """
+    Processes all pending games of the given game model in micro-batches of `PROCESSING_CHUNK_SIZE`.
+    Drains of the same game model are serialized through an advisory lock, so games are always
+    processed in chronological order and per-player ordering is preserved across workers.
+    """
+    Game = get_submodel(game_model, GameBase)
+    with advisory_lock(drain_scheduled_key(game_model)):
+        get_client().delete(drain_scheduled_key(game_model))
+        processed = Game.process_pending_games()
+    info(f'Drained {processed} pending {game_model} game(s)')
+    return processed
+
+@receiver(post_save)
+def enqueue_finished_game(sender: type[Any], instance: Any, **kwargs: Any):
+    """
+    Schedules a drain once a game is saved as finished (see `GameBase.finish`), so games still being set up
+    or played are never rated.
+    """
+    if issubclass(sender, GameBase) and sender.PROCESS_ASYNC and instance.finished and not instance.processed:
+        Game = cast(type[GameBase[Any]], sender)
+        transaction.on_commit(lambda: schedule_drain(Game), robust=True)
@@ -0,0 +1,220 @@
+import math
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, ClassVar, Generic, Sequence, TypeVar
+
+import numpy as np
+import numpy.typing as npt
+
+if TYPE_CHECKING:
+    from elo.models import Glicko2PlayerBase, PlayerBase
+
+TRatedPlayer = TypeVar('TRatedPlayer', bound='PlayerBase')
+
+RatedGame = tuple[list[TRatedPlayer], TRatedPlayer | None]
+"""A game's players and its winner (None for a draw)."""
+RatingUpdate = tuple[int, TRatedPlayer, float, float]
+"""Index of the game the update is attributed to, the player, and their rating before and after."""
+
+FloatArray = npt.NDArray[np.float64]
+IntArray = npt.NDArray[np.int64]
+
+
+def decay_rating(elo: float, default_elo: float, idle_seconds: float, half_life_seconds: float, grace_seconds: float):
+    """
+    Moves `elo` towards `default_elo`, halving the distance every `half_life_seconds` of inactivity past the grace period.
+    """
+    return default_elo + (elo - default_elo) * 0.5 ** (max(idle_seconds - grace_seconds, 0.0) / half_life_seconds)
+
+
+class RatingSystem(Generic[TRatedPlayer]):
+    """
+    Computes rating updates for a batch of games, in memory. `fields` lists the player fields it changes,
+    which the caller writes back to the database.
+    """
+
+    fields: ClassVar[tuple[str, ...]] = ('elo', 'last_played')
+    periodic: ClassVar[bool] = False
+    """Whether a batch is a rating period, i.e. rating games in one batch differs from rating them in several"""
+
+    def __init__(self, PlayerModel: type[TRatedPlayer]):
+        self.PlayerModel = PlayerModel
+
+    def rate(
+        self, games: list[RatedGame[TRatedPlayer]], played_at: Sequence[datetime] | None = None
+    ) -> list[RatingUpdate[TRatedPlayer]]:
+        """
+        Rates `games`, played at the respective `played_at` times if given; see `start_game`.
+        """
+        ...
+
+    def idle_updates(self) -> dict[str, Any]:
+        """
+        Field updates (as expressions) for the players who played no games in a rating period, if `periodic`.
+        """
+        return {}
+
+    def start_game(self, players: list[TRatedPlayer], played_at: datetime | None):
+        """
+        Writes back the decay (see `PlayerBase.effective_elo`) players accumulated since they last played.
+        A game older than a player's last one (e.g. processed late) neither decays them nor moves `last_played` back.
+        """
+        if played_at is None:
+            return
+        for player in players:
+            if player.last_played is None or played_at > player.last_played:
+                player.elo = player.effective_elo(played_at)
+                player.last_played = played_at
+
+
+class EloRatingSystem(RatingSystem[TRatedPlayer]):
+    """
+    Applies `elo.methods.calculate_deltas` game by game, in order.
+    """
+
+    def rate(self, games: list[RatedGame[TRatedPlayer]], played_at: Sequence[datetime] | None = None):
+        from elo.methods import calculate_deltas
+        updates: list[RatingUpdate[TRatedPlayer]] = []
+        for index, (players, winner) in enumerate(games):
+            self.start_game(players, None if played_at is None else played_at[index])
+            for player, delta in calculate_deltas(players, winner):
+                elo_before = player.elo
+                player.elo += delta
+                updates.append((index, player, elo_before, player.elo))
+        return updates
+
+
+GLICKO2_SCALE = 173.7178
+GLICKO2_CONVERGENCE_TOLERANCE = 1e-6
+GLICKO2_MAX_ITERATIONS = 100
+
+
+def glicko2_period(
+    mu: FloatArray,
+    phi: FloatArray,
+    sigma: FloatArray,
+    players: IntArray,
+    opponents: IntArray,
+    scores: FloatArray,
+    tau: float,
+):
+    """
+    Vectorized Glicko-2 rating period (Glickman, "Example of the Glicko-2 system", steps 3-7) on the Glicko-2 scale.
+    Each result `k` is `players[k]` scoring `scores[k]` against `opponents[k]`, both indices into the player arrays;
+    every player in the arrays is expected to have at least one result.
+    Returns the new mu, phi and sigma arrays.
+    """
+    count = len(mu)
+    g = 1 / np.sqrt(1 + 3 * phi[opponents] ** 2 / math.pi ** 2)
+    expected = 1 / (1 + np.exp(-g * (mu[players] - mu[opponents])))
+    v = 1 / np.bincount(players, weights=g ** 2 * expected * (1 - expected), minlength=count)
+    improvement = np.bincount(players, weights=g * (scores - expected), minlength=count)
+    delta = v * improvement
+
+    a = np.log(sigma ** 2)
+    phi_squared = phi ** 2
+
+    def f(x: FloatArray) -> FloatArray:
+        exp_x = np.exp(x)
+        return (
+            exp_x * (delta ** 2 - phi_squared - v - exp_x) / (2 * (phi_squared + v + exp_x) ** 2)
+            - (x - a) / tau ** 2
+        )
+
+    upper = a.copy()
+    large_delta = delta ** 2 > phi_squared + v
+    lower = np.where(large_delta, np.log(np.maximum(delta ** 2 - phi_squared - v, np.finfo(float).tiny)), a - tau)
+    searching = ~large_delta & (f(lower) < 0)
+    while searching.any():
+        lower = np.where(searching, lower - tau, lower)
+        searching &= f(lower) < 0
+
+    f_upper, f_lower = f(upper), f(lower)
+    for _ in range(GLICKO2_MAX_ITERATIONS):
+        unconverged = np.abs(lower - upper) > GLICKO2_CONVERGENCE_TOLERANCE
+        if not unconverged.any():
+            break
+        candidate = upper + (upper - lower) * f_upper / (f_lower - f_upper)
+        f_candidate = f(candidate)
+        crossed = f_candidate * f_lower <= 0
+        upper = np.where(unconverged & crossed, lower, upper)
+        f_upper = np.where(unconverged & crossed, f_lower, np.where(unconverged, f_upper / 2, f_upper))
+        lower = np.where(unconverged, candidate, lower)
+        f_lower = np.where(unconverged, f_candidate, f_lower)
+
+    new_sigma = np.exp(upper / 2)
+    new_phi = 1 / np.sqrt(1 / (phi_squared + new_sigma ** 2) + 1 / v)
+    new_mu = mu + new_phi ** 2 * improvement
+    return new_mu, new_phi, new_sigma
+
+
+class Glicko2RatingSystem(RatingSystem['Glicko2PlayerBase']):
+    """
+    Treats the whole batch of games as one Glicko-2 rating period and updates every participating player in one
+    vectorized pass. Multiplayer games count as the winner beating every other player, or as pairwise draws
+    if there is no winner. Each player's update is attributed to the last game they played in the period.
+    Players who sat the period out have their deviation inflated (see `idle_updates`).
+    """
+
+    fields = ('elo', 'deviation', 'volatility', 'last_played')
+    periodic = True
+
+    def idle_updates(self):
+        """
+        Step 6 of the rating period for players without games, phi' = sqrt(phi^2 + sigma^2), capped at the
+        deviation of a new player.
+        """
+        from django.db import models # `elo.replay` workers import this module without Django set up
+        from django.db.models.functions import Least, Sqrt
+        scaled_volatility = models.F('volatility') * GLICKO2_SCALE
+        return {
+            'deviation': Least(
+                Sqrt(models.F('deviation') * models.F('deviation') + scaled_volatility * scaled_volatility),
+                models.Value(self.PlayerModel.DEFAULT_DEVIATION),
+                output_field=models.FloatField(),
+            ),
+        }
+
+    def rate(self, games: list[RatedGame['Glicko2PlayerBase']], played_at: Sequence[datetime] | None = None):
+        PlayerModel = self.PlayerModel
+        indices: dict[int, int] = {}
+        players: list[Glicko2PlayerBase] = []
+        last_games: list[int] = []
+        results: list[tuple[int, int, float]] = []
+        for game_index, (game_players, winner) in enumerate(games):
+            self.start_game(game_players, None if played_at is None else played_at[game_index])
+            for player in game_players:
+                if player.pk not in indices:
+                    indices[player.pk] = len(players)
+                    players.append(player)
+                    last_games.append(game_index)
+                last_games[indices[player.pk]] = game_index
+            for player in game_players:
+                for opponent in game_players:
+                    if opponent == player:
+                        continue
+                    if winner is None:
+                        results.append((indices[player.pk], indices[opponent.pk], 0.5))
+                    elif winner in (player, opponent):
+                        results.append((indices[player.pk], indices[opponent.pk], float(player == winner)))
+        if not players:
+            return []
+
+        result_array = np.array(results, dtype=np.float64).reshape(-1, 3)
+        mu, phi, sigma = glicko2_period(
+            (np.array([ player.elo for player in players ]) - PlayerModel.DEFAULT_ELO) / GLICKO2_SCALE,
+            np.array([ player.deviation for player in players ]) / GLICKO2_SCALE,
+            np.array([ player.volatility for player in players ]),
+            result_array[:, 0].astype(np.int64),
+            result_array[:, 1].astype(np.int64),
+            result_array[:, 2],
+            PlayerModel.TAU,
+        )
+
+        updates: list[RatingUpdate['Glicko2PlayerBase']] = []
+        for index, player in enumerate(players):
+            elo_before = player.elo
+            player.elo = float(mu[index] * GLICKO2_SCALE + PlayerModel.DEFAULT_ELO)
+            player.deviation = float(phi[index] * GLICKO2_SCALE)
+            player.volatility = float(sigma[index])
+            updates.append((last_games[index], player, elo_before, player.elo))
+        return updates
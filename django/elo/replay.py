@@ -0,0 +1,189 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
+
+from elo.rating_systems import decay_rating
+
+if TYPE_CHECKING:
+    from elo.models import GameBase, PlayerBase
+
+# Worker processes import this module to unpickle `replay_games`, so Django-dependent imports stay inside functions
+
+WRITE_BATCH_SIZE = 1000
+
+ReplayedGame = tuple[int, list[int], int | None, float]
+"""Game id, participant ids (in id order), winner id and the game's timestamp."""
+RatingChangeRow = tuple[int, int, float, float]
+"""Game id, player id, rating before and rating after."""
+
+
+@dataclass
+class RatingConstants:
+    default_elo: float
+    k_factor: float
+    divisor: float
+    decay_half_life: float | None = None
+    decay_grace_period: float = 0.0
+
+    @classmethod
+    def of(cls, PlayerModel: type['PlayerBase']):
+        half_life = PlayerModel.DECAY_HALF_LIFE
+        return cls(
+            PlayerModel.DEFAULT_ELO, PlayerModel.K_FACTOR, PlayerModel.DIVISOR,
+            None if half_life is None else half_life.total_seconds(), PlayerModel.DECAY_GRACE_PERIOD.total_seconds(),
+        )
+
+
+def find_components(participant_ids: dict[int, list[int]]):
+    """
+    Groups players into connected components, two players being connected if they ever played in the same game.
+    Returns a map from every player id to the representative id of its component.
+    """
+    parents: dict[int, int] = {}
+
+    def find(player_id: int):
+        root = player_id
+        while parents[root] != root:
+            root = parents[root]
+        while parents[player_id] != root:
+            parents[player_id], player_id = root, parents[player_id]
+        return root
+
+    for player_ids in participant_ids.values():
+        for player_id in player_ids:
+            parents.setdefault(player_id, player_id)
+        first_root = find(player_ids[0])
+        for player_id in player_ids[1:]:
+            parents[find(player_id)] = first_root
+    return { player_id: find(player_id) for player_id in parents }
+
+def replay_games(games: list[ReplayedGame], constants: RatingConstants):
+    """
+    Replays games in the given order starting from default ratings, with the same arithmetic as
+    `elo.methods.calculate_deltas` and the same decay as `PlayerBase.effective_elo`.
+    Runs in worker processes, so it only deals with plain values.
+
+    Returns the final ratings, the rating changes and the id of each player's last game.
+    """
+    ratings: defaultdict[int, float] = defaultdict(lambda: constants.default_elo)
+    changes: list[RatingChangeRow] = []
+    last_games: dict[int, tuple[int, float]] = {}
+    for game_id, player_ids, winner_id, played_at in games:
+        if constants.decay_half_life is not None:
+            for player_id in player_ids:
+                if player_id in last_games:
+                    ratings[player_id] = decay_rating(
+                        ratings[player_id], constants.default_elo, played_at - last_games[player_id][1],
+                        constants.decay_half_life, constants.decay_grace_period,
+                    )
+        last_games.update((player_id, (game_id, played_at)) for player_id in player_ids)
+        line_up = [ (player_id, ratings[player_id]) for player_id in player_ids ]
+        for player_id, elo in line_up:
+            average_elo = sum(
+                opponent_elo for opponent_id, opponent_elo in line_up if opponent_id != player_id
+            ) / (len(line_up) - 1)
+            win_probability = 1.0 / ( 1.0 + 10 ** ((average_elo - elo) / constants.divisor) )
+            score = int(player_id == winner_id) if winner_id else 0.5
+            ratings[player_id] = elo + constants.k_factor * (score - win_probability)
+            changes.append((game_id, player_id, elo, ratings[player_id]))
+    return dict(ratings), changes, { player_id: game_id for player_id, (game_id, _) in last_games.items() }
+
+def bundle_components(components: list[list[ReplayedGame]], bundle_count: int):
+    """
+    Packs components into at most `bundle_count` bundles of similar game counts, largest components first.
+    Components are independent, so each bundle can be replayed as one stream.
+    """
+    bundles: list[list[ReplayedGame]] = [ [] for _ in range(min(bundle_count, len(components))) ]
+    for component in sorted(components, key=len, reverse=True):
+        min(bundles, key=len).extend(component)
+    return bundles
+
+def replay_ratings(Game: type['GameBase[Any]'], workers: int | None = None):
+    """
+    Recomputes all ratings of `Game`'s players from scratch: splits the player/game graph into connected
+    components, replays each component's finished games chronologically in a process pool, then writes the final
+    ratings, the rating history and the processed flags back in bulk in one transaction, and sends `ratings_updated`.
+    Invalid games are quarantined like when processing pending games (see `elo.methods.process_pending_games`),
+    while previously quarantined ones are validated again, so fixed games are rated in their place.
+
+    Returns the number of games replayed and the number of components.
+    """
+    from elo.methods import get_player_model, load_participant_ids, notify_ratings_updated, validate_line_up
+    from elo.queue import drain_scheduled_key
+    from elo.rating_systems import EloRatingSystem
+    from utils.logging import warning
+    from utils.postgres import advisory_lock
+
+    from django.db import transaction
+
+    workers = workers or os.cpu_count() or 1
+    PlayerModel = get_player_model(Game)
+    if not issubclass(PlayerModel.RATING_SYSTEM, EloRatingSystem):
+        raise ValueError(f'Replaying is only supported for Elo, not {PlayerModel.RATING_SYSTEM.__name__}')
+    constants = RatingConstants.of(PlayerModel)
+    with advisory_lock(drain_scheduled_key(Game._meta.label)):
+        finished_games: list[tuple[int, datetime, int | None, bool, bool]] = list(
+            Game._default_manager.filter(finished=True).order_by('created', 'pk')
+            .values_list('pk', 'created', 'winner_id', 'processed', 'quarantined')
+        )
+        participant_ids = load_participant_ids(Game, [ game_id for game_id, *_ in finished_games ])
+        games: list[tuple[int, datetime, int | None]] = []
+        quarantined_ids: list[int] = []
+        rated_ids: list[int] = []
+        for game_id, created, winner_id, processed, quarantined in finished_games:
+            try:
+                validate_line_up(f'game {game_id}', participant_ids[game_id], winner_id)
+            except ValueError as e:
+                if not quarantined:
+                    warning(f'Quarantining invalid game: {e}')
+                    quarantined_ids.append(game_id)
+                continue
+            games.append((game_id, created, winner_id))
+            if quarantined or not processed:
+                rated_ids.append(game_id)
+        components_by_root = find_components({ game_id: participant_ids[game_id] for game_id, _, _ in games })
+        components: defaultdict[int, list[ReplayedGame]] = defaultdict(list)
+        for game_id, created, winner_id in games:
+            player_ids = participant_ids[game_id]
+            components[components_by_root[player_ids[0]]].append((game_id, player_ids, winner_id, created.timestamp()))
+
+        ratings: dict[int, float] = {}
+        changes: list[RatingChangeRow] = []
+        last_games: dict[int, int] = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            bundles = bundle_components(list(components.values()), 4 * workers)
+            for bundle_ratings, bundle_changes, bundle_last_games in executor.map(
+                replay_games, bundles, [ constants ] * len(bundles)
+            ):
+                ratings.update(bundle_ratings)
+                changes += bundle_changes
+                last_games.update(bundle_last_games)
+
+        created = { game_id: created for game_id, created, _ in games }
+        with transaction.atomic():
+            players = list(PlayerModel._default_manager.select_for_update().order_by('pk'))
+            for player in players:
+                player.elo = ratings.get(player.pk, constants.default_elo)
+                player.last_played = created[last_games[player.pk]] if player.pk in last_games else None
+            PlayerModel._default_manager.bulk_update(players, ['elo', 'last_played'], batch_size=WRITE_BATCH_SIZE)
+            Game._default_manager.filter(pk__in=rated_ids).update(processed=True, quarantined=False)
+            Game._default_manager.filter(pk__in=quarantined_ids).update(processed=False, quarantined=True)
+            Game.RatingChangeModel._default_manager.all().delete()
+            Game.RatingChangeModel._default_manager.bulk_create(
+                (
+                    Game.RatingChangeModel(
+                        game_id=game_id,
+                        player_id=player_id,
+                        elo_before=elo_before,
+                        elo_after=elo_after,
+                        created=created[game_id],
+                    )
+                    for game_id, player_id, elo_before, elo_after in changes
+                ),
+                batch_size=WRITE_BATCH_SIZE,
+            )
+            notify_ratings_updated(players)
+    return len(games), len(components)
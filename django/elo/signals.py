@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+ratings_updated = Signal()
+"""
+Sent after a transaction that changed player ratings commits,
+with the player model as `sender` and the updated player instances as `players`.
+"""
@@ -1,10 +1,70 @@
-from typing import Any
+import math
+import random
+from datetime import timedelta
+from contextlib import AbstractContextManager
+from typing import Any, Callable
 
-from elo.models import PlayerBase, GameBase, TestGame
+from unittest import mock, skipUnless
+
+import fakeredis
+import numpy as np
+
+from elo.benchmarks import (
+    create_games_from_stream, create_synthetic_games, find_lost_updates, generate_games, replay_in_memory, run_benchmark, run_in_threads,
+)
+from elo.leaderboard import Leaderboard
+from elo.matchmaking import MatchmakingIndex
+from elo.predictions import ExpectationTable
+from elo.queue import drain_pending_games, drain_scheduled_key
+from elo.replay import RatingConstants, find_components, replay_games, replay_ratings
+from elo.methods import (
+    calculate_batched_deltas, calculate_deltas, calculate_deltas_vectorized, get_win_probability,
+    process_pending_games, update_elos_after_game,
+)
+from elo.models import PlayerBase, GameBase, TestGame, TestGlicko2Game, TestGlicko2Player, TestPlayer
+from elo.signals import ratings_updated
 from utils.powerups.inheritance_protection import Uninheritable
 
-from django.db import models
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection, models
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+
+
+def executing_on_commit(test: TestCase) -> AbstractContextManager[list[Callable[[], Any]]]:
+    """
+    `test.captureOnCommitCallbacks(execute=True)`, which the Django stubs don't declare.
+    """
+    return getattr(test, 'captureOnCommitCallbacks')(execute=True)
+
+def create_games(*line_ups: tuple[list[TestPlayer], TestPlayer | None]):
+    games: list[TestGame] = []
+    for players, winner in line_ups:
+        game = TestGame.objects.create()
+        game.between.set(players)
+        game.finish(winner)
+        games.append(game)
+    return games
+
+def create_players(count: int):
+    return [ TestPlayer.objects.create(name=f'Player {i}') for i in range(count) ]
+
+def sample_line_ups(players: list[TestPlayer]):
+    a, b, c, d = players
+    return [
+        ( [a, b], a ),
+        ( [b, c], c ),
+        ( [a, b, c], None ),
+        ( [c, d], d ),
+        ( [a, d], a ),
+        ( [a, b, c, d], b ),
+        ( [b, d], None ),
+    ]
+
+def random_line_up(rng: random.Random, size: int):
+    players = [ TestPlayer(pk=i, elo=rng.uniform(600, 2400)) for i in range(size) ]
+    return players, rng.choice([ None, *players ])
 
 
 class EloTest(TestCase):
@@ -27,4 +87,641 @@ class EloTest(TestCase):
         Player.base_game_model()
 
         # Make sure TestGame is a subclass of Game
-        self.assertIsInstance(TestGame.__mro__[1], type(GameBase))
\ No newline at end of file
+        self.assertIsInstance(TestGame.__mro__[1], type(GameBase))
+
+    def test_process_pending_games_matches_sequential_updates(self):
+        sequential_players = create_players(4)
+        for game in create_games(*sample_line_ups(sequential_players)):
+            update_elos_after_game(game)
+
+        batched_players = create_players(4)
+        batched_games = create_games(*sample_line_ups(batched_players))
+        processed = process_pending_games(
+            TestGame.objects.filter(pk__in=[game.pk for game in batched_games]), chunk_size=3
+        )
+
+        self.assertEqual(processed, len(batched_games))
+        self.assertEqual(
+            [ player.elo for player in TestPlayer.objects.filter(pk__in=[p.pk for p in sequential_players]).order_by('pk') ],
+            [ player.elo for player in TestPlayer.objects.filter(pk__in=[p.pk for p in batched_players]).order_by('pk') ],
+        )
+        self.assertFalse(TestGame.objects.filter(processed=False).exists())
+
+    def test_process_pending_games_query_count_does_not_grow_with_games(self):
+        players = create_players(4)
+        create_games(*sample_line_ups(players) * 10)
+        with self.assertNumQueries(9):
+            TestGame.process_pending_games()
+
+    def test_process_pending_games_quarantines_invalid_games(self):
+        a, b, c = create_players(3)
+        games = create_games(( [a, b], a ), ( [a, b], c ), ( [a], a ), ( [b, c], None ))
+        with self.assertLogs('utils.logging', 'WARNING') as logs:
+            self.assertEqual(TestGame.process_pending_games(), 2)
+        self.assertEqual(len(logs.output), 2)
+        self.assertEqual(
+            list(TestGame.objects.filter(quarantined=True).order_by('pk').values_list('pk', flat=True)),
+            [ games[1].pk, games[2].pk ]
+        )
+        self.assertEqual(TestGame.RatingChangeModel.objects.count(), 4)
+        games[2].between.add(b) # fixed, but rating it now would put it after later games
+        create_games(( [a, b], b ))
+        with self.assertNoLogs('utils.logging', 'WARNING'):
+            self.assertEqual(TestGame.process_pending_games(), 1)
+        self.assertEqual(TestGame.objects.filter(processed=False).count(), 2)
+
+    def test_unfinished_games_are_not_rated(self):
+        a, b, c = create_players(3)
+        game = TestGame.objects.create()
+        game.between.add(a, b) # e.g. players joining one at a time
+        self.assertEqual(TestGame.process_pending_games(), 0)
+        with self.assertRaisesMessage(ValueError, 'is not finished'):
+            game.update_elos()
+        game.between.add(c)
+        game.finish(c)
+        self.assertEqual(TestGame.process_pending_games(), 1)
+        self.assertEqual(TestGame.RatingChangeModel.objects.count(), 3)
+
+    def test_rating_changes_are_recorded(self):
+        players = create_players(4)
+        games = create_games(*sample_line_ups(players))
+        update_elos_after_game(games[0])
+        TestGame.process_pending_games()
+
+        for player in players:
+            player.refresh_from_db()
+            changes = list(TestGame.RatingChangeModel.objects.filter(player=player).order_by('created', 'pk'))
+            self.assertEqual(changes[0].elo_before, TestPlayer.DEFAULT_ELO)
+            self.assertEqual(changes[-1].elo_after, player.elo)
+            for previous, change in zip(changes, changes[1:]):
+                self.assertEqual(previous.elo_after, change.elo_before)
+
+    def test_with_players_loads_participants_in_one_query(self):
+        players = create_players(4)
+        create_games(*sample_line_ups(players))
+        TestGame.objects.create(title='Empty')
+        expected = [ str(game) for game in TestGame.objects.order_by('pk') ]
+
+        with self.assertNumQueries(1):
+            games = list(TestGame.objects.with_players().order_by('pk'))
+            self.assertEqual([ str(game) for game in games ], expected)
+            self.assertEqual(
+                [ [ player.pk for player in game.participants ] for game in games ],
+                [ sorted(player.pk for player in line_up) for line_up, _ in sample_line_ups(players) ] + [ [] ],
+            )
+            self.assertEqual(games[0].participants[0].elo, TestPlayer.DEFAULT_ELO)
+
+    def test_with_players_loads_only_requested_fields(self):
+        a, b = create_players(2)
+        create_games(( [b, a], a ))
+        game = TestGame.objects.with_players('name').get()
+        self.assertEqual([ player.pk for player in game.participants ], [ a.pk, b.pk ])
+        with self.assertNumQueries(0):
+            self.assertEqual(str(game), 'Player 0 vs Player 1')
+        self.assertEqual(game.participants[0].get_deferred_fields(), { 'elo', 'last_played' })
+
+    def test_ratings_as_of(self):
+        a, b, c = create_players(3)
+        start = timezone.now()
+        first, second = create_games(( [a, b], a ), ( [a, c], c ))
+        TestGame.objects.filter(pk=first.pk).update(created=start + timedelta(days=1))
+        TestGame.objects.filter(pk=second.pk).update(created=start + timedelta(days=2))
+        TestGame.process_pending_games()
+        after_first = TestGame.RatingChangeModel.objects.get(game=first, player=a).elo_after
+
+        with self.assertNumQueries(1):
+            ratings = TestGame.ratings_as_of([a.pk, b.pk, c.pk], start + timedelta(days=1, hours=12))
+
+        self.assertEqual(ratings[a.pk], after_first)
+        self.assertEqual(ratings[b.pk], TestPlayer.objects.get(pk=b.pk).elo)
+        self.assertEqual(ratings[c.pk], TestPlayer.DEFAULT_ELO)
+        self.assertEqual(TestGame.ratings_as_of([a.pk], start)[a.pk], TestPlayer.DEFAULT_ELO)
+
+
+class VectorizedDeltasTest(SimpleTestCase):
+
+    def test_vectorized_deltas_match_reference(self):
+        rng = random.Random(42)
+        for size in [ 2, 3, 5, 16 ]:
+            players, winner = random_line_up(rng, size)
+            expected = dict(calculate_deltas(players, winner))
+            for player, delta in calculate_deltas_vectorized(players, winner):
+                self.assertAlmostEqual(delta, expected[player], places=9)
+
+    def test_batched_deltas_match_reference(self):
+        rng = random.Random(7)
+        line_ups = [ random_line_up(rng, rng.randint(2, 6)) for _ in range(50) ]
+        width = max(len(players) for players, _ in line_ups)
+        ratings = np.full((len(line_ups), width), np.nan)
+        winner_indices = np.full(len(line_ups), -1)
+        for row, (players, winner) in enumerate(line_ups):
+            ratings[row, :len(players)] = [ player.elo for player in players ]
+            if winner:
+                winner_indices[row] = players.index(winner)
+
+        deltas = calculate_batched_deltas(ratings, winner_indices, TestPlayer.K_FACTOR, TestPlayer.DIVISOR)
+
+        for row, (players, winner) in enumerate(line_ups):
+            expected = dict(calculate_deltas(players, winner))
+            for column, player in enumerate(players):
+                self.assertAlmostEqual(deltas[row, column], expected[player], places=9)
+            self.assertTrue(np.isnan(deltas[row, len(players):]).all())
+
+
+class LeaderboardTest(TestCase):
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        for patcher in [
+            mock.patch('elo.leaderboard.get_client', return_value=self.redis),
+            mock.patch.object(TestPlayer, 'LEADERBOARD', True),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.leaderboard = Leaderboard(TestPlayer)
+
+    def expected_order(self):
+        return list(TestPlayer.objects.order_by('-elo').values_list('pk', flat=True))
+
+    def test_rating_updates_are_mirrored(self):
+        players = create_players(4)
+        self.leaderboard.rebuild()
+        games = create_games(*sample_line_ups(players))
+        with executing_on_commit(self):
+            TestGame.process_pending_games(TestGame.objects.filter(pk__in=[game.pk for game in games]))
+
+        self.assertFalse(self.leaderboard.check())
+        expected_order = self.expected_order()
+        self.assertEqual([ entry.player_id for entry in self.leaderboard.top(4) ], expected_order)
+        self.assertEqual(self.leaderboard.rank(expected_order[2]), 3)
+        self.assertEqual(self.leaderboard.percentile(expected_order[0]), 75.0)
+        self.assertEqual(
+            [ entry.rank for entry in self.leaderboard.around(expected_order[2], radius=1) ],
+            [ 2, 3, 4 ]
+        )
+
+    def test_check_and_rebuild(self):
+        a, b, c = create_players(3)
+        self.leaderboard.sync([a, b])
+        TestPlayer.objects.filter(pk=b.pk).update(elo=1500)
+        self.redis.zadd(self.leaderboard.key, { '0': 1000 })
+
+        discrepancies = self.leaderboard.check()
+        self.assertEqual(
+            (discrepancies.missing, discrepancies.stale, discrepancies.extra),
+            ([ c.pk ], [ b.pk ], [ 0 ])
+        )
+
+        call_command('rebuild_leaderboard', 'elo.TestPlayer', stdout=mock.Mock())
+        self.assertFalse(self.leaderboard.check())
+        self.assertEqual(self.leaderboard.top(1)[0].player_id, b.pk)
+
+
+class MatchmakingTest(SimpleTestCase):
+
+    def setUp(self):
+        self.rng = random.Random(3)
+        self.index = MatchmakingIndex(TestPlayer)
+        self.ratings = { player_id: self.rng.uniform(800, 1600) for player_id in range(500) }
+        for player_id, elo in self.ratings.items():
+            self.index.add(player_id, elo)
+
+    def test_index_stays_sorted(self):
+        for player_id in self.rng.sample(list(self.ratings), 100):
+            self.index.remove(player_id)
+            del self.ratings[player_id]
+        for player_id in self.rng.sample(list(self.ratings), 100):
+            self.ratings[player_id] += self.rng.uniform(-50, 50)
+            self.index.update(player_id, self.ratings[player_id])
+
+        self.assertEqual(list(self.index.ratings), sorted(self.ratings.values()))
+        self.assertEqual(
+            { int(player_id): elo for player_id, elo in zip(self.index.player_ids, self.index.ratings) },
+            self.ratings
+        )
+
+    def test_best_opponents_match_brute_force(self):
+        for player_id in self.rng.sample(list(self.ratings), 20):
+            elo = self.ratings[player_id]
+            expected = sorted(
+                ( abs(other_elo - elo), other_id )
+                for other_id, other_elo in self.ratings.items() if other_id != player_id
+            )[:5]
+            opponents = self.index.best_opponents(player_id, 5, window=1.0, max_window=10_000.0)
+            self.assertEqual(
+                sorted(( opponent.distance, opponent.player_id ) for opponent in opponents),
+                expected
+            )
+
+    def test_best_opponents_respect_max_window(self):
+        index = MatchmakingIndex(TestPlayer)
+        for player_id, elo in enumerate([ 1000.0, 1030.0, 1090.0, 1500.0 ]):
+            index.add(player_id, elo)
+        self.assertEqual(
+            [ opponent.player_id for opponent in index.best_opponents(0, 3, window=25.0, max_window=100.0) ],
+            [ 1, 2 ]
+        )
+
+    def test_committed_rating_updates_reach_queued_players(self):
+        index = MatchmakingIndex.for_model(TestPlayer)
+        self.addCleanup(MatchmakingIndex.indexes.pop, TestPlayer)
+        index.add(1, 1000.0)
+        ratings_updated.send(sender=TestPlayer, players=[ TestPlayer(pk=1, elo=1016.0), TestPlayer(pk=2, elo=984.0) ])
+        self.assertEqual(index.queued, { 1: 1016.0 })
+
+    def test_equal_ratings_are_ordered_by_player_id(self):
+        index = MatchmakingIndex(TestPlayer)
+        player_ids = self.rng.sample(range(1000), 200)
+        for player_id in player_ids:
+            index.add(player_id, TestPlayer.DEFAULT_ELO)
+        for player_id in player_ids[:50]:
+            index.remove(player_id)
+        self.assertEqual(list(index.player_ids), sorted(player_ids[50:]))
+        self.assertEqual([ index._position(player_id) for player_id in sorted(player_ids[50:]) ], list(range(150))) # pyright: ignore[reportPrivateUsage]
+
+
+class MatchmakingRefreshTest(TestCase):
+
+    def test_ratings_committed_elsewhere_are_picked_up(self):
+        a, b, c = create_players(3)
+        index = MatchmakingIndex(TestPlayer, max_staleness=0.0)
+        for player in (a, b, c):
+            index.queue(player)
+        TestPlayer.objects.filter(pk=c.pk).update(elo=TestPlayer.DEFAULT_ELO + 10) # e.g. by a worker process
+        TestPlayer.objects.filter(pk=b.pk).update(elo=TestPlayer.DEFAULT_ELO + 100)
+        self.assertEqual([ opponent.player_id for opponent in index.best_opponents(a.pk, 2, max_window=1000.0) ], [ c.pk, b.pk ])
+        self.assertEqual(index.queued[b.pk], TestPlayer.DEFAULT_ELO + 100)
+        unrefreshed = MatchmakingIndex(TestPlayer)
+        unrefreshed.queue(a)
+        unrefreshed.queue(b)
+        with self.assertNumQueries(0):
+            self.assertEqual(unrefreshed.best_opponents(a.pk, 1)[0].elo, TestPlayer.DEFAULT_ELO)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentUpdatesTest(TransactionTestCase):
+
+    def test_concurrent_workers_do_not_lose_updates(self):
+        players, games = create_synthetic_games(6, 300, random.Random(11))
+
+        run_in_threads(games, 8, update_elos_after_game)
+
+        self.assertEqual(find_lost_updates(players), [])
+        self.assertFalse(TestGame.objects.filter(processed=False).exists())
+        self.assertAlmostEqual(
+            sum(TestPlayer.objects.values_list('elo', flat=True)),
+            len(players) * TestPlayer.DEFAULT_ELO,
+            places=6
+        )
+
+    def test_concurrent_batches_do_not_process_games_twice(self):
+        players, games = create_synthetic_games(6, 300, random.Random(12))
+
+        run_in_threads([ TestGame.objects.all() ] * 4, 4, TestGame.process_pending_games)
+
+        self.assertEqual(find_lost_updates(players), [])
+        self.assertEqual(TestGame.RatingChangeModel.objects.count(), 2 * len(games))
+
+
+class QueueTest(TestCase):
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch('elo.queue.get_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_finished_games_schedule_a_single_drain(self):
+        a, b = create_players(2)
+        with mock.patch('elo.queue.async_task') as async_task:
+            with executing_on_commit(self):
+                draw = TestGame.objects.create()
+                draw.between.set([a, b])
+            async_task.assert_not_called() # still being played
+            with executing_on_commit(self):
+                draw.finish()
+            with executing_on_commit(self):
+                create_games(( [a, b], a ), ( [a, b], b ))
+
+        async_task.assert_called_once_with(
+            drain_pending_games, 'elo.TestGame', group=drain_scheduled_key('elo.TestGame')
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'Requires Postgres advisory locks')
+    def test_drain_processes_pending_games(self):
+        self.redis.set(drain_scheduled_key('elo.TestGame'), 1)
+        create_games(*sample_line_ups(create_players(4)))
+
+        self.assertEqual(drain_pending_games('elo.TestGame'), 7)
+        self.assertFalse(TestGame.objects.filter(processed=False).exists())
+        self.assertFalse(self.redis.exists(drain_scheduled_key('elo.TestGame')))
+
+
+class BenchmarkTest(TestCase):
+
+    def test_paths_agree_and_database_is_left_untouched(self):
+        stream = generate_games(20, 200, random.Random(1), players_per_game=3, activity_skew=1.1, draw_rate=0.2)
+        self.assertTrue(all(len(set(game.player_indices)) == 3 for game in stream))
+
+        for path in ('memory', 'numpy', 'batch', 'single'):
+            result = run_benchmark(path, 20, stream, 1.1, trace_memory=True)
+            self.assertEqual(result.games, 200)
+            self.assertIsNotNone(result.peak_memory_bytes)
+            self.assertEqual(result.queries_per_game is None, path in ('memory', 'numpy'))
+
+        self.assertFalse(TestGame.objects.exists())
+        self.assertFalse(TestPlayer.objects.exists())
+
+    def test_in_memory_replay_matches_database(self):
+        stream = generate_games(10, 100, random.Random(2), players_per_game=2, draw_rate=0.2)
+        players, _ = create_games_from_stream(10, stream)
+        TestGame.process_pending_games()
+        self.assertEqual(
+            [ player.elo for player in replay_in_memory(10, stream) ],
+            list(TestPlayer.objects.filter(pk__in=[p.pk for p in players]).order_by('pk').values_list('elo', flat=True)),
+        )
+
+
+class ReplayTest(TestCase):
+
+    def test_find_components(self):
+        components = find_components({ 1: [ 1, 2 ], 2: [ 3, 4 ], 3: [ 2, 5, 6 ], 4: [ 7, 8 ] })
+        self.assertEqual(
+            sorted({ frozenset(p for p, root in components.items() if root == r) for r in components.values() }, key=min),
+            [ frozenset({ 1, 2, 5, 6 }), frozenset({ 3, 4 }), frozenset({ 7, 8 }) ]
+        )
+
+    def test_replay_matches_sequential_processing(self):
+        players, games = create_games_from_stream(
+            12, generate_games(12, 150, random.Random(4), players_per_game=3, draw_rate=0.2)
+        )
+        TestGame.process_pending_games()
+        participant_ids = { game.pk: sorted(game.between.values_list('pk', flat=True)) for game in games }
+
+        ratings, changes, _ = replay_games(
+            [ (game.pk, participant_ids[game.pk], game.winner_id, game.created.timestamp()) for game in games ],
+            RatingConstants.of(TestPlayer),
+        )
+
+        self.assertEqual(ratings, dict(TestPlayer.objects.filter(pk__in=[p.pk for p in players]).values_list('pk', 'elo')))
+        self.assertEqual(
+            changes,
+            list(TestGame.RatingChangeModel.objects.order_by('pk').values_list('game', 'player', 'elo_before', 'elo_after'))
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'Requires Postgres advisory locks')
+    def test_replay_ratings_after_changing_constants(self):
+        stream = generate_games(30, 300, random.Random(5), activity_skew=1.1)
+        create_games_from_stream(30, stream)
+        create_players(1)
+        TestGame.process_pending_games()
+
+        with mock.patch.object(TestPlayer, 'K_FACTOR', 16.0):
+            games, components = replay_ratings(TestGame, workers=2)
+            expected = replay_in_memory(30, stream)
+
+        self.assertEqual(games, 300)
+        self.assertGreaterEqual(components, 1)
+        self.assertEqual(
+            list(TestPlayer.objects.order_by('pk').values_list('elo', flat=True)),
+            [ player.elo for player in expected ] + [ TestPlayer.DEFAULT_ELO ],
+        )
+        self.assertEqual(TestGame.RatingChangeModel.objects.count(), 600)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Requires Postgres advisory locks')
+    def test_replay_ratings_validates_games_and_notifies(self):
+        a, b, c = create_players(3)
+        first, invalid, last = create_games(( [a, b], a ), ( [a, b], a ), ( [a, b], b ))
+        TestGame.process_pending_games()
+        TestGame.objects.filter(pk=invalid.pk).update(winner=c) # e.g. a bad manual fix
+        TestGame.objects.create().between.set([ a, b ]) # still being played
+        receiver = mock.Mock()
+        ratings_updated.connect(receiver, sender=TestPlayer, weak=False)
+        self.addCleanup(ratings_updated.disconnect, receiver, sender=TestPlayer)
+
+        with self.assertLogs('utils.logging', 'WARNING'), executing_on_commit(self):
+            self.assertEqual(replay_ratings(TestGame, workers=1)[0], 2)
+
+        self.assertEqual(
+            list(TestGame.objects.order_by('pk').values_list('processed', 'quarantined')),
+            [ (True, False), (False, True), (True, False), (False, False) ]
+        )
+        self.assertEqual(set(TestGame.RatingChangeModel.objects.values_list('game', flat=True)), { first.pk, last.pk })
+        receiver.assert_called_once()
+        self.assertEqual(
+            { player.pk: player.elo for player in receiver.call_args.kwargs['players'] },
+            dict(TestPlayer.objects.values_list('pk', 'elo')),
+        )
+
+        TestGame.objects.filter(pk=invalid.pk).update(winner=b) # fixed
+        with self.assertNoLogs('utils.logging', 'WARNING'):
+            self.assertEqual(replay_ratings(TestGame, workers=1)[0], 3)
+        self.assertEqual(TestGame.objects.filter(processed=True, quarantined=False).count(), 3)
+
+
+class Glicko2Test(TestCase):
+
+    def test_glickman_example(self):
+        # http://www.glicko.net/glicko/glicko2.pdf
+        player = TestGlicko2Player(pk=1, elo=1500, deviation=200, volatility=0.06)
+        opponents = [
+            TestGlicko2Player(pk=2, elo=1400, deviation=30, volatility=0.06),
+            TestGlicko2Player(pk=3, elo=1550, deviation=100, volatility=0.06),
+            TestGlicko2Player(pk=4, elo=1700, deviation=300, volatility=0.06),
+        ]
+
+        updates = TestGlicko2Player.rating_system().rate([
+            ( [ player, opponents[0] ], player ),
+            ( [ player, opponents[1] ], opponents[1] ),
+            ( [ opponents[2], player ], opponents[2] ),
+        ])
+
+        self.assertAlmostEqual(player.elo, 1464.06, delta=0.01) # the paper rounds intermediate values
+        self.assertAlmostEqual(player.deviation, 151.52, places=2)
+        self.assertAlmostEqual(player.volatility, 0.05999, delta=1e-5)
+        self.assertIn((2, player, 1500, player.elo), updates)
+        self.assertEqual(len(updates), 4)
+
+    def test_rating_period_is_persisted_in_bulk(self):
+        players = [ TestGlicko2Player.objects.create(name=f'Player {i}') for i in range(3) ]
+        a, b, c = players
+        idle = TestGlicko2Player.objects.create(name='Idle', deviation=100)
+        new = TestGlicko2Player.objects.create(name='New')
+        for line_up, winner in [ ( [a, b], a ), ( [b, c], None ), ( [a, b, c], c ) ]:
+            game = TestGlicko2Game.objects.create()
+            game.between.set(line_up)
+            game.finish(winner)
+
+        self.assertEqual(TestGlicko2Game.process_rating_period(), 3)
+
+        for player in players:
+            player.refresh_from_db()
+            self.assertLess(player.deviation, TestGlicko2Player.DEFAULT_DEVIATION)
+            self.assertNotEqual(player.volatility, 0)
+        self.assertGreater(a.elo, b.elo)
+        self.assertFalse(TestGlicko2Game.objects.filter(processed=False).exists())
+        self.assertEqual(TestGlicko2Game.RatingChangeModel.objects.count(), 3)
+        idle.refresh_from_db()
+        self.assertAlmostEqual(idle.deviation, math.hypot(100, 0.06 * 173.7178))
+        self.assertEqual(idle.elo, TestGlicko2Player.DEFAULT_ELO)
+        self.assertEqual(TestGlicko2Player.objects.get(pk=new.pk).deviation, TestGlicko2Player.DEFAULT_DEVIATION)
+
+        self.assertEqual(TestGlicko2Game.process_rating_period(), 0) # a period without games
+        self.assertGreater(TestGlicko2Player.objects.get(pk=a.pk).deviation, a.deviation)
+
+    def test_rating_periods_are_not_cut_by_chunks(self):
+        players = [ TestGlicko2Player.objects.create(name=f'Player {i}') for i in range(4) ]
+        line_ups = [ ( [ players[i % 4], players[(i + 1) % 4] ], players[i % 4] ) for i in range(6) ]
+        with mock.patch('elo.queue.async_task') as async_task, executing_on_commit(self):
+            for line_up, winner in line_ups:
+                game = TestGlicko2Game.objects.create()
+                game.between.set(line_up)
+                game.finish(winner)
+        async_task.assert_not_called()
+        self.assertFalse(TestGlicko2Game.PROCESS_ASYNC)
+        self.assertTrue(TestGame.PROCESS_ASYNC)
+
+        for process in (
+            lambda: TestGlicko2Game.process_pending_games(chunk_size=2),
+            lambda: TestGlicko2Game.objects.earliest('pk').update_elos(),
+        ):
+            with self.assertRaisesMessage(ValueError, 'use process_rating_period'):
+                process()
+        self.assertFalse(TestGlicko2Game.objects.filter(processed=True).exists())
+
+        expected = TestGlicko2Player.rating_system().rate([ (list(line_up), winner) for line_up, winner in line_ups ])
+        self.assertEqual(TestGlicko2Game.process_rating_period(), 6)
+        stored = { player.pk: player.elo for player in TestGlicko2Player.objects.all() }
+        for _, player, _, elo_after in expected:
+            self.assertAlmostEqual(stored[player.pk], elo_after)
+
+class PredictionTest(TestCase):
+
+    def setUp(self):
+        self.players = create_players(5)
+        for player, elo in zip(self.players, [ 1000, 1200, 1450, 1800, 3500 ]):
+            player.elo = elo
+        TestPlayer.objects.bulk_update(self.players, ['elo'])
+
+    def test_expectation_table_matches_curve(self):
+        differences = np.linspace(-2000, 2000, 1234)
+        np.testing.assert_allclose(
+            ExpectationTable.for_model(TestPlayer)(differences),
+            1.0 / ( 1.0 + 10 ** (differences / TestPlayer.DIVISOR) ),
+            atol=1e-5,
+        )
+        self.assertIs(ExpectationTable.for_model(TestPlayer), ExpectationTable.for_model(TestPlayer))
+
+    def test_expected_scores_match_win_probability_in_one_query(self):
+        a, b, c, d, e = self.players
+        groups = [ [a, b], [b, a], [c, d, e], [a, e], [e, b, c, d, a] ]
+
+        with self.assertNumQueries(1):
+            expected_scores = TestPlayer.expected_scores([ [ player.pk for player in group ] for group in groups ])
+
+        for group, scores in zip(groups, expected_scores):
+            self.assertEqual(len(scores), len(group))
+            for player, score in zip(group, scores):
+                self.assertAlmostEqual(score, get_win_probability(player, *group), delta=1e-5)
+
+    def test_expected_scores_reject_invalid_groups(self):
+        a, b, *_ = self.players
+        with self.assertRaises(ValueError):
+            TestPlayer.expected_scores([ [a.pk] ])
+        with self.assertRaises(ValueError):
+            TestPlayer.expected_scores([ [a.pk, b.pk + 1000] ])
+
+    def test_predict_view(self):
+        a, b, c, *_ = self.players
+        groups = [ [a.pk, b.pk], [a.pk, b.pk, c.pk] ]
+        response = self.client.post(
+            reverse('elo_predict'), { 'model': 'elo.TestPlayer', 'groups': groups }, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), { 'expected_scores': TestPlayer.expected_scores(groups) })
+
+        for body in [ { 'model': 'elo.TestGame', 'groups': groups }, { 'model': 'elo.TestPlayer' }, { 'model': 'elo.TestPlayer', 'groups': [ [a.pk] ] } ]:
+            response = self.client.post(reverse('elo_predict'), body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('elo_predict')).status_code, 405)
+
+class DecayTest(TestCase):
+
+    def setUp(self):
+        assert TestPlayer.DECAY_HALF_LIFE is not None
+        self.now = timezone.now()
+        self.inactive = self.now - TestPlayer.DECAY_GRACE_PERIOD - TestPlayer.DECAY_HALF_LIFE
+
+    def test_effective_elo(self):
+        player = TestPlayer(elo=1600)
+        self.assertEqual(player.effective_elo(self.now), 1600)
+        player.last_played = self.now - TestPlayer.DECAY_GRACE_PERIOD
+        self.assertEqual(player.effective_elo(self.now), 1600)
+        player.last_played = self.inactive
+        self.assertAlmostEqual(player.effective_elo(self.now), 1400)
+        player.elo = 800
+        self.assertAlmostEqual(player.effective_elo(self.now), 1000)
+
+    def test_effective_elo_expression_matches_python(self):
+        players = create_players(4)
+        for player, days in zip(players, [ None, 10, 100, 1000 ]):
+            player.elo = 1700
+            player.last_played = None if days is None else self.now - timedelta(days=days)
+        TestPlayer.objects.bulk_update(players, ['elo', 'last_played'])
+
+        effective = dict(
+            TestPlayer.objects.annotate(current_elo=TestPlayer.effective_elo_expression(self.now)).values_list('pk', 'current_elo')
+        )
+
+        for player in players:
+            self.assertAlmostEqual(effective[player.pk], player.effective_elo(self.now), places=3)
+        self.assertLess(effective[players[3].pk], effective[players[2].pk])
+        self.assertEqual(TestPlayer.objects.filter(elo=1700).count(), 4)
+
+    def test_decay_is_written_back_when_playing(self):
+        a, b = create_players(2)
+        TestPlayer.objects.filter(pk=a.pk).update(elo=1600, last_played=self.inactive)
+        game, = create_games(( [a, b], b ))
+
+        update_elos_after_game(game)
+
+        a.refresh_from_db()
+        change = TestGame.RatingChangeModel.objects.get(player=a)
+        self.assertAlmostEqual(change.elo_before, 1400)
+        self.assertLess(a.elo, change.elo_before)
+        self.assertEqual(a.last_played, game.created)
+        self.assertEqual(TestPlayer.objects.get(pk=b.pk).last_played, game.created)
+
+    def test_older_games_do_not_move_last_played_back(self):
+        a, b = create_players(2)
+        TestPlayer.objects.filter(pk=a.pk).update(elo=1600, last_played=self.now)
+        game, = create_games(( [a, b], b ))
+        TestGame.objects.filter(pk=game.pk).update(created=self.inactive)
+
+        TestGame.process_pending_games()
+
+        a.refresh_from_db()
+        self.assertEqual(TestGame.RatingChangeModel.objects.get(player=a).elo_before, 1600)
+        self.assertEqual(a.last_played, self.now)
+        self.assertEqual(TestPlayer.objects.get(pk=b.pk).last_played, self.inactive)
+
+    def test_replay_matches_decayed_processing(self):
+        players, games = create_games_from_stream(6, generate_games(6, 60, random.Random(6), draw_rate=0.1))
+        for index, game in enumerate(games):
+            game.created = self.now + timedelta(days=20 * index)
+        TestGame.objects.bulk_update(games, ['created'])
+        TestGame.process_pending_games()
+        participant_ids = { game.pk: sorted(game.between.values_list('pk', flat=True)) for game in games }
+
+        ratings, _, last_games = replay_games(
+            [ (game.pk, participant_ids[game.pk], game.winner_id, game.created.timestamp()) for game in games ],
+            RatingConstants.of(TestPlayer),
+        )
+
+        for player in TestPlayer.objects.filter(pk__in=[ p.pk for p in players ]):
+            self.assertAlmostEqual(ratings[player.pk], player.elo, places=6)
+            self.assertEqual(TestGame.objects.get(pk=last_games[player.pk]).created, player.last_played)
+        self.assertNotEqual(ratings, dict(replay_games(
+            [ (game.pk, participant_ids[game.pk], game.winner_id, 0.0) for game in games ],
+            RatingConstants.of(TestPlayer),
+        )[0]))
@@ -1,3 +1,27 @@
-from django.shortcuts import render
+import json
 
-# Create your views here.
+from django.http import HttpRequest, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from elo.models import PlayerBase
+from utils.django import get_submodel
+
+
+@csrf_exempt
+@require_POST
+def predict(request: HttpRequest):
+    """
+    Expected scores for many groups (pairs or more) of players at once.
+
+    Expects `{"model": "<app_label>.<PlayerModel>", "groups": [[<player id>, ...], ...]}`
+    and responds with `{"expected_scores": [[<expected score>, ...], ...]}` in the same shape.
+    """
+    try:
+        data = json.loads(request.body)
+        PlayerModel = get_submodel(data['model'], PlayerBase)
+        groups = [ [ int(player_id) for player_id in group ] for group in data['groups'] ]
+        expected_scores = PlayerModel.expected_scores(groups)
+    except (AttributeError, KeyError, LookupError, TypeError, ValueError) as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    return JsonResponse({'expected_scores': expected_scores})
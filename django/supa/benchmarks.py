@@ -0,0 +1,120 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Literal
+
+from unfindables.views import supabase_webhook
+from utils.json import dumps
+
+from django.test import RequestFactory
+
+from .receiver import Message, Receive, Scope, Send, WebhookReceiver
+from .types import WebhookEvent
+
+ReceiverPath = Literal['legacy', 'receiver']
+
+
+@dataclass
+class ReceiverBenchmarkResult:
+    path: ReceiverPath
+    events: int
+    batch_size: int
+    requests: int
+    seconds: float
+    events_per_second: float
+
+
+def generate_events(count: int, id_prefix = 'event') -> list[WebhookEvent]:
+    return [
+        {
+            'id': f'{id_prefix}-{i}',
+            'type': 'INSERT',
+            'table': 'unfindables_websearch',
+            'schema': 'public',
+            'record': {
+                'id': i, 'query': f'query {i}', 'owner_id': None,
+                'created_at': '2025-04-10T19:50:00+00:00', 'updated_at': '2025-04-10T19:50:00+00:00',
+            },
+            'old_record': None,
+        }
+        for i in range(count)
+    ]
+
+@contextmanager
+def discarded_log_output():
+    """
+    Points the root logger's stream handlers at /dev/null, so that log records are still formatted and written
+    (which is part of what is measured) without flooding the terminal.
+    """
+    handlers = [ handler for handler in logging.getLogger().handlers if isinstance(handler, logging.StreamHandler) ]
+    with open(os.devnull, 'w') as devnull:
+        streams = [ handler.setStream(devnull) for handler in handlers ] # pyright: ignore[reportUnknownMemberType]
+        try:
+            yield
+        finally:
+            for handler, stream in zip(handlers, streams):
+                handler.setStream(stream) # pyright: ignore[reportUnknownMemberType]
+
+async def not_found(scope: Scope, receive: Receive, send: Send):
+    raise LookupError(scope['path'])
+
+async def post(app: WebhookReceiver, body: bytes):
+    async def receive() -> Message:
+        return { 'type': 'http.request', 'body': body, 'more_body': False }
+
+    async def send(message: Message):
+        if message['type'] == 'http.response.start' and message['status'] != 202:
+            raise AssertionError(f'Unexpected status {message["status"]}')
+
+    await app({ 'type': 'http', 'method': 'POST', 'path': WebhookReceiver.PATH }, receive, send)
+
+def run_receiver_benchmark(path: ReceiverPath, events: list[WebhookEvent], batch_size = 1, log_every = 100):
+    """
+    Times receiving `events`, posted one per request to the legacy `supabase_webhook` view (called directly,
+    i.e. without middleware, which flatters it), or in batches of `batch_size` to the ASGI `WebhookReceiver`.
+    Request bodies are serialized beforehand and not timed. Events get fresh ids, so they aren't deduplicated
+    against those of earlier runs.
+    """
+    run_id = uuid.uuid4().hex
+    events = [ { **event, 'id': f'{run_id}-{i}' } for i, event in enumerate(events) ]
+    if path == 'legacy':
+        factory = RequestFactory()
+        requests = [
+            factory.post('/api/webhooks/supabase', json.dumps(event), content_type='application/json')
+            for event in events
+        ]
+        with discarded_log_output():
+            start = perf_counter()
+            for request in requests:
+                supabase_webhook(request)
+            seconds = perf_counter() - start
+        batch_size = 1
+    else:
+        receiver = WebhookReceiver(not_found, log_every=log_every)
+        bodies = [
+            dumps(events[i] if batch_size == 1 else events[i:i + batch_size])
+            for i in range(0, len(events), batch_size)
+        ]
+        requests = bodies
+
+        async def run():
+            start = perf_counter()
+            for body in bodies:
+                await post(receiver, body)
+            return perf_counter() - start
+
+        with discarded_log_output():
+            seconds = asyncio.run(run())
+    return ReceiverBenchmarkResult(
+        path=path,
+        events=len(events),
+        batch_size=batch_size,
+        requests=len(requests),
+        seconds=seconds,
+        events_per_second=len(events) / seconds,
+    )
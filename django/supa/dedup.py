@@ -0,0 +1,130 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from functools import cache
+from time import monotonic
+
+from asgiref.sync import sync_to_async
+from redis.exceptions import RedisError
+
+from utils.logging import warning
+from utils.redis import get_client
+
+from .types import WebhookEvent
+
+
+def event_id(event: WebhookEvent):
+    """
+    The event's own `id` or, for payloads without one (as sent by `supabase_functions.http_request`),
+    a hash of its content, which also matches a later identical change to the same row within the TTL.
+    """
+    return event.get('id') or f'sha1:{hashlib.sha1(json.dumps(event, sort_keys=True).encode()).hexdigest()}'
+
+class Deduplicator:
+    """
+    Drops events that were already received, by id: first from an in-process LRU of up to `max_size` ids,
+    then, for ids not found there, with one Redis `SET NX` per id (pipelined) shared by all processes.
+    Ids are remembered for `ttl` seconds. If Redis is unavailable, events that miss the local tier are let through.
+    """
+
+    KEY_PREFIX = 'supa:event:'
+
+    def __init__(self, ttl = 3600, max_size = 100_000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.seen: OrderedDict[str, float] = OrderedDict()
+        """Expiry (monotonic) of each id, least recently seen first"""
+        self.lock = threading.Lock()
+        self.checked = 0
+        self.local_hits = 0
+        self.remote_hits = 0
+
+    def remember(self, ids: list[str]):
+        expiry = monotonic() + self.ttl
+        with self.lock:
+            for id in ids:
+                self.seen[id] = expiry
+                self.seen.move_to_end(id)
+            while len(self.seen) > self.max_size:
+                self.seen.popitem(last=False)
+
+    def filter_local(self, events: list[WebhookEvent]):
+        """
+        Drops the events found in the local tier, or earlier in `events`, without any I/O.
+        """
+        now = monotonic()
+        unique = list({ event_id(event): event for event in events }.values())
+        new: list[WebhookEvent] = []
+        with self.lock:
+            self.checked += len(events)
+            self.local_hits += len(events) - len(unique)
+            for event in unique:
+                id = event_id(event)
+                if self.seen.get(id, 0) > now:
+                    self.seen.move_to_end(id)
+                    self.local_hits += 1
+                else:
+                    new.append(event)
+        return new
+
+    def filter_remote(self, events: list[WebhookEvent]):
+        """
+        Drops the events whose ids are already in Redis, and adds the others. All ids end up in the local tier.
+        """
+        if not events:
+            return events
+        ids = [ event_id(event) for event in events ]
+        added: list[bool | None]
+        try:
+            pipeline = get_client().pipeline(transaction=False)
+            for id in ids:
+                pipeline.set(f'{self.KEY_PREFIX}{id}', 1, nx=True, ex=self.ttl)
+            added = pipeline.execute()
+        except RedisError as e:
+            warning(f'Could not check event ids in Redis, skipping deduplication: {e}')
+            added = [ True ] * len(events)
+        self.remember(ids)
+        with self.lock:
+            self.remote_hits += added.count(None)
+        return [ event for event, is_new in zip(events, added) if is_new ]
+
+    def filter(self, events: list[WebhookEvent]):
+        """
+        Drops duplicates, remembering the ids of the events returned.
+        """
+        return self.filter_remote(self.filter_local(events))
+
+    async def afilter(self, events: list[WebhookEvent]):
+        events = self.filter_local(events)
+        return await sync_to_async(self.filter_remote, thread_sensitive=False)(events) if events else events
+
+    def forget(self, events: list[WebhookEvent]):
+        """
+        Forgets events that were let through but then not handled (e.g. rejected for backpressure),
+        so that their redelivery isn't dropped.
+        """
+        ids = [ event_id(event) for event in events ]
+        with self.lock:
+            for id in ids:
+                self.seen.pop(id, None)
+        try:
+            if ids:
+                get_client().delete(*( f'{self.KEY_PREFIX}{id}' for id in ids ))
+        except RedisError as e:
+            warning(f'Could not forget event ids in Redis: {e}')
+
+    def stats(self):
+        duplicates = self.local_hits + self.remote_hits
+        return {
+            'checked': self.checked,
+            'duplicates': duplicates,
+            'local_hits': self.local_hits,
+            'remote_hits': self.remote_hits,
+            'hit_rate': duplicates / self.checked if self.checked else 0.0,
+            'size': len(self.seen),
+        }
+
+@cache
+def get_deduplicator():
+    return Deduplicator()
@@ -0,0 +1,233 @@
+import threading
+import zlib
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from time import monotonic
+from typing import Any, Callable, Iterable
+
+from asgiref.sync import sync_to_async
+from django_q.brokers import get_broker # pyright: ignore[reportMissingTypeStubs]
+from django_q.tasks import async_task # pyright: ignore[reportMissingTypeStubs]
+
+from utils.logging import debug, error
+
+from django.conf import settings
+from django.db import close_old_connections, models
+
+from .types import TriggerEvent, WebhookEvent
+
+
+EventHandler = Callable[[WebhookEvent], None]
+EventKey = tuple[str, str, TriggerEvent]
+"""Schema, table and operation"""
+
+handlers: defaultdict[EventKey, list[EventHandler]] = defaultdict(list)
+
+def event_key(event: WebhookEvent) -> EventKey:
+    return (event['schema'], event['table'], event['type'])
+
+def handled(events: Iterable[WebhookEvent]):
+    return [ event for event in events if event_key(event) in handlers ]
+
+def on_event(Model: type[models.Model], *events: TriggerEvent, schema = 'public'):
+    """
+    Registers the decorated function as a handler of `Model`'s row changes (default: all operations).
+    """
+    def decorator(handler: EventHandler):
+        for event in events or ('INSERT', 'DELETE', 'UPDATE'):
+            handlers[(schema, Model._meta.db_table, event)].append(handler)
+        return handler
+    return decorator
+
+def dispatch(event: WebhookEvent):
+    """
+    Runs the handlers registered for `event`, in registration order, logging (rather than raising) their errors.
+    Returns the number of handlers run.
+    """
+    event_handlers = handlers.get(event_key(event), [])
+    if not event_handlers:
+        debug(f'No handlers for {event_key(event)}')
+    for handler in event_handlers:
+        try:
+            handler(event)
+        except Exception as e:
+            error(f'Error in {handler.__qualname__} handling {event_key(event)}: {e!r}')
+    return len(event_handlers)
+
+def dispatch_all(events: list[WebhookEvent]):
+    for event in events:
+        dispatch(event)
+
+class EventExecutor:
+    """
+    Runs the handlers of received events outside of the request that delivered them (see `get_event_executor`).
+    """
+
+    def submit(self, events: list[WebhookEvent]) -> bool:
+        """
+        Schedules the handlers of `events`, in order, unless there is no room for them, in which case
+        none are scheduled and the sender should retry later. Events without handlers are skipped.
+        """
+        ...
+
+    async def asubmit(self, events: list[WebhookEvent]):
+        return await sync_to_async(self.submit, thread_sensitive=False)(events)
+
+    def stats(self) -> dict[str, Any]:
+        return {}
+
+class ThreadPoolEventExecutor(EventExecutor):
+    """
+    Runs handlers on a pool of `workers` threads, with room for `max_pending` events waiting or being handled.
+    Events of one submission are handled in order, but those of different submissions may not be.
+    """
+
+    def __init__(self, workers = 4, max_pending = 1000):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='supa-events')
+        self.max_pending = max_pending
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def submit(self, events: list[WebhookEvent]):
+        if not (events := handled(events)):
+            return True
+        with self.lock:
+            if self.pending + len(events) > self.max_pending:
+                return False
+            self.pending += len(events)
+        self.executor.submit(self.run, events)
+        return True
+
+    async def asubmit(self, events: list[WebhookEvent]):
+        return self.submit(events) # never blocks
+
+    def run(self, events: list[WebhookEvent]):
+        try:
+            dispatch_all(events)
+        finally:
+            with self.lock:
+                self.pending -= len(events)
+            close_old_connections()
+
+    def stats(self):
+        return { 'pending': self.pending }
+
+def shard_key(event: WebhookEvent):
+    """
+    Table and primary key of the row an event is about, or just the table for statement-level events,
+    which are thus handled in order with each other (but not with the row-level events of the same rows).
+    """
+    if 'records' in event or 'old_records' in event:
+        return event['table']
+    return f"{event['table']}:{(event.get('record') or event.get('old_record') or {}).get('id')}"
+
+class Shard:
+    """
+    A worker thread handling the events queued for it one at a time, first in, first out.
+    """
+
+    def __init__(self, index: int):
+        self.queue: deque[tuple[float, WebhookEvent]] = deque()
+        self.condition = threading.Condition()
+        self.handled = 0
+        self.max_lag = 0.0
+        self.thread = threading.Thread(target=self.run, name=f'supa-events-{index}', daemon=True)
+        self.thread.start()
+
+    def put(self, events: list[WebhookEvent]):
+        now = monotonic()
+        with self.condition:
+            self.queue.extend((now, event) for event in events)
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue:
+                    close_old_connections()
+                    self.condition.wait()
+                queued_at, event = self.queue.popleft()
+            self.max_lag = max(self.max_lag, monotonic() - queued_at)
+            dispatch(event)
+            self.handled += 1
+
+    def stats(self):
+        with self.condition:
+            depth = len(self.queue)
+            oldest = self.queue[0][0] if self.queue else None
+        return {
+            'depth': depth,
+            'handled': self.handled,
+            'lag': monotonic() - oldest if oldest else 0.0,
+            'max_lag': self.max_lag,
+        }
+
+class ShardedEventExecutor(EventExecutor):
+    """
+    Spreads events over `shards` worker threads by a stable hash of their row (see `shard_key`), so that events
+    of different rows are handled in parallel while those of the same row are handled in the order received.
+    Each shard has room for `max_pending / shards` queued events; a submission that doesn't fit is refused whole.
+    """
+
+    def __init__(self, shards = 4, max_pending = 1000):
+        self.shards = [ Shard(index) for index in range(shards) ]
+        self.capacity = max(1, max_pending // shards)
+        self.lock = threading.Lock()
+
+    def shard(self, event: WebhookEvent):
+        return self.shards[zlib.crc32(shard_key(event).encode()) % len(self.shards)]
+
+    def submit(self, events: list[WebhookEvent]):
+        events_by_shard: defaultdict[Shard, list[WebhookEvent]] = defaultdict(list)
+        for event in handled(events):
+            events_by_shard[self.shard(event)].append(event)
+        with self.lock: # so that submissions are queued in the same order on all shards
+            if any(len(shard.queue) + len(shard_events) > self.capacity for shard, shard_events in events_by_shard.items()):
+                return False
+            for shard, shard_events in events_by_shard.items():
+                shard.put(shard_events)
+        return True
+
+    async def asubmit(self, events: list[WebhookEvent]):
+        return self.submit(events) # never blocks
+
+    def stats(self):
+        """
+        Per shard: queued events, events handled, how long the oldest queued event has waited (`lag`),
+        and the longest any event has waited (`max_lag`), in seconds.
+        """
+        return { 'shards': [ shard.stats() for shard in self.shards ] }
+
+class QueueEventExecutor(EventExecutor):
+    """
+    Hands handlers over to the Django Q cluster as one task per submission, while its queue is shorter than `max_pending`.
+    """
+
+    def __init__(self, max_pending = 1000):
+        self.max_pending = max_pending
+
+    def submit(self, events: list[WebhookEvent]):
+        if not (events := handled(events)):
+            return True
+        if (get_broker().queue_size() or 0) >= self.max_pending:
+            return False
+        async_task(dispatch_all, events)
+        return True
+
+    def stats(self):
+        return { 'queued': get_broker().queue_size() }
+
+@cache
+def get_event_executor() -> EventExecutor:
+    """
+    The executor configured by `settings.SUPA_EVENT_EXECUTOR`: shard threads keeping each row's events in order
+    (`'sharded'`, the default), a plain thread pool (`'threads'`), or the Django Q cluster (`'django_q'`),
+    which survives restarts but costs a round trip to the broker per request and doesn't keep events in order.
+    """
+    executor = getattr(settings, 'SUPA_EVENT_EXECUTOR', 'sharded')
+    if executor == 'django_q':
+        return QueueEventExecutor(settings.Q_CLUSTER.get('queue_limit', 1000))
+    if executor == 'threads':
+        return ThreadPoolEventExecutor()
+    return ShardedEventExecutor()
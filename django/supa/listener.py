@@ -0,0 +1,64 @@
+import asyncio
+from typing import Iterable
+
+import psycopg
+from psycopg import sql
+from psycopg.conninfo import make_conninfo
+
+from asgiref.sync import sync_to_async
+
+from utils.logging import info, warning
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .events import dispatch
+from .receiver import parse_events
+
+
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 30.0
+
+def conninfo(using: str = DEFAULT_DB_ALIAS):
+    settings_dict = connections[using].settings_dict
+    return make_conninfo(**{ key: value for key, value in {
+        'dbname': settings_dict['NAME'],
+        'user': settings_dict['USER'],
+        'password': settings_dict['PASSWORD'],
+        'host': settings_dict['HOST'],
+        'port': settings_dict['PORT'],
+    }.items() if value })
+
+def handle_notification(payload: str):
+    """
+    Dispatches the event in a notification's payload, logging (rather than raising) if there isn't one,
+    so that a malformed notification doesn't stop the listener.
+    """
+    try:
+        events = parse_events(payload.encode())
+    except ValueError as e:
+        warning(f'Skipping malformed notification ({e}): {payload[:200]}')
+        return
+    for event in events:
+        dispatch(event)
+
+async def listen(channels: Iterable[str], using: str = DEFAULT_DB_ALIAS):
+    """
+    Listens to `channels` (see `supa_notify` triggers) on a dedicated async connection, dispatching each notification
+    to the registered handlers (see `supa.events`), one at a time and in the order they were committed.
+    Handlers run in a worker thread, so they can use the ORM. Reconnects (with backoff) when the connection drops.
+    """
+    channels = sorted(channels)
+    delay = RECONNECT_DELAY
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(conninfo(using), autocommit=True) as connection:
+                for channel in channels:
+                    await connection.execute(sql.SQL('LISTEN {}').format(sql.Identifier(channel)))
+                info(f'Listening to {", ".join(channels)}')
+                delay = RECONNECT_DELAY
+                async for notification in connection.notifies():
+                    await sync_to_async(handle_notification)(notification.payload)
+        except psycopg.OperationalError as e:
+            warning(f'Lost the listener connection ({e}), reconnecting in {delay}s')
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
@@ -0,0 +1,46 @@
+import json
+import platform
+from dataclasses import asdict
+from typing import Any
+
+from supa.benchmarks import ReceiverBenchmarkResult, generate_events, run_receiver_benchmark
+from utils.collections import empty_list
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks receiving webhook events with the legacy Supabase webhook view and the ASGI receiver, '
+        'and optionally writes the results as JSON for comparison between runs'
+    )
+
+    def add_arguments(self, parser: CommandParser):
+        parser.add_argument('--events', type=int, default=10_000)
+        parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100],
+            help='Events per request for the receiver (the legacy view takes one)')
+        parser.add_argument('--log-every', type=int, default=100, help='Receiver log sampling')
+        parser.add_argument('--output', help='Path of the JSON file to write the results to')
+
+    def handle(self, *args: Any, **options: Any):
+        events = generate_events(options['events'])
+        results = empty_list(ReceiverBenchmarkResult)
+        results.append(run_receiver_benchmark('legacy', events))
+        for batch_size in options['batch_sizes']:
+            results.append(run_receiver_benchmark('receiver', events, batch_size, options['log_every']))
+        for result in results:
+            self.stdout.write(
+                f'{result.path:>8} | {result.events:>9} events | {result.batch_size:>5}/request | '
+                f'{result.events_per_second:>12,.0f} events/s | '
+                f'{result.events_per_second / results[0].events_per_second:>6.1f}x'
+            )
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({
+                    'created': timezone.now().isoformat(),
+                    'python': platform.python_version(),
+                    'options': { key: options[key] for key in ('events', 'batch_sizes', 'log_every') },
+                    'results': [ asdict(result) for result in results ],
+                }, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} result(s) to {options["output"]}'))
@@ -0,0 +1,27 @@
+import time
+from typing import Any
+
+from supa.outbox import BATCH_SIZE, deliver_outbox, schedule_delivery
+
+from django.core.management.base import BaseCommand, CommandParser
+
+
+class Command(BaseCommand):
+    help = 'Delivers pending outbox webhook events, once or every --interval seconds'
+
+    def add_arguments(self, parser: CommandParser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Events claimed per transaction')
+        parser.add_argument('--interval', type=float, help='Keep delivering, polling every this many seconds')
+        parser.add_argument('--schedule', type=int, metavar='MINUTES', help='Instead, schedule delivery as a Django Q task')
+
+    def handle(self, *args: Any, **options: Any):
+        if options['schedule']:
+            schedule_delivery(options['schedule'])
+            self.stdout.write(self.style.SUCCESS(f'Scheduled outbox delivery every {options["schedule"]} minute(s)'))
+            return
+        while True:
+            delivered = deliver_outbox(options['batch_size'], time_budget=None)
+            self.stdout.write(f'Delivered {delivered} outbox event(s)')
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,23 @@
+import asyncio
+from typing import Any
+
+from supa.listener import listen
+from supa import webhooks
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+
+class Command(BaseCommand):
+    help = 'Dispatches row changes from notify webhooks to the in-process event handlers, until interrupted'
+
+    def add_arguments(self, parser: CommandParser):
+        parser.add_argument(
+            'targets', nargs='*', help='Webhook target names to listen to (default: all declared notify webhooks)'
+        )
+        parser.add_argument('--database', default='default', help='Database to listen on')
+
+    def handle(self, *args: Any, **options: Any):
+        channels = { webhooks.notify_channel(target) for target in options['targets'] } or webhooks.notify_channels
+        if not channels:
+            raise CommandError('No notify webhooks are declared, nothing to listen to')
+        asyncio.run(listen(channels, options['database']))
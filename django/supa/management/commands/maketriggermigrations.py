@@ -0,0 +1,55 @@
+import sys
+from typing import Any
+
+from supa.models import Trigger
+from supa.operations import migrated_triggers, trigger_operations
+from utils.migrations import last_migration, write_migration
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandParser
+from django.db.migrations import Migration
+from django.db.migrations.loader import MigrationLoader
+
+
+class Command(BaseCommand):
+    help = (
+        'Writes a supa migration creating, recreating or dropping database triggers so that, once migrated, '
+        'they match the ones declared with @trigger/@webhook'
+    )
+
+    def add_arguments(self, parser: CommandParser):
+        parser.add_argument('--name', default='triggers', help='Migration name (after the number)')
+        parser.add_argument('--dry-run', action='store_true', help='Only show the operations')
+        parser.add_argument('--check', action='store_true', help='Exit with a non-zero status if a migration is missing')
+
+    def handle(self, *args: Any, **options: Any):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        operations = trigger_operations(Trigger.map, migrated_triggers(loader))
+        if not operations:
+            self.stdout.write('No trigger changes detected')
+            return
+        for operation in operations:
+            self.stdout.write(f'  - {operation.describe()}')
+        if options['check']:
+            sys.exit(1)
+        if options['dry_run']:
+            return
+
+        last = last_migration('supa')
+        migration = Migration(f'{last.index + 1:04d}_{options["name"]}', 'supa')
+        migration.operations = [ *operations ]
+        app_labels = {
+            Model._meta.db_table: Model._meta.app_label for Model in apps.get_models()
+        }
+        migration.dependencies = sorted({
+            ( 'supa', last.name ),
+            *(
+                leaf
+                for operation in operations
+                for trigger_info in operation.trigger_infos
+                if trigger_info['table_name'] in app_labels
+                for leaf in loader.graph.leaf_nodes(app_labels[trigger_info['table_name']])
+            ),
+        })
+        path = write_migration(migration)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {path}'))
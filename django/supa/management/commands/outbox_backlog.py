@@ -0,0 +1,23 @@
+from typing import Any
+
+from supa.models import OutboxEvent
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Shows the outbox webhook queue depth and delivery lag per target'
+
+    def handle(self, *args: Any, **options: Any):
+        now = timezone.now()
+        backlog = OutboxEvent.backlog()
+        for target in backlog:
+            lag = now - target['oldest'] if target['oldest'] else None
+            self.stdout.write(
+                f'{target["target"]}: {target["pending"]} pending event(s) ({target["retrying"]} retrying), '
+                f'{target["dead"]} dead, '
+                f'lag {lag or "-"}'
+            )
+        if not backlog:
+            self.stdout.write('Outbox is empty')
@@ -0,0 +1,36 @@
+import sys
+from typing import Any
+
+from supa.models import Trigger
+from supa.operations import migrated_triggers
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the database triggers with the ones created by the migrations (see maketriggermigrations), '
+        'exiting with a non-zero status if any drifted, or recreating them with --fix'
+    )
+
+    def add_arguments(self, parser: CommandParser):
+        parser.add_argument('--fix', action='store_true', help='Recreate missing or outdated triggers as migrated')
+
+    def handle(self, *args: Any, **options: Any):
+        loader = MigrationLoader(connection)
+        if set(loader.graph.nodes) - set(loader.applied_migrations):
+            raise CommandError('There are unapplied migrations, run migrate instead')
+        migrated = migrated_triggers(loader)
+        outdated = Trigger.outdated_triggers(migrated, Trigger.current_triggers())
+        if not outdated:
+            self.stdout.write('Triggers match the migrations')
+            return
+        for trigger_name in outdated:
+            self.stdout.write(f'  - {trigger_name} is missing or differs from its migration')
+        if not options['fix']:
+            sys.exit(1)
+        if not Trigger.update_triggers(migrated):
+            raise CommandError('Some triggers could not be recreated, see the warnings above')
+        self.stdout.write(self.style.SUCCESS('Recreated triggers'))
@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-18 20:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supa', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TriggerFingerprint',
+            fields=[
+                ('schema', models.CharField(max_length=63, primary_key=True, serialize=False)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+
+import supa.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supa', '0002_triggerfingerprint'),
+    ]
+
+    operations = [
+        # Webhook for statement-level triggers (see `WebhookDecorator`): posts all rows affected by a statement,
+        # read from the `new_rows`/`old_rows` transition tables, in a single request.
+        # Arguments: target URL and timeout in milliseconds.
+        supa.operations.PostgresRunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION public.supa_statement_webhook() RETURNS trigger
+                LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+                DECLARE
+                    records jsonb := '[]';
+                    old_records jsonb := '[]';
+                BEGIN
+                    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                        SELECT coalesce(jsonb_agg(to_jsonb(r)), '[]') INTO records FROM new_rows r;
+                    END IF;
+                    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                        SELECT coalesce(jsonb_agg(to_jsonb(r)), '[]') INTO old_records FROM old_rows r;
+                    END IF;
+                    IF records = '[]' AND old_records = '[]' THEN
+                        RETURN NULL;
+                    END IF;
+                    PERFORM net.http_post(
+                        url := TG_ARGV[0],
+                        body := jsonb_build_object(
+                            'type', TG_OP,
+                            'table', TG_TABLE_NAME,
+                            'schema', TG_TABLE_SCHEMA,
+                            'records', records,
+                            'old_records', old_records
+                        ),
+                        headers := '{"Content-Type": "application/json"}',
+                        timeout_milliseconds := TG_ARGV[1]::integer
+                    );
+                    RETURN NULL;
+                END
+                $$
+            """,
+            reverse_sql='DROP FUNCTION IF EXISTS public.supa_statement_webhook()',
+        ),
+    ]
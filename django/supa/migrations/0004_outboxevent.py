@@ -0,0 +1,54 @@
+# Generated by Django 5.2 on 2026-10-18 20:36
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+import supa.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supa', '0003_statement_webhook_function'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target', models.CharField(max_length=255)),
+                ('schema_name', models.CharField(max_length=63)),
+                ('table_name', models.CharField(max_length=63)),
+                ('type', models.CharField(max_length=6)),
+                ('record', models.JSONField(null=True)),
+                ('old_record', models.JSONField(null=True)),
+                ('created', models.DateTimeField(db_default=django.db.models.functions.datetime.Now())),
+                ('attempts', models.PositiveIntegerField(db_default=0)),
+                ('next_attempt', models.DateTimeField(db_default=django.db.models.functions.datetime.Now())),
+                ('last_error', models.TextField(null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['next_attempt', 'id'], name='supa_outbox_next_attempt')],
+            },
+        ),
+        # Outbox webhooks (see `WebhookDecorator`): captures the row change for `supa.outbox.deliver_outbox`
+        # instead of making a request inside the transaction. Argument: webhook target name.
+        supa.operations.PostgresRunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION public.supa_outbox_enqueue() RETURNS trigger
+                LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+                BEGIN
+                    INSERT INTO public.supa_outboxevent (target, schema_name, table_name, type, record, old_record)
+                    VALUES (
+                        TG_ARGV[0], TG_TABLE_SCHEMA, TG_TABLE_NAME, TG_OP,
+                        CASE WHEN TG_OP <> 'DELETE' THEN to_jsonb(NEW) END,
+                        CASE WHEN TG_OP <> 'INSERT' THEN to_jsonb(OLD) END
+                    );
+                    RETURN NULL;
+                END
+                $$
+            """,
+            reverse_sql='DROP FUNCTION IF EXISTS public.supa_outbox_enqueue()',
+        ),
+    ]
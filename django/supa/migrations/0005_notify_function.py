@@ -0,0 +1,50 @@
+from django.db import migrations
+
+import supa.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supa', '0004_outboxevent'),
+    ]
+
+    operations = [
+        # Notify webhooks (see `WebhookDecorator`): sends the row change to listeners of a channel
+        # (see `manage.py listen_events`) with `pg_notify`, which delivers it on commit.
+        # Payloads over pg_notify's 8000 byte limit are cut down to the records' ids.
+        # Argument: channel name.
+        supa.operations.PostgresRunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION public.supa_notify() RETURNS trigger
+                LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+                DECLARE
+                    record jsonb := CASE WHEN TG_OP <> 'DELETE' THEN to_jsonb(NEW) END;
+                    old_record jsonb := CASE WHEN TG_OP <> 'INSERT' THEN to_jsonb(OLD) END;
+                    payload text;
+                BEGIN
+                    payload := jsonb_build_object(
+                        'type', TG_OP,
+                        'table', TG_TABLE_NAME,
+                        'schema', TG_TABLE_SCHEMA,
+                        'record', record,
+                        'old_record', old_record
+                    )::text;
+                    IF octet_length(payload) >= 8000 THEN
+                        payload := jsonb_build_object(
+                            'type', TG_OP,
+                            'table', TG_TABLE_NAME,
+                            'schema', TG_TABLE_SCHEMA,
+                            'record', CASE WHEN record IS NOT NULL THEN jsonb_build_object('id', record -> 'id') END,
+                            'old_record', CASE WHEN old_record IS NOT NULL THEN jsonb_build_object('id', old_record -> 'id') END,
+                            'truncated', true
+                        )::text;
+                    END IF;
+                    PERFORM pg_notify(TG_ARGV[0], payload);
+                    RETURN NULL;
+                END
+                $$
+            """,
+            reverse_sql='DROP FUNCTION IF EXISTS public.supa_notify()',
+        ),
+    ]
@@ -0,0 +1,113 @@
+from django.db import migrations
+
+import supa.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supa', '0005_notify_function'),
+    ]
+
+    # Gives every event a stable `id`, generated once when the trigger fires, so that receivers can recognize
+    # retried deliveries (see `supa.dedup`). The new versions only add the `id`, so reverting leaves them in place.
+    operations = [
+        # Webhook for row-level triggers (see `WebhookDecorator`), replacing `supabase_functions.http_request`,
+        # whose payload has no id. Arguments: target URL and timeout in milliseconds.
+        supa.operations.PostgresRunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION public.supa_row_webhook() RETURNS trigger
+                LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+                BEGIN
+                    PERFORM net.http_post(
+                        url := TG_ARGV[0],
+                        body := jsonb_build_object(
+                            'id', gen_random_uuid(),
+                            'type', TG_OP,
+                            'table', TG_TABLE_NAME,
+                            'schema', TG_TABLE_SCHEMA,
+                            'record', CASE WHEN TG_OP <> 'DELETE' THEN to_jsonb(NEW) END,
+                            'old_record', CASE WHEN TG_OP <> 'INSERT' THEN to_jsonb(OLD) END
+                        ),
+                        headers := '{"Content-Type": "application/json"}',
+                        timeout_milliseconds := TG_ARGV[1]::integer
+                    );
+                    RETURN NULL;
+                END
+                $$
+            """,
+            reverse_sql='DROP FUNCTION IF EXISTS public.supa_row_webhook()',
+        ),
+        supa.operations.PostgresRunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION public.supa_statement_webhook() RETURNS trigger
+                LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+                DECLARE
+                    records jsonb := '[]';
+                    old_records jsonb := '[]';
+                BEGIN
+                    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                        SELECT coalesce(jsonb_agg(to_jsonb(r)), '[]') INTO records FROM new_rows r;
+                    END IF;
+                    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                        SELECT coalesce(jsonb_agg(to_jsonb(r)), '[]') INTO old_records FROM old_rows r;
+                    END IF;
+                    IF records = '[]' AND old_records = '[]' THEN
+                        RETURN NULL;
+                    END IF;
+                    PERFORM net.http_post(
+                        url := TG_ARGV[0],
+                        body := jsonb_build_object(
+                            'id', gen_random_uuid(),
+                            'type', TG_OP,
+                            'table', TG_TABLE_NAME,
+                            'schema', TG_TABLE_SCHEMA,
+                            'records', records,
+                            'old_records', old_records
+                        ),
+                        headers := '{"Content-Type": "application/json"}',
+                        timeout_milliseconds := TG_ARGV[1]::integer
+                    );
+                    RETURN NULL;
+                END
+                $$
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        supa.operations.PostgresRunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION public.supa_notify() RETURNS trigger
+                LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+                DECLARE
+                    id uuid := gen_random_uuid();
+                    record jsonb := CASE WHEN TG_OP <> 'DELETE' THEN to_jsonb(NEW) END;
+                    old_record jsonb := CASE WHEN TG_OP <> 'INSERT' THEN to_jsonb(OLD) END;
+                    payload text;
+                BEGIN
+                    payload := jsonb_build_object(
+                        'id', id,
+                        'type', TG_OP,
+                        'table', TG_TABLE_NAME,
+                        'schema', TG_TABLE_SCHEMA,
+                        'record', record,
+                        'old_record', old_record
+                    )::text;
+                    IF octet_length(payload) >= 8000 THEN
+                        payload := jsonb_build_object(
+                            'id', id,
+                            'type', TG_OP,
+                            'table', TG_TABLE_NAME,
+                            'schema', TG_TABLE_SCHEMA,
+                            'record', CASE WHEN record IS NOT NULL THEN jsonb_build_object('id', record -> 'id') END,
+                            'old_record', CASE WHEN old_record IS NOT NULL THEN jsonb_build_object('id', old_record -> 'id') END,
+                            'truncated', true
+                        )::text;
+                    END IF;
+                    PERFORM pg_notify(TG_ARGV[0], payload);
+                    RETURN NULL;
+                END
+                $$
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
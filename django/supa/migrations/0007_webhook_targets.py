@@ -0,0 +1,99 @@
+from django.db import migrations
+
+import supa.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supa', '0006_event_ids'),
+        ('webhooks', '0001_initial'),
+    ]
+
+    # Webhook triggers pass the name of their target rather than its URL, which is looked up when they fire,
+    # so retargeting is a single `webhooks_webhooktarget` row update. The new versions still accept URLs
+    # (as passed by triggers created before), so reverting leaves them in place.
+    operations = [
+        supa.operations.PostgresRunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION public.supa_webhook_url(target text) RETURNS text
+                LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public AS $$
+                    SELECT CASE WHEN target ~ '^https?://' THEN target ELSE (
+                        SELECT url FROM webhooks_webhooktarget WHERE name = target
+                    ) END
+                $$
+            """,
+            reverse_sql='DROP FUNCTION IF EXISTS public.supa_webhook_url(text)',
+        ),
+        supa.operations.PostgresRunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION public.supa_row_webhook() RETURNS trigger
+                LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+                DECLARE
+                    target_url text := supa_webhook_url(TG_ARGV[0]);
+                BEGIN
+                    IF target_url IS NULL THEN
+                        RAISE WARNING 'No webhook target named %', TG_ARGV[0];
+                        RETURN NULL;
+                    END IF;
+                    PERFORM net.http_post(
+                        url := target_url,
+                        body := jsonb_build_object(
+                            'id', gen_random_uuid(),
+                            'type', TG_OP,
+                            'table', TG_TABLE_NAME,
+                            'schema', TG_TABLE_SCHEMA,
+                            'record', CASE WHEN TG_OP <> 'DELETE' THEN to_jsonb(NEW) END,
+                            'old_record', CASE WHEN TG_OP <> 'INSERT' THEN to_jsonb(OLD) END
+                        ),
+                        headers := '{"Content-Type": "application/json"}',
+                        timeout_milliseconds := TG_ARGV[1]::integer
+                    );
+                    RETURN NULL;
+                END
+                $$
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        supa.operations.PostgresRunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION public.supa_statement_webhook() RETURNS trigger
+                LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+                DECLARE
+                    target_url text := supa_webhook_url(TG_ARGV[0]);
+                    records jsonb := '[]';
+                    old_records jsonb := '[]';
+                BEGIN
+                    IF target_url IS NULL THEN
+                        RAISE WARNING 'No webhook target named %', TG_ARGV[0];
+                        RETURN NULL;
+                    END IF;
+                    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                        SELECT coalesce(jsonb_agg(to_jsonb(r)), '[]') INTO records FROM new_rows r;
+                    END IF;
+                    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                        SELECT coalesce(jsonb_agg(to_jsonb(r)), '[]') INTO old_records FROM old_rows r;
+                    END IF;
+                    IF records = '[]' AND old_records = '[]' THEN
+                        RETURN NULL;
+                    END IF;
+                    PERFORM net.http_post(
+                        url := target_url,
+                        body := jsonb_build_object(
+                            'id', gen_random_uuid(),
+                            'type', TG_OP,
+                            'table', TG_TABLE_NAME,
+                            'schema', TG_TABLE_SCHEMA,
+                            'records', records,
+                            'old_records', old_records
+                        ),
+                        headers := '{"Content-Type": "application/json"}',
+                        timeout_milliseconds := TG_ARGV[1]::integer
+                    );
+                    RETURN NULL;
+                END
+                $$
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
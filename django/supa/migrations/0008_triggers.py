@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 21:06
+
+import supa.operations
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supa', '0007_webhook_targets'),
+        ('unfindables', '0001_initial'),
+    ]
+
+    operations = [
+        supa.operations.CreateTrigger(
+            name='unfindables_websearch',
+            trigger_infos=[{'columns': [], 'condition': None, 'event': 'INSERT', 'new_table': None, 'old_table': None, 'orientation': 'ROW', 'statement': "EXECUTE FUNCTION supa_row_webhook('nextjs', '1000')", 'table_name': 'unfindables_websearch', 'timing': 'AFTER'}],
+        ),
+    ]
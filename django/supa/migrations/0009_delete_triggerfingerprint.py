@@ -0,0 +1,16 @@
+# Generated by Django 5.2 on 2026-10-18 21:25
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supa', '0008_triggers'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='TriggerFingerprint',
+        ),
+    ]
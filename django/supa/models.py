@@ -1,3 +1,5 @@
+import json
+import re
 from typing import ClassVar, TypedDict, TypeGuard
 
 from utils.functional import tap
@@ -7,10 +9,14 @@ from utils.typing import none
 
 from django.apps import apps
 from django.core.exceptions import AppRegistryNotReady
-from django.db import connection, models
+from django.db import connection, models, transaction
+from django.db.models import Count, Min, Q
+from django.db.models.functions import Now
 from django.db.utils import ProgrammingError
 
-from .types import TriggerEvent, TriggerTiming
+from utils.postgres import advisory_xact_lock
+
+from .types import TriggerEvent, TriggerOrientation, TriggerTiming, WebhookEvent
 
 
 class PublicTriggerManager(models.Manager['Trigger']):
@@ -27,9 +33,62 @@ class TriggerInfo(TypedDict):
     table_name: str
     timing: TriggerTiming
     statement: str
-    
+    orientation: TriggerOrientation
+    old_table: str | None
+    new_table: str | None
+    """Transition table names (statement-level triggers only)"""
+    columns: list[str]
+    """`UPDATE OF` columns (UPDATE events only; empty for any column)"""
+    condition: str | None
+    """`WHEN` condition, as declared (Postgres normalizes it, so it's read back from the trigger's comment)"""
+
 TriggerMap = dict[TriggerName, list[TriggerInfo]]
 
+# Bits of pg_trigger.tgtype, see src/include/catalog/pg_trigger.h
+TRIGGER_TYPE_ROW = 1 << 0
+TRIGGER_TYPE_BEFORE = 1 << 1
+TRIGGER_TYPE_EVENTS: dict[TriggerEvent, int] = { 'INSERT': 1 << 2, 'DELETE': 1 << 3, 'UPDATE': 1 << 4 }
+
+def parse_trigger_type(tgtype: int) -> tuple[TriggerTiming, TriggerOrientation, list[TriggerEvent]]:
+    return (
+        'BEFORE' if tgtype & TRIGGER_TYPE_BEFORE else 'AFTER',
+        'ROW' if tgtype & TRIGGER_TYPE_ROW else 'STATEMENT',
+        [ event for event, bit in TRIGGER_TYPE_EVENTS.items() if tgtype & bit ],
+    )
+
+def execute_function_sql(function_name: str, arg_count: int, args: bytes):
+    """
+    The `EXECUTE FUNCTION` clause of a trigger, as declared, from its `pg_trigger` function and arguments
+    (`tgargs` holds `tgnargs` NUL-terminated strings).
+    """
+    quoted_args = [ "'{}'".format(arg.decode().replace("'", "''")) for arg in bytes(args).split(b'\0')[:arg_count] ]
+    return f"EXECUTE FUNCTION {function_name}({', '.join(quoted_args)})"
+
+# Transition table names for statement-level triggers, as referenced by their functions
+OLD_TABLE = 'old_rows'
+NEW_TABLE = 'new_rows'
+TRANSITION_TABLES: dict[TriggerEvent, tuple[str | None, str | None]] = {
+    'INSERT': (None, NEW_TABLE),
+    'DELETE': (OLD_TABLE, None),
+    'UPDATE': (OLD_TABLE, NEW_TABLE),
+}
+
+UNAVAILABLE_RECORDS: dict[TriggerEvent, tuple[str, ...]] = {
+    'INSERT': ('OLD',),
+    'DELETE': ('NEW',),
+    'UPDATE': (),
+}
+"""Row variables that row-level trigger conditions can't refer to, per event"""
+
+def trigger_info_key(trigger_info: TriggerInfo):
+    return json.dumps(trigger_info, sort_keys=True)
+
+def changed(*columns: str):
+    """
+    `WHEN` condition for UPDATE row triggers that only fire if any of `columns` actually changed.
+    """
+    return ' OR '.join(f'OLD.{column} IS DISTINCT FROM NEW.{column}' for column in columns)
+
 
 class Trigger(models.Model):
 
@@ -71,13 +130,25 @@ class Trigger(models.Model):
         Model: type[models.Model],
         statement: str,
         trigger_name = none(TriggerName),
+        orientation: TriggerOrientation = 'ROW',
+        columns: tuple[str, ...] = (),
+        condition = none(str),
     ):
-        cls.update_triggers(cls.prepare(timing, events, Model, statement, trigger_name))
+        cls.update_triggers(cls.prepare(timing, events, Model, statement, trigger_name, orientation, columns, condition))
 
     map: ClassVar[TriggerMap] = {}
 
+    LOCK_NAME = 'supa.triggers'
+
     @classmethod
     def update_triggers(cls, map = none(TriggerMap)):
+        """
+        Brings the public triggers in line with `map` (default: `Trigger.map`). Existing triggers are read in one
+        catalog query and diffed in memory; if anything is outdated, the changes are applied in one transaction
+        behind an advisory lock, so concurrently starting processes don't all do (or race on) the same work.
+
+        Returns whether all triggers are now up to date.
+        """
         if not map:
             try:
                 apps.check_apps_ready()
@@ -85,45 +156,113 @@ class Trigger(models.Model):
                 raise AppRegistryNotReady('Cannot update triggers before apps are ready')
             map = cls.map
         debug(f'Updating triggers with {map=}')
-        for trigger_name, trigger_infos in map.items():
-
-            existing_triggers = cls.objects.filter(trigger_name=trigger_name)
-            if existing_triggers.exists():
-                if (
-                    existing_triggers.count() == len(trigger_infos) 
-                    and all(
-                        existing_triggers.filter(**trigger_info).exists()
-                        for trigger_info in trigger_infos
-                    )
-                ):
-                    debug(f'Triggers for {trigger_name} are up to date')
-                    continue
-                info(f'Triggers for {trigger_name} are outdated, deleting existing triggers')
-                existing_triggers[0].drop()
+        if not cls.outdated_triggers(map, cls.current_triggers()):
+            debug('Triggers are up to date')
+            return True
+        complete = True
+        with transaction.atomic():
+            advisory_xact_lock(cls.LOCK_NAME)
+            current = cls.current_triggers() # someone else may have updated them while we waited for the lock
+            for trigger_name in cls.outdated_triggers(map, current):
+                trigger_infos = map[trigger_name]
+                info(f'Triggers for {trigger_name} are outdated or missing, (re)creating them for {trigger_infos=}')
+                try:
+                    with transaction.atomic(), connection.cursor() as cursor:
+                        for table_name in { trigger_info['table_name'] for trigger_info in current.get(trigger_name, []) }:
+                            cursor.execute(cls.drop_sql(trigger_name, table_name))
+                        for sql in cls.creation_statements(trigger_name, trigger_infos):
+                            cursor.execute(sql)
+                except ProgrammingError as e:
+                    warning(f'Error creating trigger {trigger_name}, skipping: {e}')
+                    complete = False
+        return complete
 
-            try:
-                trigger_info = trigger_infos[0]
-                events_string = ' OR '.join([
-                    trigger_info['event'] for trigger_info in trigger_infos
-                ])
-                info(f'Creating trigger(s) {trigger_name} for {trigger_info=}')
-                with connection.cursor() as cursor:
-                    cursor.execute(
-                        f"CREATE TRIGGER {trigger_name}"
-                        f" {trigger_info['timing']} {events_string}"
-                        f" ON public.{trigger_info['table_name']}"
-                        f" FOR EACH ROW"
-                        f" {trigger_info['statement']}"
+    @classmethod
+    def current_triggers(cls) -> TriggerMap:
+        """
+        Reads all user-defined triggers in the public schema in one query on `pg_catalog`,
+        in the same shape as `Trigger.map`.
+        """
+        current: TriggerMap = {}
+        with connection.cursor() as cursor:
+            cursor.execute(newlines_to_spaces("""
+                SELECT t.tgname, c.relname, t.tgtype, t.tgoldtable, t.tgnewtable, t.tgfoid::regproc::text, t.tgnargs, t.tgargs, ARRAY(
+                    SELECT a.attname
+                    FROM unnest(t.tgattr::int2[]) WITH ORDINALITY AS u(attnum, ordinal)
+                    JOIN pg_catalog.pg_attribute a ON a.attrelid = t.tgrelid AND a.attnum = u.attnum
+                    ORDER BY u.ordinal
+                ), CASE WHEN t.tgqual IS NOT NULL THEN coalesce(obj_description(t.oid, 'pg_trigger'), '') END
+                FROM pg_catalog.pg_trigger t
+                JOIN pg_catalog.pg_class c ON c.oid = t.tgrelid
+                JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = 'public' AND NOT t.tgisinternal
+            """))
+            for (
+                trigger_name, table_name, tgtype, old_table, new_table, function_name, arg_count, args, columns, condition
+            ) in cursor.fetchall():
+                timing, orientation, events = parse_trigger_type(tgtype)
+                statement = execute_function_sql(function_name, arg_count, args)
+                current.setdefault(trigger_name, []).extend(
+                    TriggerInfo(
+                        event=event, table_name=table_name, timing=timing, statement=statement,
+                        orientation=orientation, old_table=old_table, new_table=new_table,
+                        columns=columns if event == 'UPDATE' else [], condition=condition,
                     )
-                    new_triggers = list(cls.objects.filter(trigger_name=trigger_name))
-                    info('Created {} trigger(s) for {} as {}: {}'.format(
-                        len(new_triggers),
-                        cls._meta.db_table,
-                        new_triggers[0].trigger_name,
-                        new_triggers[0].statement
-                    ))
-            except ProgrammingError as e:
-                warning(f'Error creating trigger {trigger_name}, skipping: {e}')
+                    for event in events
+                )
+        return current
+
+    @staticmethod
+    def outdated_triggers(declared: TriggerMap, current: TriggerMap) -> list[TriggerName]:
+        """
+        Names of the `declared` triggers that are missing from, or differ from, `current`.
+        """
+        return [
+            trigger_name
+            for trigger_name, trigger_infos in declared.items()
+            if sorted(map(trigger_info_key, trigger_infos)) != sorted(map(trigger_info_key, current.get(trigger_name, [])))
+        ]
+
+    @staticmethod
+    def drop_sql(trigger_name: TriggerName, table_name: str):
+        return f'DROP TRIGGER IF EXISTS {trigger_name} ON public.{table_name}'
+
+    @staticmethod
+    def creation_sql(trigger_name: TriggerName, trigger_infos: list[TriggerInfo]):
+        trigger_info = trigger_infos[0]
+        events_string = ' OR '.join(
+            f"{trigger_info['event']} OF {', '.join(trigger_info['columns'])}" if trigger_info['columns'] else trigger_info['event']
+            for trigger_info in trigger_infos
+        )
+        transition_tables = ''.join(
+            f' {kind} TABLE AS {table}'
+            for kind, table in [ ('OLD', trigger_info['old_table']), ('NEW', trigger_info['new_table']) ]
+            if table
+        )
+        return (
+            f"CREATE TRIGGER {trigger_name}"
+            f" {trigger_info['timing']} {events_string}"
+            f" ON public.{trigger_info['table_name']}"
+            f"{f' REFERENCING{transition_tables}' if transition_tables else ''}"
+            f" FOR EACH {trigger_info['orientation']}"
+            f"{f' WHEN ({condition})' if (condition := trigger_info['condition']) else ''}"
+            f" {trigger_info['statement']}"
+        )
+
+    @staticmethod
+    def comment_sql(trigger_name: TriggerName, trigger_infos: list[TriggerInfo]):
+        """
+        Keeps the declared `WHEN` condition in the trigger's comment, for `current_triggers` to compare against.
+        """
+        trigger_info = trigger_infos[0]
+        if not (condition := trigger_info['condition']):
+            return []
+        quoted_condition = condition.replace("'", "''")
+        return [ f"COMMENT ON TRIGGER {trigger_name} ON public.{trigger_info['table_name']} IS '{quoted_condition}'" ]
+
+    @classmethod
+    def creation_statements(cls, trigger_name: TriggerName, trigger_infos: list[TriggerInfo]):
+        return [ cls.creation_sql(trigger_name, trigger_infos), *cls.comment_sql(trigger_name, trigger_infos) ]
 
     @classmethod
     def prepare(cls, 
@@ -132,24 +271,54 @@ class Trigger(models.Model):
         Model: type[models.Model],
         statement: str,
         trigger_name: TriggerName | None,
-    ):
+        orientation: TriggerOrientation = 'ROW',
+        columns: tuple[str, ...] = (),
+        condition = none(str),
+    ) -> TriggerMap:
+        """
+        Row-level triggers get a single trigger for all events. Statement-level ones get one trigger per event
+        (suffixed with the event), since Postgres only allows transition tables on single-event triggers;
+        their functions can read the affected rows from the `OLD_TABLE`/`NEW_TABLE` transition tables.
+
+        `columns` (field names) restrict UPDATE events to updates that list any of them (which `save()` always does,
+        so pair them with e.g. `condition=changed(...)` to skip no-op updates). The condition applies to all `events`,
+        so conditions referring to OLD with INSERT, NEW with DELETE, or either on statement-level triggers,
+        which Postgres doesn't allow, raise a `ValueError`.
+        """
+        code = re.sub(r"'(?:[^']|'')*'", "''", condition or '') # without string literals
+        for event in events:
+            unavailable = ('OLD', 'NEW') if orientation == 'STATEMENT' else UNAVAILABLE_RECORDS[event]
+            for record in unavailable:
+                if re.search(rf'\b{record}\s*\.', code, re.IGNORECASE):
+                    raise ValueError(f'{orientation.capitalize()}-level {event} trigger conditions cannot refer to {record}: {condition}')
+
+        def trigger_names(base: TriggerName):
+            return [ base ] if orientation == 'ROW' else [ f'{base}_{event.lower()}' for event in events ]
+
         table_name = Model._meta.db_table
+        column_names = [ Model._meta.get_field(field_name).column for field_name in columns ] # pyright: ignore[reportAttributeAccessIssue]
         trigger_name = table_name
         suffix = 2
-        while trigger_name in cls.map:
+        while any(name in cls.map for name in trigger_names(trigger_name)):
             trigger_name = f'{table_name}_{suffix}'
             suffix += 1
-        return {
-            trigger_name: [
-                TriggerInfo(
-                    table_name = table_name,
-                    timing = timing,
-                    event = event,
-                    statement = f'EXECUTE FUNCTION {statement}',
-                )
-                for event in events
-            ]
-        }
+        trigger_infos = [
+            TriggerInfo(
+                table_name = table_name,
+                timing = timing,
+                event = event,
+                statement = f'EXECUTE FUNCTION {statement}',
+                orientation = orientation,
+                old_table = TRANSITION_TABLES[event][0] if orientation == 'STATEMENT' else None,
+                new_table = TRANSITION_TABLES[event][1] if orientation == 'STATEMENT' else None,
+                columns = column_names if event == 'UPDATE' else [],
+                condition = condition,
+            )
+            for event in events
+        ]
+        if orientation == 'ROW':
+            return { trigger_name: trigger_infos }
+        return { name: [ trigger_info ] for name, trigger_info in zip(trigger_names(trigger_name), trigger_infos) }
     
     def drop(self, raise_if_missing = False):
         """
@@ -199,12 +368,68 @@ class Trigger(models.Model):
         events: tuple[TriggerEvent, ...],
         statement: str,
         trigger_name = none(str),
+        orientation: TriggerOrientation = 'ROW',
+        columns: tuple[str, ...] = (),
+        condition = none(str),
     ):
         def decorator(Model: type[models.Model]):
-            new_triggers = Trigger.prepare(timing, events, Model, statement, trigger_name)
+            new_triggers = Trigger.prepare(timing, events, Model, statement, trigger_name, orientation, columns, condition)
             cls.map.update(new_triggers)
             debug(f'Setup {new_triggers=} for {Model._meta.db_table}')
             return Model
         return decorator
     
+class OutboxEvent(models.Model):
+    """
+    A row change captured by an outbox webhook trigger (see `WebhookDecorator`), waiting to be delivered
+    to its target by `supa.outbox.deliver_outbox`. Rows are inserted by the `supa_outbox_enqueue` trigger function,
+    hence the database defaults, and deleted once delivered.
+    """
+
+    MAX_ATTEMPTS = 10
+
+    target = models.CharField(max_length=255)
+    schema_name = models.CharField(max_length=63)
+    table_name = models.CharField(max_length=63)
+    type: 'models.CharField[TriggerEvent]' = models.CharField(max_length=6) # pyright: ignore[reportAssignmentType]
+    record = models.JSONField(null=True)
+    old_record = models.JSONField(null=True)
+    created = models.DateTimeField(db_default=Now())
+    attempts = models.PositiveIntegerField(db_default=0)
+    next_attempt = models.DateTimeField(db_default=Now())
+    last_error = models.TextField(null=True)
+
+    class Meta:
+        indexes = [ models.Index(fields=[ 'next_attempt', 'id' ], name='supa_outbox_next_attempt') ]
+
+    @classmethod
+    def due(cls):
+        return cls.objects.filter(attempts__lt=cls.MAX_ATTEMPTS, next_attempt__lte=Now()).order_by('pk')
+
+    @classmethod
+    def backlog(cls):
+        """
+        Queue depth per target: events still to be delivered (and how many of them failed before),
+        events given up on after `MAX_ATTEMPTS`, and when the oldest pending one was captured.
+        """
+        pending = Q(attempts__lt=cls.MAX_ATTEMPTS)
+        return list(
+            cls.objects.values('target').order_by('target').annotate(
+                pending=Count('pk', filter=pending),
+                retrying=Count('pk', filter=pending & Q(attempts__gt=0)),
+                dead=Count('pk', filter=~pending),
+                oldest=Min('created', filter=pending),
+            )
+        )
+
+    def payload(self) -> WebhookEvent:
+        return {
+            'id': f'outbox-{self.pk}',
+            'type': self.type,
+            'table': self.table_name,
+            'schema': self.schema_name,
+            'record': self.record,
+            'old_record': self.old_record,
+        }
+
 trigger = Trigger.setup # just a shortcut for easier reading/setting
\ No newline at end of file
@@ -0,0 +1,113 @@
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.migrations import RunSQL
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.state import ProjectState
+
+from .models import Trigger, TriggerInfo, TriggerMap, TriggerName
+
+
+class PostgresRunSQL(RunSQL):
+    """
+    `RunSQL` that only runs on Postgres, for SQL that relies on Supabase (e.g. trigger functions),
+    so that other backends (e.g. in tests) can still run all migrations.
+    """
+
+    def database_forwards(self, app_label: str, schema_editor: BaseDatabaseSchemaEditor, from_state: ProjectState, to_state: ProjectState):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label: str, schema_editor: BaseDatabaseSchemaEditor, from_state: ProjectState, to_state: ProjectState):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+class TriggerOperation(PostgresRunSQL):
+    """
+    Trigger DDL in a migration, keeping the trigger declaration around so that the triggers
+    created by all migrations can be worked out without touching the database (see `migrated_triggers`).
+    """
+
+    def __init__(self, name: TriggerName, trigger_infos: list[TriggerInfo]):
+        self.name = name
+        self.trigger_infos = trigger_infos
+        super().__init__(*self.get_sql())
+
+    def get_sql(self) -> tuple[list[str], list[str]]:
+        ...
+
+    def apply_to_triggers(self, triggers: TriggerMap):
+        ...
+
+    def deconstruct(self):
+        return (self.__class__.__qualname__, [], { 'name': self.name, 'trigger_infos': self.trigger_infos })
+
+    def drop_sql(self):
+        return [
+            Trigger.drop_sql(self.name, table_name)
+            for table_name in sorted({ trigger_info['table_name'] for trigger_info in self.trigger_infos })
+        ]
+
+class CreateTrigger(TriggerOperation):
+
+    def get_sql(self):
+        return [ *self.drop_sql(), *Trigger.creation_statements(self.name, self.trigger_infos) ], self.drop_sql()
+
+    def apply_to_triggers(self, triggers: TriggerMap):
+        triggers[self.name] = self.trigger_infos
+
+    def describe(self):
+        return f'Create trigger {self.name}'
+
+    @property
+    def migration_name_fragment(self):
+        return f'create_trigger_{self.name}'
+
+class DropTrigger(TriggerOperation):
+
+    def get_sql(self):
+        return self.drop_sql(), Trigger.creation_statements(self.name, self.trigger_infos)
+
+    def apply_to_triggers(self, triggers: TriggerMap):
+        triggers.pop(self.name, None)
+
+    def describe(self):
+        return f'Drop trigger {self.name}'
+
+    @property
+    def migration_name_fragment(self):
+        return f'drop_trigger_{self.name}'
+
+def migrated_triggers(loader: MigrationLoader) -> TriggerMap:
+    """
+    The triggers that applying all migrations on disk results in.
+    """
+    triggers: TriggerMap = {}
+    seen: set[tuple[str, str]] = set()
+    for leaf in sorted(loader.graph.leaf_nodes()):
+        for key in loader.graph.forwards_plan(leaf):
+            if key in seen:
+                continue
+            seen.add(key)
+            for operation in loader.graph.nodes[key].operations:
+                if isinstance(operation, TriggerOperation):
+                    operation.apply_to_triggers(triggers)
+    return triggers
+
+def trigger_operations(declared: TriggerMap, migrated: TriggerMap) -> list[TriggerOperation]:
+    """
+    Operations that take the triggers from `migrated` to `declared`.
+    """
+    return [
+        *(
+            DropTrigger(trigger_name, trigger_infos)
+            for trigger_name, trigger_infos in migrated.items()
+            if trigger_name not in declared
+        ),
+        *(
+            operation
+            for trigger_name in Trigger.outdated_triggers(declared, migrated)
+            for operation in [
+                *( [ DropTrigger(trigger_name, migrated[trigger_name]) ] if trigger_name in migrated else [] ),
+                CreateTrigger(trigger_name, declared[trigger_name]),
+            ]
+        ),
+    ]
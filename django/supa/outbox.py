@@ -0,0 +1,113 @@
+import json
+from collections import defaultdict
+from datetime import timedelta
+from time import monotonic
+
+from django_q.models import Schedule # pyright: ignore[reportMissingTypeStubs]
+
+from utils.http import get_pool
+from utils.logging import info, warning
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEvent
+from .webhooks import target_url
+
+
+BATCH_SIZE = 100
+DELIVERY_TIMEOUT = 10.0
+RETRY_DELAY = timedelta(seconds=10)
+MAX_RETRY_DELAY = timedelta(hours=1)
+CLAIM_TIMEOUT = timedelta(minutes=5)
+DEAD_RETENTION = timedelta(days=7)
+TIME_BUDGET = 30.0
+"""Seconds after which `deliver_outbox` claims no more batches, well within the Django Q task timeout"""
+SCHEDULE_NAME = 'supa.deliver_outbox'
+
+class DeliveryError(Exception):
+    pass
+
+def retry_delay(attempts: int):
+    """
+    Exponential backoff: `RETRY_DELAY` after the first failed attempt, doubling with each one after, up to `MAX_RETRY_DELAY`.
+    """
+    return min(RETRY_DELAY * 2 ** min(attempts - 1, 16), MAX_RETRY_DELAY)
+
+def post_events(target: str, events: list[OutboxEvent]):
+    response = get_pool().request(
+        'POST',
+        target_url(target),
+        body=json.dumps([ event.payload() for event in events ]),
+        headers={ 'Content-Type': 'application/json' },
+        timeout=DELIVERY_TIMEOUT,
+    )
+    if not 200 <= response.status < 300:
+        raise DeliveryError(f'{target} responded with HTTP {response.status}')
+
+def claim_events(batch_size = BATCH_SIZE):
+    """
+    Claims up to `batch_size` due events, locking them with `SELECT ... FOR UPDATE SKIP LOCKED` (so concurrent workers
+    split the work) just long enough to push their `next_attempt` back by `CLAIM_TIMEOUT`. Events not handled by then,
+    e.g. because the worker died, are due again.
+    """
+    with transaction.atomic():
+        events = list(OutboxEvent.due().select_for_update(skip_locked=True)[:batch_size])
+        OutboxEvent.objects.filter(pk__in=[ event.pk for event in events ]).update(next_attempt=timezone.now() + CLAIM_TIMEOUT)
+    return events
+
+def purge_dead_events(retention = DEAD_RETENTION):
+    """
+    Deletes the events given up on (see `OutboxEvent.MAX_ATTEMPTS`) that were captured more than `retention` ago.
+    """
+    purged, _ = OutboxEvent.objects.filter(
+        attempts__gte=OutboxEvent.MAX_ATTEMPTS, created__lt=timezone.now() - retention
+    ).delete()
+    if purged:
+        info(f'Purged {purged} dead outbox event(s)')
+    return purged
+
+def deliver_outbox(batch_size = BATCH_SIZE, time_budget: float | None = TIME_BUDGET):
+    """
+    Delivers due outbox events until there are none left or `time_budget` seconds have passed (leaving the rest to
+    the next run), returning how many were delivered, then purges old dead ones.
+
+    Each batch of up to `batch_size` events is claimed in a short transaction (see `claim_events`) and posted
+    with one request per target, outside of any transaction, so slow targets hold neither row locks nor a transaction.
+    Delivery is at least once: events are deleted after their target accepted them. Failed events are retried
+    with backoff (see `retry_delay`), up to `OutboxEvent.MAX_ATTEMPTS` times, and kept for `DEAD_RETENTION` after that.
+    """
+    delivered = 0
+    start = monotonic()
+    while (time_budget is None or monotonic() - start < time_budget) and (events := claim_events(batch_size)):
+        events_by_target: dict[str, list[OutboxEvent]] = defaultdict(list)
+        for event in events:
+            events_by_target[event.target].append(event)
+        failed: list[OutboxEvent] = []
+        for target, target_events in events_by_target.items():
+            try:
+                post_events(target, target_events)
+            except Exception as e:
+                warning(f'Could not deliver {len(target_events)} outbox event(s) to {target}: {e}')
+                now = timezone.now()
+                for event in target_events:
+                    event.attempts += 1
+                    event.next_attempt = now + retry_delay(event.attempts)
+                    event.last_error = str(e)
+                failed.extend(target_events)
+            else:
+                OutboxEvent.objects.filter(pk__in=[ event.pk for event in target_events ]).delete()
+                info(f'Delivered {len(target_events)} outbox event(s) to {target}')
+                delivered += len(target_events)
+        OutboxEvent.objects.bulk_update(failed, [ 'attempts', 'next_attempt', 'last_error' ])
+    purge_dead_events()
+    return delivered
+
+def schedule_delivery(minutes = 1):
+    """
+    Registers (or updates) the Django Q schedule running `deliver_outbox` every `minutes`.
+    """
+    Schedule.objects.update_or_create(
+        name=SCHEDULE_NAME,
+        defaults={ 'func': f'{__name__}.deliver_outbox', 'schedule_type': Schedule.MINUTES, 'minutes': minutes },
+    )
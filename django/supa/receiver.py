@@ -0,0 +1,98 @@
+from collections import Counter
+from typing import Any, Awaitable, Callable
+
+from utils.json import dumps, loads
+from utils.logging import info, warning
+
+from asgiref.sync import sync_to_async
+
+from .dedup import get_deduplicator
+from .events import get_event_executor
+from .types import WebhookEvent
+
+
+Scope = dict[str, Any]
+Message = dict[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+LOG_EVERY = 100
+RETRY_AFTER_SECONDS = 5
+
+def parse_events(body: bytes) -> list[WebhookEvent]:
+    """
+    Parses a webhook request body: a single event (as sent by Supabase) or a list of them (as sent by the outbox).
+    Raises `ValueError` for anything else.
+    """
+    payload = loads(body)
+    events = payload if isinstance(payload, list) else [ payload ]
+    for event in events:
+        if not (isinstance(event, dict) and { 'type', 'table', 'schema' } <= event.keys()):
+            raise ValueError('Not a webhook event')
+    return events # pyright: ignore[reportUnknownVariableType]
+
+def summarize(events: list[WebhookEvent]):
+    counts = Counter((event['type'], event['schema'], event['table']) for event in events)
+    return ', '.join(f'{type} {schema}.{table} x{count}' for (type, schema, table), count in counts.items())
+
+async def read_body(receive: Receive):
+    chunks: list[bytes] = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ConnectionError('Client disconnected')
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+async def respond(send: Send, status: int, content: Any, headers: list[tuple[bytes, bytes]] = []):
+    body = dumps(content)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [ (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()), *headers ],
+    })
+    await send({ 'type': 'http.response.body', 'body': body })
+
+class WebhookReceiver:
+    """
+    ASGI middleware answering POSTs of webhook events to `PATH` itself, without going through Django's
+    request handling, and passing everything else on to `app`. Accepts one event or a list of them, hands them
+    to the event executor (see `supa.events`), except for duplicates (see `supa.dedup`), and acknowledges them
+    with a 202 without waiting for their handlers, or answers 503 if the executor has no room for them. Logs a one-line summary of every `log_every`-th request only.
+    GETs return the executor's stats (e.g. queue depth and lag per shard) and the deduplication stats.
+    """
+
+    PATH = '/api/webhooks/events'
+
+    def __init__(self, app: ASGIApp, log_every = LOG_EVERY):
+        self.app = app
+        self.log_every = log_every
+        self.requests = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or scope['path'] != self.PATH:
+            return await self.app(scope, receive, send)
+        if scope['method'] == 'GET':
+            return await respond(send, 200, { **get_event_executor().stats(), 'dedup': get_deduplicator().stats() })
+        if scope['method'] != 'POST':
+            return await respond(send, 405, { 'error': 'Only GET and POST requests are accepted' })
+        self.requests += 1
+        sampled = (self.requests - 1) % self.log_every == 0
+        try:
+            events = parse_events(await read_body(receive))
+        except ValueError as e:
+            if sampled:
+                warning(f'Rejected webhook request: {e}')
+            return await respond(send, 400, { 'error': str(e) })
+        if sampled:
+            info(f'Received {len(events)} webhook event(s) (logging 1 in {self.log_every} requests): {summarize(events)}')
+        new_events = await get_deduplicator().afilter(events)
+        if new_events and not await get_event_executor().asubmit(new_events):
+            warning(f'Event handlers are backed up, rejecting {len(new_events)} webhook event(s)')
+            await sync_to_async(get_deduplicator().forget, thread_sensitive=False)(new_events)
+            return await respond(
+                send, 503, { 'error': 'Too many pending events' }, [ (b'retry-after', str(RETRY_AFTER_SECONDS).encode()) ]
+            )
+        await respond(send, 202, { 'accepted': len(new_events), 'duplicates': len(events) - len(new_events) })
@@ -1,3 +1,847 @@
-from django.test import TestCase
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from typing import Any, Callable
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import fakeredis
+from asgiref.sync import sync_to_async
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations import Migration
+from django.db.migrations.graph import MigrationGraph
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import OperationWriter
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from unfindables.models import WebSearch
+from unfindables.views import supabase_webhook
+from utils.typing import none
+from webhooks.models import WebhookTarget
+from webhooks.tests import LOCAL_CACHES
+
+from .models import OutboxEvent, Trigger, TriggerInfo, TriggerMap, changed, execute_function_sql, parse_trigger_type
+from .operations import CreateTrigger, DropTrigger, migrated_triggers, trigger_operations
+from .benchmarks import ReceiverPath, generate_events, not_found, run_receiver_benchmark
+from .dedup import Deduplicator, event_id, get_deduplicator
+from .events import EventExecutor, QueueEventExecutor, ShardedEventExecutor, ThreadPoolEventExecutor, dispatch, dispatch_all, on_event
+from .listener import conninfo, handle_notification, listen
+from .outbox import DEAD_RETENTION, claim_events, deliver_outbox, retry_delay
+from .receiver import Message, Receive, Scope, Send, WebhookReceiver
+from .types import TriggerEvent, TriggerOrientation, WebhookEvent
+from .webhooks import notify_channel, webhook
+
+
+def trigger_infos(
+    table_name: str, *events: str,
+    statement = 'EXECUTE FUNCTION suppress_redundant_updates_trigger()', columns: list[str] = [], condition = none(str),
+):
+    return [
+        TriggerInfo(
+            event=event, table_name=table_name, timing='BEFORE', statement=statement, # pyright: ignore[reportArgumentType]
+            orientation='ROW', old_table=None, new_table=None,
+            columns=columns if event == 'UPDATE' else [], condition=condition,
+        )
+        for event in events
+    ]
+
+
+class TriggerDiffTest(SimpleTestCase):
+
+    def test_parse_trigger_type(self):
+        self.assertEqual(parse_trigger_type(0b10111), ('BEFORE', 'ROW', [ 'INSERT', 'UPDATE' ]))
+        self.assertEqual(parse_trigger_type(0b01000), ('AFTER', 'STATEMENT', [ 'DELETE' ]))
+
+    def test_execute_function_sql(self):
+        self.assertEqual(
+            execute_function_sql('supa_row_webhook', 2, b"nextjs\0it's 1000\0"),
+            "EXECUTE FUNCTION supa_row_webhook('nextjs', 'it''s 1000')",
+        )
+        self.assertEqual(
+            execute_function_sql('suppress_redundant_updates_trigger', 0, b''),
+            'EXECUTE FUNCTION suppress_redundant_updates_trigger()',
+        )
+
+    def test_outdated_triggers(self):
+        declared: TriggerMap = {
+            'up_to_date': trigger_infos('a', 'INSERT', 'UPDATE'),
+            'missing': trigger_infos('b', 'INSERT'),
+            'changed_events': trigger_infos('c', 'INSERT', 'UPDATE'),
+            'changed_statement': trigger_infos('d', 'UPDATE', statement='EXECUTE FUNCTION f()'),
+            'changed_columns': trigger_infos('f', 'UPDATE', columns=[ 'a', 'b' ]),
+            'changed_condition': trigger_infos('g', 'UPDATE', condition=changed('a')),
+        }
+        current: TriggerMap = {
+            'up_to_date': trigger_infos('a', 'UPDATE', 'INSERT'),
+            'changed_events': trigger_infos('c', 'INSERT'),
+            'changed_statement': trigger_infos('d', 'UPDATE', statement='EXECUTE FUNCTION g()'),
+            'undeclared': trigger_infos('e', 'DELETE'),
+            'changed_columns': trigger_infos('f', 'UPDATE', columns=[ 'a' ]),
+            'changed_condition': trigger_infos('g', 'UPDATE', condition=changed('a', 'b')),
+        }
+        self.assertEqual(
+            Trigger.outdated_triggers(declared, current),
+            [ 'missing', 'changed_events', 'changed_statement', 'changed_columns', 'changed_condition' ],
+        )
+
+    def test_creation_sql(self):
+        self.assertEqual(
+            Trigger.creation_sql('a_trigger', trigger_infos('a', 'INSERT', 'UPDATE')),
+            'CREATE TRIGGER a_trigger BEFORE INSERT OR UPDATE ON public.a FOR EACH ROW'
+            ' EXECUTE FUNCTION suppress_redundant_updates_trigger()'
+        )
+
+    def test_conditional_creation_sql(self):
+        infos = trigger_infos('a', 'INSERT', 'UPDATE', columns=[ 'x', 'y' ], condition="NEW.x <> 'y'")
+        self.assertEqual(Trigger.creation_statements('a_trigger', infos), [
+            "CREATE TRIGGER a_trigger BEFORE INSERT OR UPDATE OF x, y ON public.a FOR EACH ROW WHEN (NEW.x <> 'y')"
+            ' EXECUTE FUNCTION suppress_redundant_updates_trigger()',
+            "COMMENT ON TRIGGER a_trigger ON public.a IS 'NEW.x <> ''y'''",
+        ])
+        self.assertEqual(changed('x', 'y'), 'OLD.x IS DISTINCT FROM NEW.x OR OLD.y IS DISTINCT FROM NEW.y')
+
+
+class StatementTriggerTest(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(Trigger, 'map', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_prepare_statement_triggers(self):
+        triggers = Trigger.prepare('AFTER', ('INSERT', 'UPDATE', 'DELETE'), WebSearch, 'f()', None, 'STATEMENT')
+        self.assertEqual(list(triggers), [ 'unfindables_websearch_insert', 'unfindables_websearch_update', 'unfindables_websearch_delete' ])
+        self.assertEqual(
+            [ (infos[0]['orientation'], infos[0]['old_table'], infos[0]['new_table']) for infos in triggers.values() ],
+            [ ('STATEMENT', None, 'new_rows'), ('STATEMENT', 'old_rows', 'new_rows'), ('STATEMENT', 'old_rows', None) ],
+        )
+        self.assertEqual(
+            Trigger.creation_sql('unfindables_websearch_update', triggers['unfindables_websearch_update']),
+            'CREATE TRIGGER unfindables_websearch_update AFTER UPDATE ON public.unfindables_websearch'
+            ' REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION f()'
+        )
+
+        Trigger.map.update(triggers)
+        self.assertEqual(
+            list(Trigger.prepare('AFTER', ('INSERT',), WebSearch, 'f()', None, 'STATEMENT')), [ 'unfindables_websearch_2_insert' ]
+        )
+        self.assertEqual(list(Trigger.prepare('AFTER', ('INSERT',), WebSearch, 'f()', None)), [ 'unfindables_websearch' ])
+
+    def test_statement_webhook(self):
+        webhook('test', 'INSERT', orientation='STATEMENT')(WebSearch)
+        self.assertEqual(Trigger.map, {
+            'unfindables_websearch_insert': [ TriggerInfo(
+                event='INSERT', table_name='unfindables_websearch', timing='AFTER',
+                statement="EXECUTE FUNCTION supa_statement_webhook('test', '1000')",
+                orientation='STATEMENT', old_table=None, new_table='new_rows', columns=[], condition=None,
+            ) ],
+        })
+
+    def test_conditional_webhook(self):
+        webhook('test', 'DELETE', 'UPDATE', columns=('query',), condition='OLD.query IS NOT NULL')(WebSearch)
+        self.assertEqual(
+            [ (info['event'], info['columns'], info['condition']) for info in Trigger.map['unfindables_websearch'] ],
+            [ ('DELETE', [], 'OLD.query IS NOT NULL'), ('UPDATE', [ 'query' ], 'OLD.query IS NOT NULL') ],
+        )
+
+    def test_conditions_on_missing_records_are_rejected(self):
+        cases: list[tuple[tuple[TriggerEvent, ...], TriggerOrientation, str]] = [
+            ((), 'ROW', changed('query')), # INSERT has no OLD, DELETE no NEW
+            (('INSERT',), 'ROW', 'old.query IS NULL'),
+            (('DELETE',), 'ROW', 'NEW .query IS NULL'),
+            (('UPDATE',), 'STATEMENT', changed('query')),
+        ]
+        for events, orientation, condition in cases:
+            with self.assertRaisesMessage(ValueError, 'trigger conditions cannot refer to'):
+                webhook('test', *events, orientation=orientation, condition=condition)(WebSearch)
+        webhook('test', 'INSERT', condition="NEW.query <> 'OLD.x'")(WebSearch) # OLD only in a string literal
+        self.assertEqual(Trigger.map['unfindables_websearch'][0]['condition'], "NEW.query <> 'OLD.x'")
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Requires Postgres triggers')
+class TriggerReconciliationTest(TransactionTestCase):
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            for trigger_name in [ 'supa_test_trigger', 'unfindables_websearch_insert', 'unfindables_websearch_update' ]:
+                cursor.execute(Trigger.drop_sql(trigger_name, 'unfindables_websearch'))
+
+    def test_reconciliation(self):
+        declared: TriggerMap = { 'supa_test_trigger': trigger_infos('unfindables_websearch', 'UPDATE') }
+        Trigger.update_triggers(declared)
+        self.assertEqual(Trigger.current_triggers()['supa_test_trigger'], declared['supa_test_trigger'])
+
+        with self.assertNumQueries(1):
+            Trigger.update_triggers(declared)
+
+        declared['supa_test_trigger'] = trigger_infos('unfindables_websearch', 'INSERT', 'UPDATE')
+        Trigger.update_triggers(declared)
+        self.assertEqual(
+            sorted(info['event'] for info in Trigger.current_triggers()['supa_test_trigger']), [ 'INSERT', 'UPDATE' ]
+        )
+
+    def test_statement_triggers_round_trip(self):
+        with mock.patch.object(Trigger, 'map', {}):
+            declared = Trigger.prepare(
+                'AFTER', ('INSERT', 'UPDATE'), WebSearch, "supa_statement_webhook('http://localhost', '1000')", None, 'STATEMENT'
+            )
+        self.assertTrue(Trigger.update_triggers(declared))
+        self.assertEqual(Trigger.outdated_triggers(declared, Trigger.current_triggers()), [])
+
+    def test_conditional_triggers_round_trip(self):
+        declared: TriggerMap = {
+            'supa_test_trigger': trigger_infos('unfindables_websearch', 'UPDATE', columns=[ 'query' ], condition=changed('query')),
+        }
+        self.assertTrue(Trigger.update_triggers(declared))
+        self.assertEqual(Trigger.current_triggers()['supa_test_trigger'], declared['supa_test_trigger'])
+
+        declared['supa_test_trigger'] = trigger_infos('unfindables_websearch', 'UPDATE', columns=[ 'query', 'owner_id' ])
+        self.assertTrue(Trigger.update_triggers(declared))
+        self.assertEqual(Trigger.current_triggers()['supa_test_trigger'], declared['supa_test_trigger'])
+
+
+class ReconcileTriggersTest(TestCase):
+
+    def test_reconcile_triggers_against_migrations(self):
+        migrated = migrated_triggers(MigrationLoader(None, ignore_no_migrations=True))
+        self.assertIn('unfindables_websearch', migrated)
+        with mock.patch.object(Trigger, 'current_triggers', return_value={}), \
+                mock.patch.object(Trigger, 'update_triggers', return_value=True) as update_triggers:
+            out = StringIO()
+            with self.assertRaises(SystemExit):
+                call_command('reconcile_triggers', stdout=out)
+            self.assertIn('unfindables_websearch is missing', out.getvalue())
+            update_triggers.assert_not_called()
+            call_command('reconcile_triggers', '--fix', stdout=StringIO())
+            update_triggers.assert_called_once_with(migrated)
+        with mock.patch.object(Trigger, 'current_triggers', return_value=migrated):
+            out = StringIO()
+            call_command('reconcile_triggers', stdout=out)
+            self.assertIn('Triggers match the migrations', out.getvalue())
+
+
+class TriggerMigrationTest(SimpleTestCase):
+
+    def test_trigger_operations(self):
+        migrated: TriggerMap = {
+            'kept': trigger_infos('a', 'INSERT'),
+            'changed': trigger_infos('b', 'INSERT'),
+            'removed': trigger_infos('c', 'DELETE'),
+        }
+        declared: TriggerMap = {
+            'kept': trigger_infos('a', 'INSERT'),
+            'changed': trigger_infos('b', 'INSERT', 'UPDATE'),
+            'added': trigger_infos('d', 'UPDATE'),
+        }
+        operations = trigger_operations(declared, migrated)
+        self.assertEqual(
+            [ operation.describe() for operation in operations ],
+            [ 'Drop trigger removed', 'Drop trigger changed', 'Create trigger changed', 'Create trigger added' ],
+        )
+
+        for operation in operations:
+            operation.apply_to_triggers(migrated)
+        self.assertEqual(migrated, declared)
+
+    def test_operations_have_reverse_sql(self):
+        create = CreateTrigger('a_trigger', trigger_infos('a', 'INSERT', condition='NEW.x'))
+        self.assertEqual(create.sql, [ Trigger.drop_sql('a_trigger', 'a'), *Trigger.creation_statements('a_trigger', create.trigger_infos) ])
+        self.assertEqual(create.reverse_sql, [ Trigger.drop_sql('a_trigger', 'a') ])
+        drop = DropTrigger('a_trigger', trigger_infos('a', 'INSERT', condition='NEW.x'))
+        self.assertEqual((drop.sql, drop.reverse_sql), (create.reverse_sql, create.sql[1:]))
+
+    def test_operations_are_serializable(self):
+        operation = CreateTrigger('a_trigger', trigger_infos('a', 'INSERT'))
+        source, imports = OperationWriter(operation).serialize()
+        self.assertIn('import supa.operations', imports)
+        namespace: dict[str, Any] = {}
+        exec(f'{"; ".join(imports)}\noperation = {source.rstrip(",")}', namespace) # serialized as a list item
+        self.assertEqual(namespace['operation'].deconstruct(), operation.deconstruct())
+        self.assertEqual(namespace['operation'].sql, operation.sql)
+
+    def test_migrated_triggers(self):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        first, second = Migration('0001_a', 'a'), Migration('0002_a', 'a')
+        first.operations = [ CreateTrigger('kept', trigger_infos('a', 'INSERT')), CreateTrigger('removed', trigger_infos('a', 'DELETE')) ]
+        second.operations = [ DropTrigger('removed', trigger_infos('a', 'DELETE')) ]
+        graph = MigrationGraph()
+        graph.add_node(('a', '0001_a'), first)
+        graph.add_node(('a', '0002_a'), second)
+        graph.add_dependency(second, ('a', '0002_a'), ('a', '0001_a'))
+        loader.graph = graph
+        self.assertEqual(migrated_triggers(loader), { 'kept': trigger_infos('a', 'INSERT') })
+
+    def test_check(self):
+        out = StringIO()
+        call_command('maketriggermigrations', '--check', stdout=out) # fails if the declared triggers aren't migrated
+        self.assertIn('No trigger changes detected', out.getvalue())
+        with mock.patch.object(Trigger, 'map', { **Trigger.map, 'a_trigger': trigger_infos('unfindables_websearch', 'INSERT') }):
+            with self.assertRaises(SystemExit):
+                call_command('maketriggermigrations', '--check', stdout=StringIO())
+            out = StringIO()
+            call_command('maketriggermigrations', '--dry-run', stdout=out)
+            self.assertEqual(out.getvalue().strip(), '- Create trigger a_trigger')
+
+
+class WebhookStandIn(ThreadingHTTPServer):
+    """
+    Local webhook target recording the JSON bodies posted to it, responding with `status`.
+    """
+
+    def __init__(self):
+        self.bodies: list[Any] = []
+        self.status = 200
+        bodies, server = self.bodies, self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                bodies.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+                self.send_response(server.status)
+                self.end_headers()
+
+            def log_message(self, format: str, *args: Any):
+                pass
+
+        super().__init__(('127.0.0.1', 0), Handler)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/'
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class OutboxTest(TestCase):
+
+    def setUp(self):
+        self.target = WebhookStandIn()
+        threading.Thread(target=self.target.serve_forever, daemon=True).start()
+        self.addCleanup(self.target.server_close)
+        self.addCleanup(self.target.shutdown)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        WebhookTarget.objects.bulk_create([
+            WebhookTarget(name='test', url=self.target.url), WebhookTarget(name='other', url=self.target.url),
+        ])
+
+    def enqueue(self, target = 'test', count = 1):
+        OutboxEvent.objects.bulk_create(
+            OutboxEvent(target=target, schema_name='public', table_name='t', type='INSERT', record={ 'id': i })
+            for i in range(count)
+        )
+
+    def test_delivers_batches_per_target(self):
+        self.enqueue('test', 3)
+        self.enqueue('other', 1)
+        self.assertEqual(deliver_outbox(batch_size=2), 4)
+        self.assertEqual(sorted(len(body) for body in self.target.bodies), [ 1, 1, 2 ])
+        first = self.target.bodies[0][0]
+        self.assertTrue(first.pop('id').startswith('outbox-'))
+        self.assertEqual(first, {
+            'type': 'INSERT', 'table': 't', 'schema': 'public', 'record': { 'id': 0 }, 'old_record': None,
+        })
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(deliver_outbox(), 0)
+
+    def test_retries_with_backoff(self):
+        self.enqueue('test', 2)
+        self.target.status = 500
+        self.assertEqual(deliver_outbox(), 0)
+        self.assertEqual(len(self.target.bodies), 1)
+        self.assertEqual(OutboxEvent.backlog(), [
+            { 'target': 'test', 'pending': 2, 'retrying': 2, 'dead': 0, 'oldest': OutboxEvent.objects.earliest('created').created },
+        ])
+        event = OutboxEvent.objects.first()
+        assert event
+        self.assertEqual(event.attempts, 1)
+        self.assertIn('HTTP 500', event.last_error or '')
+        self.assertGreater(event.next_attempt, timezone.now())
+        self.assertEqual(deliver_outbox(), 0) # not due yet
+        self.assertEqual(len(self.target.bodies), 1)
+
+        self.target.status = 202
+        OutboxEvent.objects.update(next_attempt=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(deliver_outbox(), 2)
+        self.assertEqual(len(self.target.bodies), 2)
+
+    def test_unknown_targets_fail_only_their_events(self):
+        self.enqueue('missing', 2)
+        self.enqueue('test', 1)
+        with self.assertLogs('utils.logging', 'WARNING'):
+            self.assertEqual(deliver_outbox(), 1)
+        self.assertEqual(list(OutboxEvent.objects.values_list('target', 'attempts')), [ ('missing', 1) ] * 2)
+        self.assertIn('No webhook target named missing', OutboxEvent.objects.values_list('last_error', flat=True)[0] or '')
+
+    def test_stops_claiming_after_the_time_budget(self):
+        self.enqueue('test', 3)
+        with mock.patch('supa.outbox.monotonic', side_effect=[ 0.0, 0.0, 100.0 ]):
+            self.assertEqual(deliver_outbox(batch_size=1, time_budget=30), 1)
+        self.assertEqual(OutboxEvent.objects.count(), 2)
+        self.assertEqual(deliver_outbox(time_budget=None), 2)
+
+    def test_gives_up_after_max_attempts(self):
+        self.enqueue('missing')
+        OutboxEvent.objects.update(attempts=OutboxEvent.MAX_ATTEMPTS - 1)
+        self.assertEqual(deliver_outbox(), 0)
+        backlog, = OutboxEvent.backlog()
+        self.assertEqual((backlog['pending'], backlog['dead']), (0, 1))
+        out = StringIO()
+        call_command('outbox_backlog', stdout=out)
+        self.assertIn('missing: 0 pending event(s) (0 retrying), 1 dead', out.getvalue())
+
+    def test_posts_outside_the_claiming_transaction(self):
+        self.enqueue('test', 2)
+        depth = len(connection.atomic_blocks) # the test's own
+
+        def post(target: str, events: list[OutboxEvent]):
+            self.assertEqual(len(connection.atomic_blocks), depth)
+            self.assertFalse(OutboxEvent.due().exists()) # claimed
+
+        with mock.patch('supa.outbox.post_events', side_effect=post):
+            self.assertEqual(deliver_outbox(), 2)
+
+    def test_claims_expire(self):
+        self.enqueue('test', 2)
+        self.assertEqual(len(claim_events()), 2)
+        self.assertEqual(claim_events(), []) # e.g. the claiming worker died
+        OutboxEvent.objects.update(next_attempt=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(len(claim_events()), 2)
+
+    def test_purges_old_dead_events(self):
+        self.enqueue('missing', 3)
+        OutboxEvent.objects.update(attempts=OutboxEvent.MAX_ATTEMPTS)
+        old, *recent = OutboxEvent.objects.order_by('pk')
+        OutboxEvent.objects.filter(pk=old.pk).update(created=timezone.now() - DEAD_RETENTION - timedelta(seconds=1))
+        deliver_outbox()
+        self.assertEqual(list(OutboxEvent.objects.order_by('pk')), recent)
+
+    def test_retry_delay(self):
+        self.assertEqual([ retry_delay(attempts) for attempts in (1, 2, 3) ], [ timedelta(seconds=10), timedelta(seconds=20), timedelta(seconds=40) ])
+        self.assertEqual(retry_delay(100), timedelta(hours=1))
+
+    def test_outbox_webhook(self):
+        with mock.patch.object(Trigger, 'map', {}):
+            webhook('unset', 'INSERT', delivery='outbox')(WebSearch)
+            self.assertEqual(Trigger.map['unfindables_websearch'][0]['statement'], "EXECUTE FUNCTION supa_outbox_enqueue('unset')")
+            with self.assertRaises(ValueError):
+                webhook('unset', 'INSERT', orientation='STATEMENT', delivery='outbox')(WebSearch)
+
+    def test_deliver_outbox_command(self):
+        self.enqueue('test', 2)
+        out = StringIO()
+        call_command('deliver_outbox', stdout=out)
+        self.assertIn('Delivered 2 outbox event(s)', out.getvalue())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Requires Postgres triggers')
+class OutboxTriggerTest(TransactionTestCase):
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute(Trigger.drop_sql('unfindables_websearch', 'unfindables_websearch'))
+
+    def test_trigger_enqueues_events(self):
+        with mock.patch.object(Trigger, 'map', {}):
+            webhook('test', 'INSERT', 'UPDATE', delivery='outbox')(WebSearch)
+            Trigger.update_triggers()
+        search = WebSearch.objects.create(query='a')
+        WebSearch.objects.filter(pk=search.pk).update(query='b')
+        self.assertEqual(
+            [ (event.type, (event.record or {})['query'], (event.old_record or {}).get('query')) for event in OutboxEvent.objects.order_by('pk') ],
+            [ ('INSERT', 'a', None), ('UPDATE', 'b', 'a') ],
+        )
+
+
+class EventHandlerTest(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch('supa.events.handlers', defaultdict(list))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def event(self, type: TriggerEvent = 'INSERT', table = 'unfindables_websearch') -> WebhookEvent:
+        return { 'type': type, 'table': table, 'schema': 'public', 'record': { 'id': 1 }, 'old_record': None }
+
+    def test_dispatch(self):
+        calls: list[str] = []
+
+        @on_event(WebSearch, 'INSERT')
+        def failing(event: WebhookEvent):
+            raise RuntimeError('oops')
+
+        @on_event(WebSearch)
+        def recording(event: WebhookEvent):
+            calls.append(event['type'])
+
+        with self.assertLogs('utils.logging', 'ERROR'):
+            self.assertEqual(dispatch(self.event('INSERT')), 2)
+        self.assertEqual(dispatch(self.event('DELETE')), 1)
+        self.assertEqual(dispatch(self.event('INSERT', table='other')), 0)
+        self.assertEqual(calls, [ 'INSERT', 'DELETE' ])
+
+    def test_notify_webhook(self):
+        with mock.patch.object(Trigger, 'map', {}), mock.patch('supa.webhooks.notify_channels', set()) as channels:
+            with self.assertRaises(CommandError):
+                call_command('listen_events')
+            webhook('Django', 'INSERT', delivery='notify')(WebSearch)
+            self.assertEqual(Trigger.map['unfindables_websearch'][0]['statement'], "EXECUTE FUNCTION supa_notify('supa_django')")
+            self.assertEqual(channels, { 'supa_django' })
+
+    def test_malformed_notifications_are_skipped(self):
+        calls: list[int] = []
+        on_event(WebSearch)(lambda event: calls.append((event.get('record') or {})['id']))
+        with self.assertLogs('utils.logging', 'WARNING') as logs:
+            for payload in ('not json', '{"type": "INSERT"}', json.dumps(self.event())):
+                handle_notification(payload)
+        self.assertEqual(len(logs.output), 2)
+        self.assertEqual(calls, [ 1 ])
+
+    def test_conninfo(self):
+        settings_dict = { 'NAME': 'db', 'USER': 'postgres', 'PASSWORD': '', 'HOST': 'localhost', 'PORT': '5432' }
+        with mock.patch.dict(connection.settings_dict, settings_dict):
+            self.assertEqual(conninfo(), 'dbname=db user=postgres host=localhost port=5432')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Requires Postgres triggers')
+class ListenerTest(TransactionTestCase):
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute(Trigger.drop_sql('unfindables_websearch', 'unfindables_websearch'))
+
+    def test_listen(self):
+        with mock.patch.object(Trigger, 'map', {}):
+            webhook('test', 'INSERT', delivery='notify')(WebSearch)
+            Trigger.update_triggers()
+        received: list[WebhookEvent] = []
+
+        async def scenario():
+            done = asyncio.Event()
+            def handler(event: WebhookEvent):
+                received.append(event)
+                done.set()
+            with mock.patch('supa.events.handlers', defaultdict(list)):
+                on_event(WebSearch, 'INSERT')(handler)
+                listener = asyncio.create_task(listen([ notify_channel('test') ]))
+                await asyncio.sleep(0.5)
+                await sync_to_async(WebSearch.objects.create)(query='a')
+                await asyncio.wait_for(done.wait(), 5)
+                listener.cancel()
+
+        asyncio.run(scenario())
+        self.assertEqual([ (event['type'], (event.get('record') or {})['query']) for event in received ], [ ('INSERT', 'a') ])
+
+
+def receiver_request(body: bytes, method = 'POST', path = WebhookReceiver.PATH, receiver = none(WebhookReceiver)):
+    """
+    Makes a request to `receiver` (default: one in front of a stand-in app), returning the status and JSON response
+    (or 0 and the stand-in app's message if the request was passed on).
+    """
+    messages: list[Message] = []
+    chunks = [ body[:5], body[5:] ]
+
+    async def receive() -> Message:
+        chunk = chunks.pop(0)
+        return { 'type': 'http.request', 'body': chunk, 'more_body': bool(chunks) }
+
+    async def send(message: Message):
+        messages.append(message)
+
+    async def fallback(scope: Scope, receive: Receive, send: Send):
+        await send({ 'type': 'fallback', 'path': scope['path'] })
+
+    receiver = receiver or WebhookReceiver(fallback)
+    asyncio.run(receiver({ 'type': 'http', 'method': method, 'path': path }, receive, send))
+    if messages[0]['type'] == 'fallback':
+        return 0, messages[0]
+    return messages[0]['status'], json.loads(messages[1]['body'])
+
+
+def isolate_dedup(test: SimpleTestCase):
+    """
+    Gives `test` a fresh deduplicator backed by a fake Redis.
+    """
+    patcher = mock.patch('supa.dedup.get_client', return_value=fakeredis.FakeRedis())
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    get_deduplicator.cache_clear()
+    test.addCleanup(get_deduplicator.cache_clear)
+
+
+class ReceiverTest(SimpleTestCase):
+
+    def setUp(self):
+        isolate_dedup(self)
+
+    def test_accepts_single_events_and_batches(self):
+        event, = generate_events(1)
+        with self.assertLogs('utils.logging', 'INFO') as logs:
+            self.assertEqual(receiver_request(json.dumps(event).encode()), (202, { 'accepted': 1, 'duplicates': 0 }))
+            self.assertEqual(
+                receiver_request(json.dumps(generate_events(3)).encode()), (202, { 'accepted': 2, 'duplicates': 1 })
+            )
+        self.assertIn('INSERT public.unfindables_websearch x3', logs.output[-1])
+        self.assertEqual(receiver_request(b'', method='GET')[1]['dedup']['duplicates'], 1)
+
+    def test_rejects_other_requests(self):
+        self.assertEqual(receiver_request(b'{"type": "INSERT"}')[0], 400)
+        self.assertEqual(receiver_request(b'not json')[0], 400)
+        self.assertEqual(receiver_request(b'', method='PUT')[0], 405)
+        self.assertEqual(receiver_request(b'', path='/admin/'), (0, { 'type': 'fallback', 'path': '/admin/' }))
+
+    def test_log_sampling(self):
+        receiver = WebhookReceiver(not_found, log_every=3)
+        with self.assertLogs('utils.logging', 'INFO') as logs:
+            for i in range(7):
+                receiver_request(json.dumps(generate_events(1, f'event-{i}')).encode(), receiver=receiver)
+        self.assertEqual(len(logs.output), 3)
+
+    def test_benchmark(self):
+        events = generate_events(20)
+        cases: list[tuple[ReceiverPath, int]] = [ ('legacy', 1), ('receiver', 1), ('receiver', 8) ]
+        for path, batch_size in cases:
+            result = run_receiver_benchmark(path, events, batch_size)
+            self.assertEqual((result.events, result.requests), (20, 20 if batch_size == 1 else 3))
+            self.assertGreater(result.events_per_second, 0)
+
+
+class EventExecutorTest(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch('supa.events.handlers', defaultdict(list))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        isolate_dedup(self)
+        self.release = threading.Event()
+        self.handled: list[int] = []
+
+        @on_event(WebSearch, 'INSERT')
+        def slow(event: WebhookEvent):
+            self.release.wait(5)
+            self.handled.append((event.get('record') or {})['id'])
+
+    def test_thread_pool_backpressure(self):
+        executor = ThreadPoolEventExecutor(workers=1, max_pending=3)
+        self.addCleanup(executor.executor.shutdown)
+        events = generate_events(4)
+        self.assertTrue(executor.submit(events[:2]))
+        self.assertFalse(executor.submit(events[2:])) # 4 > 3
+        self.assertTrue(executor.submit(events[2:3]))
+        self.assertTrue(executor.submit([ { **events[3], 'type': 'DELETE' } ])) # no handlers, nothing queued
+        self.assertEqual(executor.pending, 3)
+        self.release.set()
+        executor.executor.shutdown(wait=True)
+        self.assertEqual((self.handled, executor.pending), ([ 0, 1, 2 ], 0))
+
+    @mock.patch('supa.events.async_task')
+    @mock.patch('supa.events.get_broker')
+    def test_queue_backpressure(self, get_broker: mock.Mock, async_task: mock.Mock):
+        executor = QueueEventExecutor(max_pending=10)
+        events = generate_events(2)
+        get_broker.return_value.queue_size.return_value = 9
+        self.assertTrue(executor.submit(events))
+        async_task.assert_called_once_with(dispatch_all, events)
+        get_broker.return_value.queue_size.return_value = 10
+        self.assertFalse(executor.submit(events))
+        self.assertEqual(async_task.call_count, 1)
+
+    def test_receiver_rejects_when_backed_up(self):
+        executor = mock.Mock(spec=EventExecutor)
+        executor.asubmit.return_value = False
+        with mock.patch('supa.receiver.get_event_executor', return_value=executor):
+            status, _ = receiver_request(json.dumps(generate_events(2)).encode())
+        self.assertEqual(status, 503)
+        executor.asubmit.assert_called_once_with(generate_events(2))
+        executor.asubmit.return_value = True
+        with mock.patch('supa.receiver.get_event_executor', return_value=executor):
+            self.assertEqual(receiver_request(json.dumps(generate_events(2)).encode()), (202, { 'accepted': 2, 'duplicates': 0 }))
+
+    def test_legacy_view_submits_events(self):
+        executor = mock.Mock(spec=EventExecutor)
+        event, = generate_events(1)
+        request = RequestFactory().post('/api/webhooks/supabase', json.dumps(event), content_type='application/json')
+        with mock.patch('unfindables.views.get_event_executor', return_value=executor), self.assertLogs('unfindables.views'):
+            executor.submit.return_value = False
+            self.assertEqual(supabase_webhook(request).status_code, 503)
+            executor.submit.return_value = True
+            self.assertEqual(supabase_webhook(request).status_code, 200) # the rejected event isn't a duplicate
+            self.assertEqual(supabase_webhook(request).status_code, 200)
+        self.assertEqual(executor.submit.call_args_list, [ mock.call([ event ]) ] * 2)
+
+
+def row_events(row_id: int, count: int) -> list[WebhookEvent]:
+    return [
+        {
+            'type': 'INSERT' if sequence == 0 else 'UPDATE', 'table': 'unfindables_websearch', 'schema': 'public',
+            'record': { 'id': row_id, 'sequence': sequence }, 'old_record': None if sequence == 0 else { 'id': row_id },
+        }
+        for sequence in range(count)
+    ]
+
+
+class ShardedEventExecutorTest(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch('supa.events.handlers', defaultdict(list))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def wait_for(self, condition: Callable[[], bool]):
+        deadline = time.monotonic() + 10
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, 'Timed out')
+            time.sleep(0.01)
+
+    def test_preserves_order_per_row_under_concurrency(self):
+        rows, events_per_row, submitters = 40, 25, 4
+        handled: defaultdict[int, list[int]] = defaultdict(list)
+        threads: set[str] = set()
+        rng = random.Random(0)
+
+        @on_event(WebSearch, 'INSERT', 'UPDATE')
+        def record(event: WebhookEvent):
+            time.sleep(rng.random() / 1000)
+            record = event.get('record') or {}
+            handled[record['id']].append(record['sequence'])
+            threads.add(threading.current_thread().name)
+
+        executor = ShardedEventExecutor(shards=4, max_pending=4 * rows * events_per_row) # room for any spread
+
+        def submit(submitter: int):
+            # Each submitter owns some rows and interleaves their events in randomly sized batches
+            queued = [ row_events(row_id, events_per_row) for row_id in range(submitter, rows, submitters) ]
+            stream = [ event for events in zip(*queued) for event in events ]
+            batch_sizes = random.Random(submitter)
+            while stream:
+                batch_size = batch_sizes.randint(1, 10)
+                self.assertTrue(executor.submit(stream[:batch_size]))
+                del stream[:batch_size]
+
+        submitting = [ threading.Thread(target=submit, args=(submitter,)) for submitter in range(submitters) ]
+        for thread in submitting:
+            thread.start()
+        for thread in submitting:
+            thread.join()
+        self.wait_for(lambda: sum(shard['handled'] for shard in executor.stats()['shards']) == rows * events_per_row)
+
+        self.assertEqual(dict(handled), { row_id: list(range(events_per_row)) for row_id in range(rows) })
+        self.assertEqual(len(threads), 4)
+
+    def test_backpressure_and_lag(self):
+        started, release = threading.Event(), threading.Event()
+
+        @on_event(WebSearch)
+        def blocking(event: WebhookEvent):
+            started.set()
+            release.wait(10)
+
+        executor = ShardedEventExecutor(shards=2, max_pending=4)
+        first, *same_shard = [ event for row_id in range(10) for event in row_events(row_id, 1) ]
+        same_shard = [ event for event in same_shard if executor.shard(event) is executor.shard(first) ]
+        other_shard = next(
+            event for row_id in range(10) for event in row_events(row_id, 1) if executor.shard(event) is not executor.shard(first)
+        )
+        self.assertTrue(executor.submit([ first ]))
+        started.wait(10)
+        self.assertTrue(executor.submit(same_shard[:2]))
+        self.assertFalse(executor.submit([ same_shard[2], other_shard ])) # refused whole
+        self.assertTrue(executor.submit([ other_shard ]))
+        time.sleep(0.05)
+        shard_stats = executor.stats()['shards'][executor.shards.index(executor.shard(first))]
+        self.assertEqual((shard_stats['depth'], shard_stats['handled']), (2, 0))
+        self.assertGreater(shard_stats['lag'], 0.04)
+
+        release.set()
+        self.wait_for(lambda: sum(shard['handled'] for shard in executor.stats()['shards']) == 4)
+        self.assertEqual([ shard['depth'] for shard in executor.stats()['shards'] ], [ 0, 0 ])
+
+    def test_receiver_stats(self):
+        isolate_dedup(self)
+        executor = ShardedEventExecutor(shards=2)
+        with mock.patch('supa.receiver.get_event_executor', return_value=executor):
+            status, stats = receiver_request(b'', method='GET')
+        self.assertEqual(status, 200)
+        self.assertEqual(len(stats['shards']), 2)
+
+    def test_statement_level_events(self):
+        isolate_dedup(self)
+        received: list[WebhookEvent] = []
+        on_event(WebSearch, 'INSERT')(received.append)
+        event: WebhookEvent = {
+            'type': 'INSERT', 'table': 'unfindables_websearch', 'schema': 'public',
+            'records': [ { 'id': 1 }, { 'id': 2 } ], 'old_records': [],
+        }
+        executor = ShardedEventExecutor(shards=2)
+        self.assertIs(executor.shard(event), executor.shard({ **event, 'records': [ { 'id': 3 } ] }))
+        with mock.patch('supa.receiver.get_event_executor', return_value=executor):
+            self.assertEqual(receiver_request(json.dumps(event).encode()), (202, { 'accepted': 1, 'duplicates': 0 }))
+        self.wait_for(lambda: bool(received))
+        self.assertEqual(received, [ event ])
+
+
+class DedupTest(SimpleTestCase):
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch('supa.dedup.get_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_local_and_remote_hits(self):
+        events = generate_events(3)
+        first, second = Deduplicator(), Deduplicator() # e.g. two processes sharing Redis
+        self.assertEqual(first.filter(events[:2] + events[:1]), events[:2])
+        self.assertEqual(first.filter(events), events[2:])
+        self.assertEqual(second.filter(events), [])
+        self.assertEqual(second.filter(events), [])
+        self.assertEqual(first.stats(), {
+            'checked': 6, 'duplicates': 3, 'local_hits': 3, 'remote_hits': 0, 'hit_rate': 0.5, 'size': 3,
+        })
+        self.assertEqual(second.stats(), {
+            'checked': 6, 'duplicates': 6, 'local_hits': 3, 'remote_hits': 3, 'hit_rate': 1.0, 'size': 3,
+        })
+        self.assertEqual(asyncio.run(Deduplicator().afilter(events)), [])
+
+    def test_expiry_and_eviction(self):
+        dedup = Deduplicator(ttl=60, max_size=2)
+        events = generate_events(3)
+        dedup.filter(events)
+        self.assertEqual(list(dedup.seen), [ 'event-1', 'event-2' ])
+        self.assertEqual(dedup.filter_local(events), events[:1])
+        self.assertAlmostEqual(self.redis.ttl('supa:event:event-0'), 60, delta=1)
+        with mock.patch('supa.dedup.monotonic', return_value=time.monotonic() + 61):
+            self.assertEqual(dedup.filter_local(events), events)
+
+    def test_forget(self):
+        dedup = Deduplicator()
+        events = generate_events(2)
+        dedup.filter(events)
+        dedup.forget(events[:1])
+        self.assertEqual(dedup.filter(events), events[:1])
+
+    def test_redis_failure_lets_events_through(self):
+        dedup = Deduplicator()
+        events = generate_events(2)
+        with mock.patch.object(self.redis, 'pipeline', side_effect=RedisConnectionError('down')), \
+                self.assertLogs('utils.logging', 'WARNING'):
+            self.assertEqual(dedup.filter(events), events)
+        self.assertEqual(dedup.filter(events), []) # still caught locally
+
+    def test_event_ids(self):
+        event, = generate_events(1)
+        self.assertEqual(event_id(event), 'event-0')
+        del event['id']
+        self.assertTrue(event_id(event).startswith('sha1:'))
+        self.assertEqual(event_id(event), event_id(json.loads(json.dumps(event))))
+        self.assertNotEqual(event_id(event), event_id({ **event, 'type': 'UPDATE' }))
+        outbox_event = OutboxEvent(pk=7, target='test', schema_name='public', table_name='t', type='INSERT', record={})
+        self.assertEqual(event_id(outbox_event.payload()), 'outbox-7')
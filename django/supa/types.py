@@ -1,4 +1,23 @@
-from typing import Literal
+from typing import Any, Literal, NotRequired, TypedDict
 
 TriggerTiming = Literal['BEFORE', 'AFTER']
-TriggerEvent = Literal['INSERT', 'DELETE', 'UPDATE']
\ No newline at end of file
+TriggerEvent = Literal['INSERT', 'DELETE', 'UPDATE']
+TriggerOrientation = Literal['ROW', 'STATEMENT']
+WebhookDelivery = Literal['request', 'outbox', 'notify']
+
+class WebhookEvent(TypedDict):
+    """
+    A row change, in the shape of Supabase's database webhook payloads, or (from statement-level webhooks)
+    the changes made by one statement, with `records`/`old_records` instead of `record`/`old_record`.
+    """
+    id: NotRequired[str]
+    """Stable across deliveries of the same event (not sent by `supabase_functions.http_request`)"""
+    type: TriggerEvent
+    table: str
+    schema: str
+    record: NotRequired[dict[str, Any] | None]
+    old_record: NotRequired[dict[str, Any] | None]
+    records: NotRequired[list[dict[str, Any]]]
+    old_records: NotRequired[list[dict[str, Any]]]
+    truncated: NotRequired[bool]
+    """Set on notifications too large for `pg_notify`, whose records are then cut down to their `id`"""
@@ -1,25 +1,71 @@
 from typing import Generic, TypeVar
 
-from utils.env import get_required_env
+from utils.errors import throw
+from utils.typing import none
+from webhooks.models import WebhookTarget
 
 from .models import trigger
-from .types import TriggerEvent
+from .types import TriggerEvent, TriggerOrientation, WebhookDelivery
 
 TTargetName = TypeVar('TTargetName', bound=str)
 
+def target_url(name: str):
+    return WebhookTarget.lookup(name) or throw(f'No webhook target named {name}')
+
+def notify_channel(name: str):
+    return f'supa_{name.lower()}'
+
+notify_channels: set[str] = set()
+"""Channels of all declared notify webhooks, listened to by `manage.py listen_events` by default"""
+
 class WebhookDecorator(Generic[TTargetName]):
     
-    def __call__(self, name: TTargetName, *events: TriggerEvent):
+    def __call__(self,
+        name: TTargetName,
+        *events: TriggerEvent,
+        orientation: TriggerOrientation = 'ROW',
+        columns: tuple[str, ...] = (),
+        condition = none(str),
+        delivery: WebhookDelivery = 'request',
+    ):
+        """
+        The trigger passes the target's `name`, and its URL is looked up when it fires (see `WebhookTarget`),
+        so targets can be retargeted without recreating triggers. Every event carries a stable `id`,
+        so that retried deliveries can be recognized (see `supa.dedup`).
+
+        With `orientation='STATEMENT'`, every statement (e.g. a `bulk_create`) makes a single request
+        with all affected rows, as `{"type", "table", "schema", "records": [...], "old_records": [...]}`.
+
+        `columns` and `condition` narrow down when the trigger fires (see `Trigger.prepare`), e.g. (UPDATE only, as
+        `changed` refers to both OLD and NEW)
+        `@webhook('nextjs', 'UPDATE', columns=('query',), condition=changed('query'))` skips `updated_at`-only saves.
+
+        With `delivery='outbox'` (row-level only), the trigger merely records the change as an `OutboxEvent`,
+        and `supa.outbox.deliver_outbox` posts them in batches (lists of the usual payloads), retrying failures.
+
+        With `delivery='notify'` (row-level only), the change is sent with `pg_notify` on the `notify_channel(name)`
+        channel instead, for in-process handlers (see `supa.events`) run by `manage.py listen_events`.
+        Delivery is at most once: notifications sent while no listener is connected are lost.
+        """
+        if delivery != 'request' and orientation != 'ROW':
+            raise ValueError(f'{delivery.capitalize()} webhooks are row-level only')
+        if delivery == 'notify':
+            notify_channels.add(notify_channel(name))
         return trigger(
             timing='AFTER',
             events=events or ('INSERT', 'DELETE', 'UPDATE'), # default to all events
             statement=(
-                f"supabase_functions.http_request("
-                f"'{get_required_env(f'WEBHOOK_TARGET_{name.upper()}')}',"
-                f" 'POST',"
-                f" '{{{{\"Content-Type\":\"application/json\"}}}}',"
-                f" '{{{{}}}}', '1000')"
-            )
+                f"supa_outbox_enqueue('{name}')"
+            ) if delivery == 'outbox' else (
+                f"supa_notify('{notify_channel(name)}')"
+            ) if delivery == 'notify' else (
+                f"supa_row_webhook('{name}', '1000')"
+            ) if orientation == 'ROW' else (
+                f"supa_statement_webhook('{name}', '1000')"
+            ),
+            orientation=orientation,
+            columns=columns,
+            condition=condition,
         )
     
-webhook = WebhookDecorator[str]() # the simplest case if you don't want to type the target name
\ No newline at end of file
+webhook = WebhookDecorator[str]() # the simplest case if you don't want to type the target name
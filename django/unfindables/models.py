@@ -3,7 +3,6 @@
 from typing import Literal
 from supa.webhooks import WebhookDecorator
 from utils.powerups.base import BaseModel
-# from utils.powerups.webhooks import WebhookHandler, WebhookTargetBase
 
 from django.db import models
 
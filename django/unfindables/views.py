@@ -3,6 +3,9 @@ from django.views.decorators.csrf import csrf_exempt
 import json
 import logging
 
+from supa.dedup import get_deduplicator
+from supa.events import get_event_executor
+
 # Set up logger
 logger = logging.getLogger(__name__)
 
@@ -33,6 +36,11 @@ def supabase_webhook(request: HttpRequest):
             logger.info(f"Old Record: {data.get('old_record')}")
             logger.info(f"Raw Data: {data}")
             logger.info(f"=====================================")
+
+            events = get_deduplicator().filter([ data ])
+            if events and not get_event_executor().submit(events):
+                get_deduplicator().forget(events)
+                return JsonResponse({'status': 'error', 'message': 'Too many pending events'}, status=503)
             
             # Return a success response
             return JsonResponse({
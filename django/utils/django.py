@@ -1,12 +1,41 @@
 from types import UnionType
 from typing import Any, Callable, TypeGuard, TypeVar, cast
 
+from django.apps import apps
 from django.db.migrations.state import StateApps
 
 from utils.typing import literal_values
 from django.db import models
 
 
+class JSONArrayAgg(models.Aggregate):
+    """
+    Aggregates values (typically `JSONObject`s) into a JSON array, on Postgres and SQLite alike.
+    """
+    function = 'JSONB_AGG'
+
+    def __init__(self, expression: Any, **extra: Any):
+        super().__init__(expression, output_field=models.JSONField(), **extra)
+
+    def as_sql(self, compiler: Any, connection: Any, **extra_context: Any):
+        if connection.vendor == 'sqlite':
+            extra_context['function'] = 'JSON_GROUP_ARRAY'
+        return super().as_sql(compiler, connection, **extra_context)
+
+class Epoch(models.Func):
+    """
+    Seconds since the Unix epoch of a datetime expression, as a float.
+    """
+    template = 'CAST(EXTRACT(EPOCH FROM %(expressions)s) AS DOUBLE PRECISION)'
+
+    def __init__(self, expression: Any, **extra: Any):
+        super().__init__(expression, output_field=models.FloatField(), **extra)
+
+    def as_sql(self, compiler: Any, connection: Any, **extra_context: Any):
+        if connection.vendor == 'sqlite':
+            extra_context['template'] = '((JULIANDAY(%(expressions)s) - 2440587.5) * 86400.0)'
+        return super().as_sql(compiler, connection, **extra_context)
+
 def choices_from_literals(LiteralType: UnionType) -> list[tuple[str, str]]:
     return [(choice, choice) for choice in literal_values(LiteralType)]
 
@@ -15,6 +44,12 @@ TModel = TypeVar('TModel', bound = type[models.Model])
 def issubmodel(cls: type[models.Model], model: TModel) -> TypeGuard[TModel]:
     return issubclass(cls, model)
 
+def get_submodel(label: str, model: TModel) -> TModel:
+    cls = apps.get_model(label)
+    if not issubmodel(cls, model):
+        raise ValueError(f"{label} is not a subclass of {model.__name__}")
+    return cls
+
 TField = TypeVar('TField', bound = 'models.Field[Any, Any]')
 
 def DynamicField(
@@ -0,0 +1,13 @@
+from functools import cache
+
+import urllib3
+
+
+POOL_SIZE = 10
+
+@cache
+def get_pool() -> urllib3.PoolManager:
+    """
+    Process-wide HTTP connection pool, so repeated requests to the same host reuse their connections.
+    """
+    return urllib3.PoolManager(maxsize=POOL_SIZE, retries=False)
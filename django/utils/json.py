@@ -0,0 +1,17 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data: bytes | str) -> Any:
+    """
+    Parses JSON with orjson if it is installed (several times faster), else with the standard library.
+    """
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def dumps(value: Any) -> bytes:
+    return orjson.dumps(value) if orjson else json.dumps(value, separators=(',', ':')).encode()
@@ -20,6 +20,28 @@ class MigrationInfo():
 
 TModel = TypeVar('TModel', bound=models.Model)
 
+def last_migration(app_label: str):
+    for migration in reversed(
+        sorted(
+            MigrationLoader(connection).disk_migrations.values(),
+            key=lambda migration: migration.name
+        )
+    ):
+        if migration.app_label == app_label:
+            return MigrationInfo(
+                index=int(migration.name.split('_')[0]),
+                name=migration.name
+            )
+    raise ValueError(f"No previous migration found for {app_label}")
+
+def write_migration(migration: Migration):
+    writer = MigrationWriter(migration)
+    path = writer.path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(writer.as_string())
+    return path
+
 # #pyright: reportUndefinedVariable=false, reportUnknownVariableType=false, reportUnknownArgumentType=false
 # # because we're using this as a stub to inject into the migration file (uppercases will be replaced with actual values)
 # def migrator(fn: Returns[str]):
@@ -53,19 +75,7 @@ class MigrationHandler(Generic[TModel]):
 
     @property
     def last_migration(self):
-        app_label = self.Model._meta.app_label
-        for migration in reversed(
-            sorted(
-                MigrationLoader(connection).disk_migrations.values(),
-                key=lambda migration: migration.name
-            )
-        ):
-            if migration.app_label == app_label:
-                return MigrationInfo(
-                    index=int(migration.name.split('_')[0]),
-                    name=migration.name
-                )
-        raise ValueError(f"No previous migration found for {app_label}")
+        return last_migration(self.Model._meta.app_label)
 
     def write(self):
         last = self.last_migration
@@ -89,9 +99,5 @@ class MigrationHandler(Generic[TModel]):
                 # reverse_code=migrator(self.reverse_sql)
             )
         ]
-        writer = MigrationWriter(migration)
-        path = writer.path
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, 'w') as f:
-            f.write(writer.as_string())
+        write_migration(migration)
         return migration
\ No newline at end of file
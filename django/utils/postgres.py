@@ -0,0 +1,24 @@
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+@contextmanager
+def advisory_lock(name: str, using: str = DEFAULT_DB_ALIAS):
+    """
+    Holds a session-level Postgres advisory lock keyed on `name`, blocking until it is available.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_lock(hashtext(%s))', [name])
+        try:
+            yield
+        finally:
+            cursor.execute('SELECT pg_advisory_unlock(hashtext(%s))', [name])
+
+def advisory_xact_lock(name: str, using: str = DEFAULT_DB_ALIAS):
+    """
+    Takes a transaction-level Postgres advisory lock keyed on `name`, blocking until it is available.
+    Must be called inside a transaction; the lock is released when it ends.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [name])
@@ -0,0 +1,10 @@
+from functools import cache
+
+import redis
+
+from django.conf import settings
+
+
+@cache
+def get_client() -> 'redis.Redis':
+    return redis.Redis.from_url(settings.REDIS_URL)
@@ -0,0 +1,17 @@
+from typing import Any
+
+from webhooks.models import WebhookTarget
+
+from django.core.management.base import BaseCommand, CommandParser
+
+
+class Command(BaseCommand):
+    help = 'Points a webhook target at a new URL (creating it if needed), without recreating any triggers'
+
+    def add_arguments(self, parser: CommandParser):
+        parser.add_argument('name', help='Target name, as passed to @webhook')
+        parser.add_argument('url')
+
+    def handle(self, *args: Any, **options: Any):
+        target = WebhookTarget.retarget(options['name'], options['url'])
+        self.stdout.write(self.style.SUCCESS(f'Retargeted {target}'))
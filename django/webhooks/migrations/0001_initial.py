@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-18 20:54
+
+import os
+
+from django.apps.registry import Apps
+from django.db import migrations, models
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+
+
+PREFIX = 'WEBHOOK_TARGET_'
+
+def import_env_targets(apps: Apps, schema_editor: BaseDatabaseSchemaEditor):
+    """
+    Registers the targets previously configured with `WEBHOOK_TARGET_<NAME>` environment variables.
+    """
+    WebhookTarget = apps.get_model('webhooks', 'WebhookTarget')
+    WebhookTarget.objects.bulk_create(
+        WebhookTarget(name=name[len(PREFIX):].lower(), url=url)
+        for name, url in os.environ.items()
+        if name.startswith(PREFIX) and url
+    )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookTarget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('url', models.URLField()),
+                ('version', models.IntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(import_env_targets, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,76 @@
-from django.db import models
+from redis.exceptions import RedisError
+
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import F
+
+from utils.logging import warning
+
 
 class WebhookTarget(models.Model):
-    name = models.CharField(max_length=255)
+    """
+    Where the webhooks of target `name` are posted (see `supa.webhooks`). Webhook triggers pass the name, and
+    look the URL up when they fire (with the `supa_webhook_url` SQL function), so retargeting is a single row
+    update (see `retarget`), without recreating any triggers.
+    """
+
+    CACHE_TIMEOUT = 60
+    """Seconds for which Django may use a cached URL that was changed other than with `retarget` (see `lookup`)"""
+
+    name = models.CharField(max_length=255, unique=True)
     url = models.URLField()
-    version = models.IntegerField(default=1)
\ No newline at end of file
+    version = models.IntegerField(default=1)
+    """Bumped on every retarget, so that cached URLs are only ever replaced by newer ones"""
+
+    @staticmethod
+    def cache_key(name: str):
+        return f'webhooks:target:{name}'
+
+    @classmethod
+    def lookup(cls, name: str):
+        """
+        The URL of the target named `name`, if any, from the Django cache or else the database. The cache is shared
+        by all processes (see `CACHES`), so retargeting with `retarget` is seen everywhere right away, while other
+        changes (e.g. made in SQL without bumping `version`) are seen within `CACHE_TIMEOUT`.
+        """
+        try:
+            cached: tuple[int, str] | None = cache.get(cls.cache_key(name))
+        except RedisError as e:
+            warning(f'Could not read webhook target {name} from the cache: {e}')
+            cached = None
+        if cached:
+            return cached[1]
+        target = cls.objects.filter(name=name).first()
+        if not target:
+            return None
+        target.cache()
+        return target.url
+
+    @classmethod
+    def retarget(cls, name: str, url: str):
+        """
+        Points the target named `name` at `url` (creating it if needed), and bumps its version.
+        """
+        with transaction.atomic():
+            if not cls.objects.filter(name=name).update(url=url, version=F('version') + 1):
+                cls.objects.create(name=name, url=url)
+        target = cls.objects.get(name=name)
+        target.cache()
+        return target
+
+    def cache(self):
+        """
+        Caches the URL, unless a newer version of it is already cached.
+        """
+        key, value = self.cache_key(self.name), (self.version, self.url)
+        try:
+            if cache.add(key, value, self.CACHE_TIMEOUT):
+                return
+            cached: tuple[int, str] | None = cache.get(key)
+            if not cached or cached[0] < self.version:
+                cache.set(key, value, self.CACHE_TIMEOUT)
+        except RedisError as e:
+            warning(f'Could not cache webhook target {self.name}: {e}')
+
+    def __str__(self):
+        return f'{self.name}: {self.url} (v{self.version})'
@@ -0,0 +1,73 @@
+from io import StringIO
+from unittest import mock, skipUnless
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from supa.webhooks import target_url
+from utils.errors import BadRequestError
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from .models import WebhookTarget
+
+
+LOCAL_CACHES = { 'default': { 'BACKEND': 'django.core.cache.backends.locmem.LocMemCache' } }
+"""Stands in for the shared Redis cache in tests"""
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class WebhookTargetTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_lookup_is_cached(self):
+        WebhookTarget.objects.create(name='test', url='http://one/')
+        with self.assertNumQueries(1):
+            self.assertEqual(target_url('test'), 'http://one/')
+            self.assertEqual(target_url('test'), 'http://one/')
+        with self.assertRaisesMessage(BadRequestError, 'No webhook target named missing'):
+            target_url('missing')
+
+    def test_retarget(self):
+        WebhookTarget.objects.create(name='test', url='http://one/')
+        self.assertEqual(target_url('test'), 'http://one/')
+        target = WebhookTarget.retarget('test', 'http://two/')
+        self.assertEqual((target.url, target.version), ('http://two/', 2))
+        with self.assertNumQueries(0):
+            self.assertEqual(target_url('test'), 'http://two/')
+        WebhookTarget.retarget('new', 'http://three/')
+        self.assertEqual(WebhookTarget.objects.get(name='new').version, 1)
+
+    def test_cache_keeps_newest_version(self):
+        stale = WebhookTarget.objects.create(name='test', url='http://one/')
+        WebhookTarget.retarget('test', 'http://two/')
+        stale.cache() # e.g. a lookup that read the row before the retarget
+        self.assertEqual(target_url('test'), 'http://two/')
+
+    def test_cache_failure_falls_back_to_the_database(self):
+        WebhookTarget.objects.create(name='test', url='http://one/')
+        down = mock.patch.multiple(cache, get=mock.Mock(side_effect=RedisConnectionError('down')),
+            add=mock.Mock(side_effect=RedisConnectionError('down')))
+        with down, self.assertLogs('utils.logging', 'WARNING'):
+            self.assertEqual(target_url('test'), 'http://one/')
+            self.assertEqual(WebhookTarget.retarget('test', 'http://two/').url, 'http://two/')
+
+    def test_retarget_command(self):
+        out = StringIO()
+        call_command('retarget_webhook', 'test', 'http://two/', stdout=out)
+        self.assertIn('Retargeted test: http://two/ (v1)', out.getvalue())
+
+    @skipUnless(connection.vendor == 'postgresql', 'Requires Postgres functions')
+    def test_sql_lookup(self):
+        WebhookTarget.objects.create(name='test', url='http://one/')
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT supa_webhook_url('test'), supa_webhook_url('missing'), supa_webhook_url('https://direct/')")
+            self.assertEqual(cursor.fetchone(), ('http://one/', None, 'https://direct/'))
+            WebhookTarget.retarget('test', 'http://two/')
+            cursor.execute("SELECT supa_webhook_url('test')")
+            self.assertEqual(cursor.fetchone(), ('http://two/',))